@@ -47,10 +47,17 @@ const char* ssid = "Wokwi-GUEST";
 const char* password = "";
 const char* mqtt_broker = "broker.hivemq.com";
 const int mqtt_port = 1883;
-// Tópicos MQTT
-const char* topic_telemetria = "ecowork/telemetria";
-const char* topic_status = "ecowork/status";
-const char* topic_alerta = "ecowork/alerta";
+// Tópicos MQTT: "ecowork/<device_id>/<tipo>"
+// O device_id é derivado do MAC do ESP32 (ver setup_topics), assim cada
+// unidade da frota publica nos seus próprios tópicos.
+const char* topic_prefixo = "ecowork";
+String g_deviceId = "";
+String g_topicTelemetria = "";
+String g_topicStatus = "";
+String g_topicAlerta = "";
+const char* topic_telemetria = "";
+const char* topic_status = "";
+const char* topic_alerta = "";
 
 // --- Limiares da Lógica ---
 // Distância em CM. Se maior que isso, considera "ausente".
@@ -61,10 +68,34 @@ const int LIGHT_THRESHOLD_HIGH_LIGHT = 1500;
 const float TEMP_HIGH_THRESHOLD = 26.0;
 const float TEMP_LOW_THRESHOLD = 20.0;
 
+// --- Formato da Telemetria ---
+// 0 = JSON (padrão). 1 = binário compacto de 10 bytes, mais leve na rede e
+// no servidor (ver formato_telemetria.py; o servidor aceita os dois).
+#define TELEMETRIA_BINARIA 0
+#define TELEMETRIA_MARCADOR 0xEC
+#define TELEMETRIA_VERSAO 1
+// Leituras por mensagem. 1 = uma mensagem por leitura (padrão). Acima de 1,
+// junta K leituras num lote binário (versão 2, 3 + 10*K bytes, ver
+// formato_telemetria.py): K vezes menos mensagens de telemetria. O lote
+// sai antes de encher quando a presença muda. K x READ_INTERVAL_MS tem que
+// caber com folga no tempo que o servidor espera antes de considerar o
+// dispositivo calado (ENERGIA_TEMPO_MAX_SEM_DADOS_S = 300 s): com 3 s por
+// leitura, no máximo 80 leituras (240 s).
+#define TELEMETRIA_LOTE 1
+#define TELEMETRIA_VERSAO_LOTE 2
+#if TELEMETRIA_LOTE > 255
+#error "TELEMETRIA_LOTE vai em um byte do lote (máximo 255)"
+#endif
+
 // --- Intervalo de Leitura (em milissegundos) ---
 const long READ_INTERVAL_MS = 3000; // Lê sensores a cada 3 segundos
 unsigned long g_lastReadTime = 0;
 
+// Espera máxima entre lotes: 80% do ENERGIA_TEMPO_MAX_SEM_DADOS_S do servidor
+const long LOTE_ESPERA_MAX_MS = 240000;
+static_assert(TELEMETRIA_LOTE * READ_INTERVAL_MS <= LOTE_ESPERA_MAX_MS,
+              "TELEMETRIA_LOTE grande demais: o servidor daria o dispositivo como calado entre dois lotes");
+
 // --- Inicialização dos Objetos ---
 WiFiClient espClient;
 PubSubClient mqttClient(espClient);
@@ -76,10 +107,35 @@ LiquidCrystal_I2C lcd(0x27, 16, 2);
 String g_lcdLine1 = "";
 String g_lcdLine2 = "";
 
+// --- Último status/alertas publicados ---
+// Só publica quando muda (retained: quem assina depois recebe o atual).
+// Luz e clima são alertas separados: cada um compara com o seu último valor.
+String g_ultimoStatus = "";
+String g_ultimoAlertaLuz = "";
+String g_ultimoAlertaClima = "";
+
+#if TELEMETRIA_LOTE > 1
+// --- Lote de Leituras (ainda não publicadas) ---
+struct LeituraLote {
+  unsigned long ms; // millis() da leitura (vira a idade no envio)
+  int16_t temp;     // x10
+  uint16_t umid;    // x10
+  uint16_t luz;
+  uint16_t dist;
+};
+LeituraLote g_lote[TELEMETRIA_LOTE];
+int g_loteTamanho = 0;
+#endif
+
 // --- Protótipos das Funções ---
 void setup_wifi();
+void setup_topics();
 void reconnect_mqtt();
 void publishMQTT(const char* topic, const char* payload);
+void publishTelemetriaBinaria(float temp, float umid, int light, long dist);
+void publishSeMudou(const char* topic, const String& payload, String& ultimo);
+void adicionarAoLote(float temp, float umid, int light, long dist);
+void publishLote();
 long getDistanceCM();
 void updateLCD(String line1, String line2);
 
@@ -108,7 +164,12 @@ void setup() {
 
   // Conecta à Rede
   setup_wifi();
+  setup_topics();
   mqttClient.setServer(mqtt_broker, mqtt_port);
+#if TELEMETRIA_LOTE > 1
+  // O buffer padrão do PubSubClient (256 bytes) não cabe um lote grande
+  mqttClient.setBufferSize(64 + g_topicTelemetria.length() + 3 + 10 * TELEMETRIA_LOTE);
+#endif
 
   delay(2000);
 }
@@ -155,12 +216,25 @@ void readSensorsAndAct() {
   String line2 = "";
   bool presente = false;
 
+#if TELEMETRIA_LOTE > 1
+  // Presença mudou: as leituras pendentes são do status anterior. O lote sai
+  // antes do status novo, senão o servidor aplicaria o status novo a elas
+  // (lâmpada e energia erradas)
+  static bool s_presenteAnterior = false;
+  bool mudouPresenca = (dist <= PRESENCE_THRESHOLD_CM) != s_presenteAnterior;
+  if (mudouPresenca && g_loteTamanho > 0) {
+    publishLote();
+  }
+#endif
+
+#if !TELEMETRIA_BINARIA && TELEMETRIA_LOTE <= 1
   // Criar payload JSON para MQTT
   String jsonPayload = "{";
   jsonPayload += "\"temperatura\":" + String(temp, 1) + ",";
   jsonPayload += "\"umidade\":" + String(umid, 1) + ",";
   jsonPayload += "\"luminosidade\":" + String(light) + ",";
   jsonPayload += "\"distancia\":" + String(dist);
+#endif
   
 
   // 2. LÓGICA DE PRESENÇA (Prioridade Máxima)
@@ -175,21 +249,25 @@ void readSensorsAndAct() {
     digitalWrite(LED_RED_PIN, LOW);
     digitalWrite(LED_GREEN_PIN, LOW);
 
-    publishMQTT(topic_status, "Ausente");
+    publishSeMudou(topic_status, "Ausente", g_ultimoStatus);
+    // Na volta, os alertas de luz e clima são publicados de novo
+    g_ultimoAlertaLuz = "";
+    g_ultimoAlertaClima = "";
     
   } else {
     // 3. LÓGICAS DE AMBIENTE (Se houver presença)
     presente = true;
-    publishMQTT(topic_status, "Presente");
+    publishSeMudou(topic_status, "Presente", g_ultimoStatus);
 
     // Lógica de Luz: "luz alta, lmpada desligada"
     if (light < LIGHT_THRESHOLD_HIGH_LIGHT) { // Lembre-se: Menor valor = Mais Luz
       digitalWrite(LED_WHITE_PIN, LOW);
       line1 = "Luz alta, Lmp OFF"; // Exatamente como pedido
-      publishMQTT(topic_alerta, "Luz artificial desligada (ambiente claro)");
+      publishSeMudou(topic_alerta, "Luz artificial desligada (ambiente claro)", g_ultimoAlertaLuz);
     } else {
       digitalWrite(LED_WHITE_PIN, HIGH);
       line1 = "Luz baixa, Lmp ON";
+      g_ultimoAlertaLuz = ""; // ficou escuro: o próximo "claro" é novidade
     }
 
     // Lógica de Clima:
@@ -198,19 +276,19 @@ void readSensorsAndAct() {
       digitalWrite(LED_RED_PIN, LOW);   // Desliga AC
       digitalWrite(LED_GREEN_PIN, LOW); // Desliga Vent.
       line2 = "Frio. AC Desligado"; // Exatamente como pedido
-      publishMQTT(topic_alerta, "Clima Frio. AC Desligado.");
+      publishSeMudou(topic_alerta, "Clima Frio. AC Desligado.", g_ultimoAlertaClima);
     
     } else if (temp > TEMP_HIGH_THRESHOLD) {
       digitalWrite(LED_RED_PIN, HIGH);  // Liga AC
       digitalWrite(LED_GREEN_PIN, LOW);
       line2 = "Calor. AC Ligado";
-      publishMQTT(topic_alerta, "Clima Quente. AC Ligado.");
+      publishSeMudou(topic_alerta, "Clima Quente. AC Ligado.", g_ultimoAlertaClima);
       
     } else { // Temperatura confortável
       digitalWrite(LED_RED_PIN, LOW);   // Desliga AC
       digitalWrite(LED_GREEN_PIN, HIGH); // Liga Modo Eco (Ventilador)
       line2 = "Temp OK. Modo Eco";
-      publishMQTT(topic_alerta, "Clima Confortavel. Modo Eco.");
+      publishSeMudou(topic_alerta, "Clima Confortavel. Modo Eco.", g_ultimoAlertaClima);
     }
   }
 
@@ -218,8 +296,20 @@ void readSensorsAndAct() {
   updateLCD(line1, line2);
 
   // 5. Publicar telemetria completa
+#if TELEMETRIA_LOTE > 1
+  adicionarAoLote(temp, umid, light, dist);
+  // Lote cheio, ou presença mudou: a leitura nova (já com o status novo)
+  // sai sozinha, e o servidor recalcula a lâmpada na hora
+  if (g_loteTamanho >= TELEMETRIA_LOTE || mudouPresenca) {
+    publishLote();
+  }
+  s_presenteAnterior = presente;
+#elif TELEMETRIA_BINARIA
+  publishTelemetriaBinaria(temp, umid, light, dist);
+#else
   jsonPayload += "}";
   publishMQTT(topic_telemetria, jsonPayload.c_str());
+#endif
 
   // Debug no Serial Monitor
   Serial.print("Dist: " + String(dist) + "cm | ");
@@ -246,12 +336,35 @@ void setup_wifi() {
   Serial.println("Conectado!");
 }
 
+// --- Tópicos por Dispositivo ---
+void setup_topics() {
+  // MAC sem ":" (ex: "24A160123ABC") identifica a unidade na frota
+  g_deviceId = WiFi.macAddress();
+  g_deviceId.replace(":", "");
+
+  String base = String(topic_prefixo) + "/" + g_deviceId + "/";
+  g_topicTelemetria = base + "telemetria";
+  g_topicStatus = base + "status";
+  g_topicAlerta = base + "alerta";
+  topic_telemetria = g_topicTelemetria.c_str();
+  topic_status = g_topicStatus.c_str();
+  topic_alerta = g_topicAlerta.c_str();
+
+  Serial.println("Device ID: " + g_deviceId);
+}
+
 // --- Reconexão MQTT ---
 void reconnect_mqtt() {
+  // Client ID também precisa ser único: o broker derruba IDs repetidos
+  String clientId = "EcoWorkHub-" + g_deviceId;
   while (!mqttClient.connected()) {
     Serial.print("Conectando ao MQTT...");
-    if (mqttClient.connect("EcoWorkHubClient-Gabriel")) {
+    if (mqttClient.connect(clientId.c_str())) {
       Serial.println("Conectado!");
+      // Conexão nova: republica status e alertas atuais na próxima leitura
+      g_ultimoStatus = "";
+      g_ultimoAlertaLuz = "";
+      g_ultimoAlertaClima = "";
     } else {
       Serial.print("Falha, rc=");
       Serial.print(mqttClient.state());
@@ -268,6 +381,80 @@ void publishMQTT(const char* topic, const char* payload) {
   }
 }
 
+// --- Publicar só se mudou ---
+// Status e alertas se repetem a cada leitura; só a mudança vai para a rede.
+// "ultimo" só é atualizado se a publicação saiu (senão tenta de novo).
+void publishSeMudou(const char* topic, const String& payload, String& ultimo) {
+  if (payload == ultimo || !mqttClient.connected()) {
+    return;
+  }
+  if (mqttClient.publish(topic, payload.c_str(), true)) { // retained
+    ultimo = payload;
+  }
+}
+
+#if TELEMETRIA_LOTE > 1
+// --- Guardar leitura no lote (mesmas escalas do binário v1) ---
+void adicionarAoLote(float temp, float umid, int light, long dist) {
+  if (g_loteTamanho >= TELEMETRIA_LOTE) {
+    // Lote cheio sem conseguir publicar (broker fora): descarta a mais antiga
+    memmove(g_lote, g_lote + 1, sizeof(LeituraLote) * (TELEMETRIA_LOTE - 1));
+    g_loteTamanho--;
+  }
+  LeituraLote& l = g_lote[g_loteTamanho++];
+  l.ms = millis();
+  l.temp = (int16_t) lroundf(temp * 10);
+  l.umid = (uint16_t) lroundf(umid * 10);
+  l.luz = (uint16_t) constrain(light, 0, 65534);
+  l.dist = (uint16_t) constrain(dist, 0, 65534);
+}
+
+// --- Publicar lote (versão 2, little-endian) ---
+// [0xEC][2][K] + K x [idade ds: uint16][temp x10: int16][umid x10: uint16][luz: uint16][dist: uint16]
+void publishLote() {
+  if (g_loteTamanho == 0 || !mqttClient.connected()) {
+    return; // sem conexão, o lote espera a próxima tentativa
+  }
+  uint8_t buf[3 + 10 * TELEMETRIA_LOTE];
+  size_t n = 0;
+  buf[n++] = TELEMETRIA_MARCADOR;
+  buf[n++] = TELEMETRIA_VERSAO_LOTE;
+  buf[n++] = (uint8_t) g_loteTamanho;
+  unsigned long agora = millis();
+  for (int i = 0; i < g_loteTamanho; i++) {
+    const LeituraLote& l = g_lote[i];
+    uint16_t idade = (uint16_t) min((agora - l.ms) / 100UL, 65535UL);
+    uint16_t campos[5] = {idade, (uint16_t) l.temp, l.umid, l.luz, l.dist};
+    for (int c = 0; c < 5; c++) {
+      buf[n++] = (uint8_t)(campos[c] & 0xFF);
+      buf[n++] = (uint8_t)(campos[c] >> 8);
+    }
+  }
+  if (mqttClient.publish(topic_telemetria, buf, n)) {
+    g_loteTamanho = 0;
+  }
+}
+#endif
+
+// --- Publicar telemetria binária (10 bytes, little-endian) ---
+// [0xEC][versão][temp x10: int16][umid x10: uint16][luz: uint16][dist cm: uint16]
+void publishTelemetriaBinaria(float temp, float umid, int light, long dist) {
+  int16_t t = (int16_t) lroundf(temp * 10);
+  uint16_t u = (uint16_t) lroundf(umid * 10);
+  uint16_t l = (uint16_t) constrain(light, 0, 65534);
+  uint16_t d = (uint16_t) constrain(dist, 0, 65534);
+  uint8_t buf[10] = {
+    TELEMETRIA_MARCADOR, TELEMETRIA_VERSAO,
+    (uint8_t)(t & 0xFF), (uint8_t)((uint16_t)t >> 8),
+    (uint8_t)(u & 0xFF), (uint8_t)(u >> 8),
+    (uint8_t)(l & 0xFF), (uint8_t)(l >> 8),
+    (uint8_t)(d & 0xFF), (uint8_t)(d >> 8),
+  };
+  if (mqttClient.connected()) {
+    mqttClient.publish(topic_telemetria, buf, sizeof(buf));
+  }
+}
+
 // --- Leitura Sensor Ultrassônico ---
 long getDistanceCM() {
   // Gera o pulso de Trigger
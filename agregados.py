@@ -0,0 +1,248 @@
+# =================================================================
+# ==== AGREGADOS DA FROTA ECOWORK ====
+# =================================================================
+# Visão de gestor da frota inteira, mantida a cada mensagem em vez de
+# percorrer todos os dispositivos a cada consulta:
+#
+# - médias de temperatura/umidade: soma e contagem correntes; quando um
+#   dispositivo manda um valor novo, o antigo sai da soma (O(1))
+# - percentis: histograma de baldes fixos (ex: 0,1 °C), onde o valor
+#   antigo sai de um balde e o novo entra em outro (O(1)); o percentil é
+#   lido percorrendo os baldes só na hora de publicar
+# - % de escritórios ocupados e lâmpadas acesas em ambiente claro:
+#   contadores que sobem/descem quando o estado do dispositivo muda
+# - top-k de consumo de energia: heap com remoção preguiçosa (O(log n)
+#   por atualização; entradas velhas são descartadas na leitura). O
+#   ranking é do dia: recomeça quando chega o primeiro evento de um dia
+#   novo, e eventos atrasados de um dia anterior são ignorados
+# - dispositivos calados por mais de tempo_max_sem_dados_s (o mesmo da
+#   energia) saem das médias, percentis e contadores em expirar()
+#
+# O resumo é montado a cada poucos segundos e enviado para a sala "frota".
+
+import heapq
+import math
+import threading
+import time
+
+
+class HistogramaFixo:
+    # Contagens por balde de largura fixa em [minimo, maximo]; valores de
+    # fora caem no primeiro/último balde. Erro do percentil <= largura.
+    __slots__ = ("minimo", "largura", "contagens", "total")
+
+    def __init__(self, minimo, maximo, largura):
+        self.minimo = minimo
+        self.largura = largura
+        self.contagens = [0] * (int(math.ceil((maximo - minimo) / largura)) + 1)
+        self.total = 0
+
+    def _balde(self, valor):
+        i = int((valor - self.minimo) / self.largura)
+        return 0 if i < 0 else min(i, len(self.contagens) - 1)
+
+    def adicionar(self, valor):
+        self.contagens[self._balde(valor)] += 1
+        self.total += 1
+
+    def remover(self, valor):
+        self.contagens[self._balde(valor)] -= 1
+        self.total -= 1
+
+    def percentil(self, p):
+        if not self.total:
+            return None
+        alvo = p / 100 * self.total
+        acumulado = 0
+        for i, n in enumerate(self.contagens):
+            acumulado += n
+            if acumulado >= alvo and n:
+                # Centro do balde
+                return round(self.minimo + (i + 0.5) * self.largura, 2)
+        return None
+
+
+class TopK:
+    # Maiores valores por chave, com atualizações O(log n). Cada atualização
+    # empurra uma entrada nova; as antigas da mesma chave ficam no heap até
+    # aparecerem no topo e são descartadas (versão diferente da atual).
+    def __init__(self):
+        self._heap = []      # (-valor, chave, versão)
+        self._atual = {}     # chave -> (valor, versão)
+        self._versao = 0
+
+    def atualizar(self, chave, valor):
+        self._versao += 1
+        self._atual[chave] = (valor, self._versao)
+        heapq.heappush(self._heap, (-valor, chave, self._versao))
+        # Limpeza amortizada: o heap não cresce mais que 2x o número de chaves
+        if len(self._heap) > 2 * len(self._atual) + 64:
+            self._heap = [(-v, c, ver) for c, (v, ver) in self._atual.items()]
+            heapq.heapify(self._heap)
+
+    def remover(self, chave):
+        self._atual.pop(chave, None)
+
+    def maiores(self, k):
+        resultado = []
+        validos = []
+        while self._heap and len(resultado) < k:
+            item = heapq.heappop(self._heap)
+            neg_valor, chave, versao = item
+            atual = self._atual.get(chave)
+            if atual is None or atual[1] != versao:
+                continue  # entrada velha: some de vez
+            resultado.append((chave, -neg_valor))
+            validos.append(item)
+        for item in validos:
+            heapq.heappush(self._heap, item)
+        return resultado
+
+
+class _EstadoAgregado:
+    __slots__ = ("temperatura", "umidade", "presente", "desperdicio", "visto_em")
+
+    def __init__(self, ts):
+        self.temperatura = None
+        self.umidade = None
+        self.presente = None
+        self.desperdicio = False
+        self.visto_em = ts
+
+
+class AgregadosFrota:
+    def __init__(self, limiar_claro, top_k=10, tempo_max_sem_dados_s=300.0):
+        # limiar_claro: luminosidade (ADC, menor = mais luz) abaixo da qual o
+        # ambiente conta como claro para "lâmpada acesa com luz natural"
+        # tempo_max_sem_dados_s: sem mensagens por mais que isso, o
+        # dispositivo sai dos agregados (volta na próxima mensagem)
+        self.limiar_claro = limiar_claro
+        self.top_k = top_k
+        self.tempo_max_sem_dados_s = tempo_max_sem_dados_s
+        self._estados = {}
+        self._lock = threading.Lock()
+        self._soma = {"temperatura": 0.0, "umidade": 0.0}
+        self._n = {"temperatura": 0, "umidade": 0}
+        self._histogramas = {
+            "temperatura": HistogramaFixo(-20.0, 60.0, 0.1),
+            "umidade": HistogramaFixo(0.0, 100.0, 0.5),
+        }
+        self._com_status = 0
+        self._presentes = 0
+        self._desperdicios = 0
+        self._energia = TopK()
+        self._dia_energia = None
+        self.atualizacoes = 0
+
+    def _estado(self, device_id, ts):
+        estado = self._estados.get(device_id)
+        if estado is None:
+            estado = self._estados[device_id] = _EstadoAgregado(ts)
+        elif ts > estado.visto_em:
+            estado.visto_em = ts
+        return estado
+
+    def _trocar(self, estado, metrica, novo):
+        antigo = getattr(estado, metrica)
+        if antigo is not None:
+            self._soma[metrica] -= antigo
+            self._n[metrica] -= 1
+            self._histogramas[metrica].remover(antigo)
+        if novo is not None:
+            self._soma[metrica] += novo
+            self._n[metrica] += 1
+            self._histogramas[metrica].adicionar(novo)
+        setattr(estado, metrica, novo)
+
+    @staticmethod
+    def _numero(valor):
+        if isinstance(valor, bool) or not isinstance(valor, (int, float)) or math.isnan(valor):
+            return None
+        return float(valor)
+
+    # ---- Atualizações (workers da ingestão) ----
+    def registrar_telemetria(self, device_id, dados, ts=None):
+        ts = time.time() if ts is None else ts
+        temperatura = self._numero(dados.get("temperatura"))
+        umidade = self._numero(dados.get("umidade"))
+        luminosidade = self._numero(dados.get("luminosidade"))
+        desperdicio = (dados.get("lamp_status") == "Ligada"
+                       and luminosidade is not None and luminosidade < self.limiar_claro)
+        with self._lock:
+            estado = self._estado(device_id, ts)
+            self._trocar(estado, "temperatura", temperatura)
+            self._trocar(estado, "umidade", umidade)
+            if desperdicio != estado.desperdicio:
+                self._desperdicios += 1 if desperdicio else -1
+                estado.desperdicio = desperdicio
+            self.atualizacoes += 1
+
+    def registrar_status(self, device_id, status, ts=None):
+        ts = time.time() if ts is None else ts
+        presente = status == "Presente"
+        with self._lock:
+            estado = self._estado(device_id, ts)
+            if estado.presente is None:
+                self._com_status += 1
+            elif estado.presente:
+                self._presentes -= 1
+            if presente:
+                self._presentes += 1
+            estado.presente = presente
+            if not presente and estado.desperdicio:
+                # Ausente: o servidor desliga a lâmpada
+                self._desperdicios -= 1
+                estado.desperdicio = False
+            self.atualizacoes += 1
+
+    def registrar_energia(self, device_id, dia, kwh):
+        # kWh do dispositivo no dia "dia" (ver ContabilidadeEnergia.atualizar)
+        with self._lock:
+            if self._dia_energia is None or dia > self._dia_energia:
+                # Virou o dia: o ranking recomeça
+                self._energia = TopK()
+                self._dia_energia = dia
+            elif dia < self._dia_energia:
+                # Evento atrasado de um dia que já fechou: não mexe no ranking de hoje
+                return
+            self._energia.atualizar(device_id, kwh)
+
+    def expirar(self, agora=None):
+        # Tira dos agregados os dispositivos calados (mesma regra da energia).
+        # O ranking de energia do dia fica: o consumo até calar continua valendo
+        agora = time.time() if agora is None else agora
+        limite = agora - self.tempo_max_sem_dados_s
+        with self._lock:
+            calados = [d for d, estado in self._estados.items() if estado.visto_em < limite]
+            for device_id in calados:
+                estado = self._estados.pop(device_id)
+                self._trocar(estado, "temperatura", None)
+                self._trocar(estado, "umidade", None)
+                if estado.presente is not None:
+                    self._com_status -= 1
+                    if estado.presente:
+                        self._presentes -= 1
+                if estado.desperdicio:
+                    self._desperdicios -= 1
+        return len(calados)
+
+    # ---- Resumo (publicado na sala "frota") ----
+    def resumo(self):
+        with self._lock:
+            medias = {m: (self._soma[m] / self._n[m] if self._n[m] else None) for m in self._soma}
+            percentis = {m: {f"p{p}": h.percentil(p) for p in (10, 50, 90)}
+                         for m, h in self._histogramas.items()}
+            top = self._energia.maiores(self.top_k)
+            resumo = {
+                "dispositivos": len(self._estados),
+                "media": {m: None if v is None else round(v, 2) for m, v in medias.items()},
+                "amostras": dict(self._n),
+                "percentis": percentis,
+                "ocupacao_pct": round(100 * self._presentes / self._com_status, 1) if self._com_status else None,
+                "presentes": self._presentes,
+                "com_status": self._com_status,
+                "lampadas_acesas_com_luz": self._desperdicios,
+                "top_energia": [{"dispositivo": d, "kwh": round(v, 4)} for d, v in top],
+                "dia_energia": self._dia_energia,
+            }
+        return resumo
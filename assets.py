@@ -0,0 +1,166 @@
+# =================================================================
+# ==== ASSETS DO DASHBOARD ECOWORK ====
+# =================================================================
+# Serve a página e as bibliotecas (Bootstrap, jQuery, Socket.IO, Chart.js,
+# date-fns e a fonte Inter) direto do servidor, sem depender de CDN.
+#
+# - Tudo é montado UMA vez na inicialização: os JS viram um pacote só, os
+#   CSS (com as fontes) outro, e cada arquivo ganha um nome com o hash do
+#   conteúdo (ex: /assets/vendor.3fa2c1d9e0.js).
+# - Cada recurso já fica comprimido em memória (gzip e, se o módulo
+#   "brotli" estiver instalado, br). A resposta escolhe pelo Accept-Encoding.
+# - Os assets com hash no nome são "immutable" (cache de 1 ano); a página
+#   usa ETag + "no-cache", então recargas viram 304.
+#
+# Os arquivos NÃO vêm no repositório: ficam em static/ e são baixados com
+# python baixar_assets.py (uma vez, com internet). Se algum estiver
+# faltando, aquele arquivo é carregado da CDN original, e o dashboard só
+# abre com internet (o dashboard avisa no log de inicialização).
+
+import gzip
+import hashlib
+import os
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional; sem ele só gzip
+    brotli = None
+
+TIPO_JS = "application/javascript; charset=utf-8"
+TIPO_CSS = "text/css; charset=utf-8"
+TIPO_HTML = "text/html; charset=utf-8"
+TIPO_WOFF2 = "font/woff2"
+
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+CACHE_REVALIDAR = "no-cache"
+
+PREFIXO_URL = "/assets/"
+
+# (arquivo em static/, URL de origem) na ordem em que precisam carregar
+VENDOR_CSS = [
+    ("vendor/bootstrap-4.5.2.min.css",
+     "https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/css/bootstrap.min.css"),
+]
+VENDOR_JS = [
+    ("vendor/jquery-3.5.1.min.js",
+     "https://code.jquery.com/jquery-3.5.1.min.js"),
+    ("vendor/socket.io-4.7.2.min.js",
+     "https://cdn.socket.io/4.7.2/socket.io.min.js"),
+    ("vendor/chart-3.7.0.min.js",
+     "https://cdn.jsdelivr.net/npm/chart.js@3.7.0/dist/chart.min.js"),
+    ("vendor/chartjs-adapter-date-fns-2.0.0.bundle.min.js",
+     "https://cdn.jsdelivr.net/npm/chartjs-adapter-date-fns@2.0.0/dist/chartjs-adapter-date-fns.bundle.min.js"),
+]
+# (arquivo, URL, peso) da fonte Inter
+FONTES = [
+    (f"fonts/inter-latin-{peso}-normal.woff2",
+     f"https://cdn.jsdelivr.net/npm/@fontsource/inter@5.0.16/files/inter-latin-{peso}-normal.woff2", peso)
+    for peso in (400, 600, 700)
+]
+FONTES_CDN_CSS = "https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&display=swap"
+
+
+class Recurso:
+    # Conteúdo pronto para servir: bytes, ETag e variantes comprimidas
+    __slots__ = ("conteudo", "tipo", "etag", "gzip", "brotli")
+
+    def __init__(self, conteudo, tipo, comprimir=True):
+        self.conteudo = conteudo
+        self.tipo = tipo
+        self.etag = hashlib.sha256(conteudo).hexdigest()[:20]
+        self.gzip = None
+        self.brotli = None
+        if comprimir:
+            comprimido = gzip.compress(conteudo, compresslevel=9, mtime=0)
+            # Só vale a pena se reduzir de verdade (woff2 já vem comprimido)
+            if len(comprimido) < len(conteudo) * 0.9:
+                self.gzip = comprimido
+            if brotli is not None:
+                comprimido = brotli.compress(conteudo, quality=11)
+                if len(comprimido) < len(conteudo) * 0.9:
+                    self.brotli = comprimido
+
+    def responder(self, cache_control):
+        aceitas = request.headers.get("Accept-Encoding", "")
+        if self.brotli is not None and "br" in aceitas:
+            corpo, codificacao = self.brotli, "br"
+        elif self.gzip is not None and "gzip" in aceitas:
+            corpo, codificacao = self.gzip, "gzip"
+        else:
+            corpo, codificacao = self.conteudo, None
+        # ETag diferente por variante (gzip e br não são o mesmo corpo)
+        etag = f"{self.etag}-{codificacao}" if codificacao else self.etag
+        cabecalhos = {"Cache-Control": cache_control, "ETag": f'"{etag}"', "Vary": "Accept-Encoding"}
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=cabecalhos)
+        if codificacao:
+            cabecalhos["Content-Encoding"] = codificacao
+        return Response(corpo, status=200, content_type=self.tipo, headers=cabecalhos)
+
+
+class PacoteAssets:
+    def __init__(self, diretorio_static):
+        self.diretorio = diretorio_static
+        self.recursos = {}      # nome com hash -> Recurso
+        self.estilos = []       # URLs para <link rel="stylesheet">
+        self.scripts = []       # URLs para <script src>
+        self.faltando = []
+        self._montar()
+
+    def _ler(self, relativo):
+        caminho = os.path.join(self.diretorio, relativo)
+        if not os.path.exists(caminho):
+            self.faltando.append(relativo)
+            return None
+        with open(caminho, "rb") as f:
+            return f.read()
+
+    def _publicar(self, nome_base, extensao, conteudo, tipo):
+        recurso = Recurso(conteudo, tipo)
+        nome = f"{nome_base}.{recurso.etag[:10]}.{extensao}"
+        self.recursos[nome] = recurso
+        return PREFIXO_URL + nome
+
+    def _montar(self):
+        # ---- Fontes (viram @font-face dentro do pacote CSS) ----
+        fontes = [(self._ler(relativo), peso) for relativo, _, peso in FONTES]
+        font_faces = None
+        if all(conteudo is not None for conteudo, _ in fontes):
+            font_faces = []
+            for conteudo, peso in fontes:
+                url = self._publicar(f"inter-{peso}", "woff2", conteudo, TIPO_WOFF2)
+                font_faces.append(
+                    "@font-face{font-family:'Inter';font-style:normal;font-display:swap;"
+                    f"font-weight:{peso};src:url({url}) format('woff2')}}")
+
+        # ---- CSS ----
+        css = [self._ler(relativo) for relativo, _ in VENDOR_CSS]
+        if all(c is not None for c in css):
+            partes = css + ([("\n".join(font_faces)).encode()] if font_faces else [])
+            self.estilos.append(self._publicar("vendor", "css", b"\n".join(partes), TIPO_CSS))
+        else:
+            for (relativo, url_cdn), conteudo in zip(VENDOR_CSS, css):
+                self.estilos.append(url_cdn if conteudo is None else self._publicar(
+                    os.path.basename(relativo)[:-4], "css", conteudo, TIPO_CSS))
+            if font_faces:
+                self.estilos.append(self._publicar("fontes", "css", "\n".join(font_faces).encode(), TIPO_CSS))
+        if font_faces is None:
+            self.estilos.append(FONTES_CDN_CSS)
+
+        # ---- JS (a ordem importa: o adapter precisa do Chart.js) ----
+        js = [self._ler(relativo) for relativo, _ in VENDOR_JS]
+        if all(j is not None for j in js):
+            # ";\n" entre arquivos evita que um sem ";" final quebre o próximo
+            self.scripts.append(self._publicar("vendor", "js", b";\n".join(js), TIPO_JS))
+        else:
+            for (relativo, url_cdn), conteudo in zip(VENDOR_JS, js):
+                self.scripts.append(url_cdn if conteudo is None else self._publicar(
+                    os.path.basename(relativo)[:-3], "js", conteudo, TIPO_JS))
+
+    def servir(self, nome):
+        recurso = self.recursos.get(nome)
+        if recurso is None:
+            return Response("Asset não encontrado", status=404)
+        return recurso.responder(CACHE_IMUTAVEL)
@@ -0,0 +1,47 @@
+# =================================================================
+# ==== DOWNLOAD DOS ASSETS DO DASHBOARD ====
+# =================================================================
+# Baixa as bibliotecas e fontes usadas pelo dashboard para static/,
+# para o servidor funcionar sem internet (ver assets.py).
+#
+#   python baixar_assets.py           # baixa só o que estiver faltando
+#   python baixar_assets.py --forcar  # baixa tudo de novo
+#
+# Em rede isolada: rode numa máquina com internet e copie a pasta static/.
+
+import os
+import sys
+import urllib.request
+
+from assets import VENDOR_CSS, VENDOR_JS, FONTES
+
+DIRETORIO_STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+
+def main():
+    forcar = "--forcar" in sys.argv
+    arquivos = VENDOR_CSS + VENDOR_JS + [(relativo, url) for relativo, url, _ in FONTES]
+    falhas = 0
+    for relativo, url in arquivos:
+        destino = os.path.join(DIRETORIO_STATIC, relativo)
+        if os.path.exists(destino) and not forcar:
+            print(f"[Assets] Já existe: {relativo}")
+            continue
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        try:
+            with urllib.request.urlopen(url, timeout=30) as resposta:
+                conteudo = resposta.read()
+        except OSError as e:
+            print(f"[Assets] Erro ao baixar {url}: {e}")
+            falhas += 1
+            continue
+        # Grava num temporário e renomeia: nunca deixa um arquivo pela metade
+        with open(destino + ".tmp", "wb") as f:
+            f.write(conteudo)
+        os.replace(destino + ".tmp", destino)
+        print(f"[Assets] Baixado: {relativo} ({len(conteudo) / 1024:.0f} KB)")
+    sys.exit(1 if falhas else 0)
+
+
+if __name__ == "__main__":
+    main()
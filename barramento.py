@@ -0,0 +1,252 @@
+# =================================================================
+# ==== BARRAMENTO LOCAL ENTRE PROCESSOS ECOWORK ====
+# =================================================================
+# Substituto local do Redis/RabbitMQ para o modo multiprocesso (ver
+# multiprocesso.py): um hub TCP que repassa cada mensagem recebida para
+# todas as outras conexões, e um gerenciador de clientes do python-socketio
+# que publica/escuta nesse hub.
+#
+# Com ele, um worker emite para a sala "dispositivo:<id>" e o evento chega
+# aos navegadores conectados em QUALQUER worker, sem instalar nada.
+# GerenciadorBarramento serve o modo threading e GerenciadorBarramentoAsync
+# o modo asyncio (servidor_async.py); os dois falam com o mesmo hub.
+# Em produção com várias máquinas, use ECOWORK_FILA_MENSAGENS=redis://...
+# (o Flask-SocketIO já sabe falar com Redis, Kafka e AMQP).
+#
+# Protocolo: cada mensagem é um JSON (o dict do PubSubManager) precedido
+# do tamanho em 4 bytes (big-endian).
+
+import asyncio
+import json
+import logging
+import queue
+import socket
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+log = logging.getLogger("ecowork.barramento")
+
+ESQUEMA = "barramento"
+_CABECALHO = struct.Struct(">I")
+# Mensagens esperando para um participante lento; depois disso, descarta
+FILA_MAX_POR_PARTICIPANTE = 10000
+ESPERA_RECONEXAO_S = 1.0
+
+
+def endereco(url):
+    # "barramento://127.0.0.1:5100" -> ("127.0.0.1", 5100)
+    partes = urlparse(url)
+    if partes.scheme != ESQUEMA or not partes.port:
+        raise ValueError(f"URL do barramento inválida: {url!r} (use {ESQUEMA}://host:porta)")
+    return partes.hostname, partes.port
+
+
+def _ler_exato(conexao, n):
+    dados = b""
+    while len(dados) < n:
+        pedaco = conexao.recv(n - len(dados))
+        if not pedaco:
+            raise ConnectionError("conexão fechada")
+        dados += pedaco
+    return dados
+
+
+def ler_quadro(conexao):
+    (tamanho,) = _CABECALHO.unpack(_ler_exato(conexao, _CABECALHO.size))
+    return _ler_exato(conexao, tamanho)
+
+
+def quadro(dados):
+    return _CABECALHO.pack(len(dados)) + dados
+
+
+class HubBarramento:
+    # Repassa os quadros de cada participante para todos os outros
+    def __init__(self, host="127.0.0.1", porta=5100):
+        self.host = host
+        self.porta = porta
+        self._participantes = {}   # conexão -> fila de saída
+        self._lock = threading.Lock()
+        self._servidor = None
+        self.repassadas = 0
+        self.descartadas = 0
+
+    def iniciar(self):
+        self._servidor = socket.create_server((self.host, self.porta))
+        threading.Thread(target=self._aceitar, name="barramento-hub", daemon=True).start()
+        log.info("Barramento ouvindo em %s:%d", self.host, self.porta)
+
+    def parar(self):
+        if self._servidor is not None:
+            self._servidor.close()
+        with self._lock:
+            participantes = list(self._participantes)
+        for conexao in participantes:
+            conexao.close()
+
+    def _aceitar(self):
+        while True:
+            try:
+                conexao, _ = self._servidor.accept()
+            except OSError:
+                return
+            conexao.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            saida = queue.Queue(FILA_MAX_POR_PARTICIPANTE)
+            with self._lock:
+                self._participantes[conexao] = saida
+            threading.Thread(target=self._ler, args=(conexao,), daemon=True).start()
+            threading.Thread(target=self._escrever, args=(conexao, saida), daemon=True).start()
+
+    def _ler(self, conexao):
+        try:
+            while True:
+                dados = quadro(ler_quadro(conexao))
+                with self._lock:
+                    destinos = [s for c, s in self._participantes.items() if c is not conexao]
+                for saida in destinos:
+                    try:
+                        saida.put_nowait(dados)
+                        self.repassadas += 1
+                    except queue.Full:
+                        # Um worker travado não pode segurar os outros
+                        self.descartadas += 1
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self._lock:
+                saida = self._participantes.pop(conexao, None)
+            if saida is not None:
+                saida.put(None)
+            conexao.close()
+
+    def _escrever(self, conexao, saida):
+        while True:
+            dados = saida.get()
+            if dados is None:
+                return
+            try:
+                conexao.sendall(dados)
+            except OSError:
+                return
+
+
+class GerenciadorBarramento(socketio.PubSubManager):
+    # client_manager do python-socketio (modo threading) ligado ao HubBarramento
+    name = "barramento"
+
+    def __init__(self, url, channel="socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.endereco = endereco(url)
+        # Uma conexão só, para publicar (várias threads) e escutar (uma thread):
+        # o hub não devolve ao remetente o que ele mesmo publicou
+        self._conexao = None
+        self._lock_conexao = threading.Lock()
+        self._lock_envio = threading.Lock()
+
+    def _conexao_atual(self):
+        with self._lock_conexao:
+            if self._conexao is None:
+                conexao = socket.create_connection(self.endereco)
+                conexao.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._conexao = conexao
+            return self._conexao
+
+    def _descartar(self, conexao):
+        with self._lock_conexao:
+            if self._conexao is conexao:
+                self._conexao = None
+        conexao.close()
+
+    def _publish(self, data):
+        dados = quadro(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        for tentativa in range(2):
+            conexao = None
+            try:
+                conexao = self._conexao_atual()
+                with self._lock_envio:
+                    conexao.sendall(dados)
+                return
+            except OSError as e:
+                if conexao is not None:
+                    self._descartar(conexao)
+                if tentativa:
+                    log.warning("Falha ao publicar no barramento: %s", e)
+
+    def _listen(self):
+        while True:
+            try:
+                conexao = self._conexao_atual()
+            except OSError as e:
+                log.warning("Barramento indisponível (%s), tentando de novo", e)
+                time.sleep(ESPERA_RECONEXAO_S)
+                continue
+            try:
+                while True:
+                    yield json.loads(ler_quadro(conexao))
+            except (ConnectionError, OSError) as e:
+                log.warning("Conexão com o barramento perdida: %s", e)
+            self._descartar(conexao)
+            time.sleep(ESPERA_RECONEXAO_S)
+
+
+class GerenciadorBarramentoAsync(AsyncPubSubManager):
+    # client_manager do python-socketio AsyncServer (modo asyncio), mesmo
+    # protocolo do GerenciadorBarramento, com streams do asyncio
+    name = "barramento-async"
+
+    def __init__(self, url, channel="socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.endereco = endereco(url)
+        self._leitor = self._escritor = None
+        self._lock_conexao = asyncio.Lock()
+        self._lock_envio = asyncio.Lock()
+
+    async def _conexao_atual(self):
+        async with self._lock_conexao:
+            if self._escritor is None:
+                self._leitor, self._escritor = await asyncio.open_connection(*self.endereco)
+                self._escritor.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return self._leitor, self._escritor
+
+    def _descartar(self, escritor):
+        if self._escritor is escritor:
+            self._leitor = self._escritor = None
+        escritor.close()
+
+    async def _publish(self, data):
+        dados = quadro(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        for tentativa in range(2):
+            escritor = None
+            try:
+                _, escritor = await self._conexao_atual()
+                async with self._lock_envio:
+                    escritor.write(dados)
+                    await escritor.drain()
+                return
+            except OSError as e:
+                if escritor is not None:
+                    self._descartar(escritor)
+                if tentativa:
+                    log.warning("Falha ao publicar no barramento: %s", e)
+
+    async def _listen(self):
+        while True:
+            try:
+                leitor, escritor = await self._conexao_atual()
+            except OSError as e:
+                log.warning("Barramento indisponível (%s), tentando de novo", e)
+                await asyncio.sleep(ESPERA_RECONEXAO_S)
+                continue
+            try:
+                while True:
+                    (tamanho,) = _CABECALHO.unpack(await leitor.readexactly(_CABECALHO.size))
+                    yield json.loads(await leitor.readexactly(tamanho))
+            except (asyncio.IncompleteReadError, OSError) as e:
+                log.warning("Conexão com o barramento perdida: %s", e)
+            self._descartar(escritor)
+            await asyncio.sleep(ESPERA_RECONEXAO_S)
@@ -0,0 +1,85 @@
+# =================================================================
+# ==== BENCHMARK: EXPORTAÇÃO EM MASSA ====
+# =================================================================
+# Mede a exportação em streaming (ver exportacao.py) de leituras brutas:
+#   - linhas/s e tamanho da saída de cada formato (csv; arrow e parquet com pyarrow)
+#   - pico de memória alocada pelo Python durante a exportação (tracemalloc),
+#     que deve ficar igual para exportações de tamanhos diferentes
+#
+#   python benchmarks/bench_exportacao.py --dispositivos 2000 --ciclos 500
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exportacao import MedidorExportacao, TAMANHO_BLOCO, formatos_disponiveis
+from persistencia import ArmazemTelemetria, TIER_BRUTO, colunas_exportacao
+
+INTERVALO_LEITURA_S = 3.0
+
+
+def popular(armazem, dispositivos, ciclos, inicio):
+    for ciclo in range(ciclos):
+        ts = inicio + ciclo * INTERVALO_LEITURA_S
+        for i in range(dispositivos):
+            armazem.registrar(f"esp32-{i:05d}", ts, {
+                "temperatura": 20 + (i + ciclo) % 100 / 10, "umidade": 40 + i % 30,
+                "luminosidade": (i * 37 + ciclo) % 4096, "distancia": 30 + ciclo % 200})
+        if ciclo % 20 == 0:
+            armazem.flush()
+    armazem.flush()
+
+
+def medir(armazem, formato, dispositivos, rastrear_memoria=False):
+    # Consome a exportação como o servidor faria (pedaço a pedaço, descartando).
+    # O tracemalloc deixa tudo bem mais lento: a taxa é medida numa passada sem ele
+    medidor = MedidorExportacao()
+    blocos = armazem.exportar(dispositivos, 0, float("inf"), TIER_BRUTO, TAMANHO_BLOCO[formato])
+    if rastrear_memoria:
+        tracemalloc.start()
+    for _ in medidor.exportar(blocos, colunas_exportacao(TIER_BRUTO), formato, {}):
+        pass
+    pico = 0
+    if rastrear_memoria:
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return medidor.resumo()["recentes"][-1], pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da exportação em massa do EcoWork")
+    parser.add_argument("--dispositivos", type=int, default=2000)
+    parser.add_argument("--ciclos", type=int, default=500, help="leituras por dispositivo")
+    parser.add_argument("--arquivo", default=None, help="banco a usar (padrão: arquivo temporário)")
+    args = parser.parse_args()
+
+    caminho = args.arquivo or os.path.join(tempfile.mkdtemp(prefix="ecowork-bench-"), "bench.db")
+    armazem = ArmazemTelemetria(caminho, intervalo_consolidacao_s=3600)
+    armazem.iniciar()
+    # Leituras terminando agora: dentro da retenção do tier bruto
+    inicio = time.time() - args.ciclos * INTERVALO_LEITURA_S
+    t = time.perf_counter()
+    popular(armazem, args.dispositivos, args.ciclos, inicio)
+    total = args.dispositivos * args.ciclos
+    print(f"Banco: {total:,} leituras ({args.dispositivos} dispositivos x {args.ciclos}) "
+          f"gravadas em {time.perf_counter() - t:.1f} s")
+
+    # Um décimo da frota e a frota inteira: o pico de memória não deve acompanhar o tamanho
+    decimo = [f"esp32-{i:05d}" for i in range(0, args.dispositivos, 10)]
+    for formato in formatos_disponiveis():
+        for nome, dispositivos in (("10% da frota", decimo), ("frota inteira", None)):
+            r, _ = medir(armazem, formato, dispositivos)
+            _, pico = medir(armazem, formato, dispositivos, rastrear_memoria=True)
+            print(f"{formato:>8} | {nome:<13} | {r['linhas']:>10,} linhas | "
+                  f"{r['linhas_por_s']:>9,} linhas/s | {r['bytes'] / 1e6:>7.1f} MB | "
+                  f"pico {pico / 1e6:.1f} MB")
+    armazem.parar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# =================================================================
+# ==== BENCHMARK: FORMATO DA TELEMETRIA (JSON x binário) ====
+# =================================================================
+# Compara os dois formatos aceitos pelo servidor (ver formato_telemetria.py)
+# com leituras geradas pelo simulador de frota:
+#   - bytes por leitura (só o payload, sem o cabeçalho MQTT)
+#   - leituras decodificadas por segundo
+# O lote binário (TELEMETRIA_LOTE) é medido com as mesmas leituras, K por mensagem.
+# Também mede o caminho antigo (decode UTF-8 + strip + json.loads de str)
+# como referência.
+#
+#   python benchmarks/bench_formato.py --leituras 200000
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formato_telemetria import decodificar_telemetria, decodificar_leituras, codificar_lote
+from simulador import SimuladorFrota
+
+
+def gerar_payloads(leituras, binario):
+    frota = SimuladorFrota(1000, binario=binario)
+    payloads = []
+    while len(payloads) < leituras:
+        for dispositivo in frota.dispositivos:
+            # Só a telemetria (última mensagem de cada ciclo)
+            payloads.append(frota.leitura(dispositivo)[-1][1])
+            if len(payloads) == leituras:
+                break
+    return payloads
+
+
+def caminho_antigo(payload):
+    return json.loads(payload.decode("utf-8", errors="replace").strip())
+
+
+def medir(funcao, payloads, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for p in payloads:
+            funcao(p)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return len(payloads) / melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do formato de telemetria do EcoWork")
+    parser.add_argument("--leituras", type=int, default=100000)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--lote", type=int, default=10, help="leituras por mensagem no lote binário")
+    args = parser.parse_args()
+
+    json_payloads = gerar_payloads(args.leituras, binario=False)
+    bin_payloads = gerar_payloads(args.leituras, binario=True)
+
+    # Os dois formatos precisam chegar nos mesmos valores
+    for a, b in zip(json_payloads[:1000], bin_payloads[:1000]):
+        ja, jb = decodificar_telemetria(a), decodificar_telemetria(b)
+        assert all(abs(ja[k] - jb[k]) < 0.051 for k in ja), (ja, jb)
+
+    bytes_json = sum(map(len, json_payloads)) / len(json_payloads)
+    bytes_bin = sum(map(len, bin_payloads)) / len(bin_payloads)
+    taxa_antiga = medir(caminho_antigo, json_payloads, args.repeticoes)
+    taxa_json = medir(decodificar_telemetria, json_payloads, args.repeticoes)
+    taxa_bin = medir(decodificar_telemetria, bin_payloads, args.repeticoes)
+    dados = [decodificar_telemetria(p) for p in bin_payloads]
+    lotes = [codificar_lote([(0.0, d) for d in dados[i:i + args.lote]]) for i in range(0, len(dados), args.lote)]
+    bytes_lote = sum(map(len, lotes)) / len(dados)
+    taxa_lote = medir(decodificar_leituras, lotes, args.repeticoes) * len(dados) / len(lotes)
+
+    print(f"Leituras: {args.leituras}")
+    print(f"Bytes por leitura:  JSON {bytes_json:.1f} | binário {bytes_bin:.1f} "
+          f"({bytes_json / bytes_bin:.1f}x menor) | lote de {args.lote} {bytes_lote:.1f}")
+    print(f"Decodificação (leituras/s):")
+    print(f"  JSON, caminho antigo (decode + strip + json.loads): {taxa_antiga:>9,.0f}")
+    print(f"  JSON, decodificar_telemetria:                      {taxa_json:>10,.0f}")
+    print(f"  binário, decodificar_telemetria:                   {taxa_bin:>10,.0f} "
+          f"({taxa_bin / taxa_antiga:.1f}x o caminho antigo)")
+    rotulo = f"lote binário de {args.lote}, decodificar_leituras:"
+    print(f"  {rotulo:<51}{taxa_lote:>10,.0f} "
+          f"({taxa_lote / taxa_antiga:.1f}x o caminho antigo)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# =================================================================
+# ==== BENCHMARK: LOTES DE TELEMETRIA E STATUS SÓ NA MUDANÇA ====
+# =================================================================
+# Compara o tráfego do firmware antigo (status, alertas e telemetria a
+# cada leitura) com o do firmware novo (TELEMETRIA_LOTE e status/alertas
+# só quando mudam), passando as mensagens do simulador pelo processamento
+# real do dashboard (processar_lote), sem broker e sem banco:
+#   - mensagens MQTT por leitura de sensor
+#   - eventos agendados para os navegadores (broadcast.publicar)
+#   - tempo de processamento por leitura
+#
+#   python benchmarks/bench_lote.py --dispositivos 2000 --ciclos 40 --lote 10
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulador import SimuladorFrota, READ_INTERVAL_S
+
+
+def gerar_mensagens(dispositivos, ciclos, binario, lote, so_mudancas):
+    frota = SimuladorFrota(dispositivos, binario=binario, lote=lote, so_mudancas=so_mudancas)
+    mensagens = []
+    ts = time.time() - ciclos * READ_INTERVAL_S
+    for _ in range(ciclos):
+        for dispositivo in frota.dispositivos:
+            mensagens.extend((topico, payload, ts) for topico, payload in frota.leitura(dispositivo))
+        ts += READ_INTERVAL_S
+    return mensagens
+
+
+def medir(dashboard, mensagens, tamanho_lote):
+    # Estado novo a cada variante: o dashboard não pode "lembrar" a anterior
+    dashboard.estado_frota = dashboard.EstadoFrota()
+    publicadas_antes = dashboard.broadcast.publicadas
+    inicio = time.perf_counter()
+    for i in range(0, len(mensagens), tamanho_lote):
+        dashboard.processar_lote(mensagens[i:i + tamanho_lote])
+    decorrido = time.perf_counter() - inicio
+    return decorrido, dashboard.broadcast.publicadas - publicadas_antes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de lotes de telemetria do EcoWork")
+    parser.add_argument("--dispositivos", type=int, default=2000)
+    parser.add_argument("--ciclos", type=int, default=40, help="leituras por dispositivo")
+    parser.add_argument("--lote", type=int, default=10, help="TELEMETRIA_LOTE do firmware novo")
+    args = parser.parse_args()
+
+    # Sem iniciar_servicos(): sem banco, estado salvo nem threads
+    import dashboard
+    dashboard.log_mqtt.setLevel("WARNING")
+
+    leituras = args.dispositivos * args.ciclos
+    variantes = (
+        ("antigo (JSON)", False, 1, False),
+        ("antigo (binário)", True, 1, False),
+        ("só mudanças", True, 1, True),
+        (f"lote {args.lote} + mudanças", True, args.lote, True),
+    )
+    print(f"{leituras:,} leituras ({args.dispositivos} dispositivos x {args.ciclos} ciclos de {READ_INTERVAL_S:.0f} s)")
+    base = None
+    for nome, binario, lote, so_mudancas in variantes:
+        mensagens = gerar_mensagens(args.dispositivos, args.ciclos, binario, lote, so_mudancas)
+        decorrido, eventos = medir(dashboard, mensagens, dashboard.INGESTAO_TAMANHO_LOTE)
+        base = base or (len(mensagens), decorrido)
+        print(f"{nome:<22} | {len(mensagens):>9,} msgs ({len(mensagens) / leituras:.2f}/leitura, "
+              f"{base[0] / len(mensagens):>4.1f}x menos) | {eventos:>9,} eventos | "
+              f"{decorrido * 1e6 / leituras:>6.1f} µs/leitura ({base[1] / decorrido:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# =================================================================
+# ==== BENCHMARK: PERSISTÊNCIA (SQLite WAL) ====
+# =================================================================
+# Mede a taxa sustentada de gravação e a latência das consultas com uma
+# frota de 10 mil ESP32 publicando a cada 3 s (READ_INTERVAL_MS = 3000).
+#
+#   python benchmarks/bench_persistencia.py --dispositivos 10000 --ciclos 60
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from persistencia import ArmazemTelemetria, TIER_BRUTO, TIER_1M, TIER_1H
+
+INTERVALO_LEITURA_S = 3.0
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da persistência EcoWork")
+    parser.add_argument("--dispositivos", type=int, default=10000)
+    parser.add_argument("--ciclos", type=int, default=60, help="leituras por dispositivo")
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--arquivo", default=None, help="banco a usar (padrão: arquivo temporário)")
+    args = parser.parse_args()
+
+    caminho = args.arquivo or os.path.join(tempfile.mkdtemp(prefix="ecowork-bench-"), "bench.db")
+    armazem = ArmazemTelemetria(caminho, intervalo_consolidacao_s=3600)
+    armazem.iniciar()
+    ids = [f"esp32-{i:05d}" for i in range(args.dispositivos)]
+    t0 = time.time() - args.ciclos * INTERVALO_LEITURA_S
+    rnd = random.Random(42)
+
+    # ---- Gravação ----
+    total = args.dispositivos * args.ciclos
+    inicio = time.perf_counter()
+    for ciclo in range(args.ciclos):
+        ts = t0 + ciclo * INTERVALO_LEITURA_S
+        for device_id in ids:
+            armazem.registrar(device_id, ts + rnd.random(), {
+                "temperatura": round(rnd.uniform(18, 30), 1),
+                "umidade": round(rnd.uniform(30, 70), 1),
+                "luminosidade": rnd.randint(0, 4095),
+                "distancia": rnd.randint(5, 400),
+            })
+            while armazem._fila.full():
+                time.sleep(0.001)
+    armazem.flush(timeout=600)
+    duracao = time.perf_counter() - inicio
+    taxa = total / duracao
+    necessaria = args.dispositivos / INTERVALO_LEITURA_S
+
+    inicio = time.perf_counter()
+    armazem.consolidar()
+    duracao_consolidacao = time.perf_counter() - inicio
+
+    # ---- Consultas ----
+    latencias = {}
+    for tier, janela in ((TIER_BRUTO, 15 * 60), (TIER_1M, 24 * 3600), (TIER_1H, 30 * 24 * 3600)):
+        tempos = []
+        for _ in range(args.consultas):
+            device_id = rnd.choice(ids)
+            fim = t0 + args.ciclos * INTERVALO_LEITURA_S
+            q0 = time.perf_counter()
+            armazem.consultar(device_id, "temperatura", fim - janela, fim, tier)
+            tempos.append((time.perf_counter() - q0) * 1000)
+        latencias[tier] = tempos
+    armazem.parar()
+
+    print(f"Dispositivos: {args.dispositivos} | leituras: {total} | banco: {caminho}")
+    print(f"Gravação: {taxa:,.0f} leituras/s (frota precisa de {necessaria:,.0f}/s -> folga {taxa / necessaria:.1f}x)")
+    print(f"Consolidação final (1m + 1h): {duracao_consolidacao * 1000:.1f} ms")
+    for tier, tempos in latencias.items():
+        print(f"Consulta {tier:>3}: p50 {statistics.median(tempos):.2f} ms | p99 {percentil(tempos, 99):.2f} ms")
+    print(f"Tamanho do banco: {os.path.getsize(caminho) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# =================================================================
+# ==== BENCHMARK: PONTA A PONTA (frota simulada -> navegadores) ====
+# =================================================================
+# Quantos dispositivos uma instância do dashboard aguenta?
+#
+# Sobe o dashboard num subprocesso com o simulador de frota (simulador.py)
+# publicando pelo caminho real de entrada: cada mensagem vira um
+# MQTTMessage e passa pelo on_message, como se viesse do broker. Clientes
+# Socket.IO sem navegador assinam alguns dispositivos "sonda", cuja
+# telemetria leva o horário de publicação, e medem a latência MQTT ->
+# navegador.
+#
+# Relata por cenário: vazão de ingestão (msg/s processadas), descartes,
+# latência p50/p99, CPU e RSS do servidor. Os resultados podem ser
+# acumulados num JSON (--saida) para comparar antes/depois de cada upgrade.
+#
+#   python benchmarks/bench_ponta_a_ponta.py --suite --saida resultados.json
+#   python benchmarks/bench_ponta_a_ponta.py --cenario frota-5k --modo asyncio
+#   python benchmarks/bench_ponta_a_ponta.py --dispositivos 2000 --clientes 100
+
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_websocket import (RAIZ, aumentar_limite_arquivos, esperar_servidor, percentil,
+                             processo_clientes, uso_servidor)
+from simulador import SimuladorFrota, READ_INTERVAL_S
+
+sys.path.insert(0, RAIZ)
+
+# Cenários da suíte (rodados em sequência com --suite)
+SUITE = [
+    {"nome": "frota-1k", "dispositivos": 1000, "clientes": 50},
+    {"nome": "frota-5k", "dispositivos": 5000, "clientes": 200},
+    {"nome": "frota-10k", "dispositivos": 10000, "clientes": 500},
+    # Sem ritmo: publica o mais rápido possível (vazão máxima de ingestão)
+    {"nome": "rajada-1k", "dispositivos": 1000, "clientes": 10, "rajada": True},
+]
+SONDAS = 10
+SEMENTE = 42
+
+
+# ---- Lado do servidor (roda no subprocesso) ----
+def alimentar(dashboard, frota, rajada):
+    import paho.mqtt.client as mqtt
+
+    def publicar(topico, payload):
+        msg = mqtt.MQTTMessage(topic=topico.encode())
+        msg.payload = payload
+        dashboard.on_message(dashboard.client, None, msg)
+
+    if rajada:
+        frota.rajada(publicar, float("inf"))
+    else:
+        frota.rodar(publicar, float("inf"))
+
+
+def rodar_servidor(modo, porta, dispositivos, intervalo, rajada):
+    aumentar_limite_arquivos()
+    import dashboard
+    frota = SimuladorFrota(dispositivos, intervalo, SEMENTE, sondas=SONDAS)
+    threading.Thread(target=alimentar, args=(dashboard, frota, rajada), daemon=True).start()
+    if modo == dashboard.MODO_ASYNCIO:
+        import servidor_async
+        servidor_async.rodar("127.0.0.1", porta, conectar_mqtt=False)
+    else:
+        dashboard.iniciar_servicos()
+        dashboard.broadcast.iniciar(dashboard.socketio.start_background_task, dashboard.socketio.sleep)
+        dashboard.socketio.run(dashboard.app, host="127.0.0.1", port=porta, use_reloader=False,
+                               log_output=False, allow_unsafe_werkzeug=True)
+
+
+# ---- Lado do benchmark ----
+def ler_ingestao(url):
+    with urllib.request.urlopen(url + "/api/metricas/ingestao", timeout=10) as resposta:
+        return json.loads(resposta.read())
+
+
+def rodar_cenario(cenario, args):
+    url = f"http://127.0.0.1:{args.porta}"
+    comando = [sys.executable, os.path.abspath(__file__), "--servidor", "--modo", args.modo,
+               "--porta", str(args.porta), "--dispositivos", str(cenario["dispositivos"]),
+               "--intervalo", str(args.intervalo)]
+    if cenario.get("rajada"):
+        comando.append("--rajada")
+    # O ecowork.db do benchmark fica num diretório temporário
+    servidor = subprocess.Popen(comando, cwd=tempfile.mkdtemp(prefix="ecowork-bench-"))
+    try:
+        if not esperar_servidor(url):
+            raise RuntimeError("servidor não respondeu")
+        time.sleep(args.aquecimento)
+        ingestao_inicio = ler_ingestao(url)
+        cpu_inicio, _ = uso_servidor(servidor.pid)
+        inicio = time.perf_counter()
+
+        # Os ids das sondas são os primeiros da frota (mesma semente do servidor)
+        sondas = SimuladorFrota(SONDAS, semente=SEMENTE, sondas=SONDAS).ids_sonda()
+        resultados = []
+        if cenario["clientes"]:
+            saida = multiprocessing.Queue()
+            processos = min(args.processos, cenario["clientes"])
+            por_processo = [cenario["clientes"] // processos + (i < cenario["clientes"] % processos)
+                            for i in range(processos)]
+            filhos = [multiprocessing.Process(
+                target=processo_clientes,
+                args=(url, n, args.duracao, args.concorrencia, saida, {"dispositivos": sondas}))
+                for n in por_processo]
+            for p in filhos:
+                p.start()
+            resultados = [saida.get() for _ in filhos]
+            for p in filhos:
+                p.join()
+        else:
+            time.sleep(args.duracao)
+
+        decorrido = time.perf_counter() - inicio
+        ingestao_fim = ler_ingestao(url)
+        cpu_fim, rss_mb = uso_servidor(servidor.pid)
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+    latencias = [l for r in resultados for l in r[2]]
+    return {
+        "cenario": cenario["nome"],
+        "modo": args.modo,
+        "dispositivos": cenario["dispositivos"],
+        "clientes": cenario["clientes"],
+        "conectados": sum(r[0] for r in resultados),
+        "ingestao_msg_s": (ingestao_fim["processadas"] - ingestao_inicio["processadas"]) / decorrido,
+        "descartadas": ingestao_fim["descartadas"] - ingestao_inicio["descartadas"],
+        "fila_final": ingestao_fim["profundidade"],
+        "latencia_p50_ms": percentil(latencias, 50) if latencias else None,
+        "latencia_p99_ms": percentil(latencias, 99) if latencias else None,
+        "cpu_pct": 100 * (cpu_fim - cpu_inicio) / decorrido,
+        "rss_mb": rss_mb,
+    }
+
+
+def imprimir(r):
+    latencia = (f"p50 {r['latencia_p50_ms']:.0f} ms | p99 {r['latencia_p99_ms']:.0f} ms"
+                if r["latencia_p50_ms"] is not None else "sem medidas")
+    print(f"{r['cenario']:<12} {r['modo']:<9} {r['dispositivos']:>6} disp. | "
+          f"{r['ingestao_msg_s']:>8.0f} msg/s ({r['descartadas']} descartadas) | "
+          f"{r['conectados']}/{r['clientes']} clientes | {latencia} | "
+          f"CPU {r['cpu_pct']:.0f}% | RSS {r['rss_mb']:.0f} MB")
+
+
+def versao_git():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta do EcoWork")
+    parser.add_argument("--suite", action="store_true", help="roda todos os cenários da suíte")
+    parser.add_argument("--cenario", action="append", choices=[c["nome"] for c in SUITE])
+    parser.add_argument("--dispositivos", type=int, default=1000)
+    parser.add_argument("--clientes", type=int, default=50)
+    parser.add_argument("--rajada", action="store_true", help="publica sem ritmo (vazão máxima)")
+    parser.add_argument("--modo", choices=("threading", "asyncio"), default="threading")
+    parser.add_argument("--intervalo", type=float, default=READ_INTERVAL_S, help="segundos entre leituras")
+    parser.add_argument("--duracao", type=float, default=20.0, help="segundos de medição")
+    parser.add_argument("--aquecimento", type=float, default=3.0)
+    parser.add_argument("--processos", type=int, default=2, help="processos de clientes")
+    parser.add_argument("--concorrencia", type=int, default=100, help="conexões abertas em paralelo")
+    parser.add_argument("--porta", type=int, default=5056)
+    parser.add_argument("--saida", help="arquivo JSON onde os resultados são acumulados")
+    parser.add_argument("--servidor", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servidor:
+        rodar_servidor(args.modo, args.porta, args.dispositivos, args.intervalo, args.rajada)
+        return
+
+    aumentar_limite_arquivos()
+    if args.suite:
+        cenarios = SUITE
+    elif args.cenario:
+        cenarios = [c for c in SUITE if c["nome"] in args.cenario]
+    else:
+        cenarios = [{"nome": "manual", "dispositivos": args.dispositivos,
+                     "clientes": args.clientes, "rajada": args.rajada}]
+
+    execucao = {"versao": versao_git(), "inicio": time.time(), "resultados": []}
+    for cenario in cenarios:
+        resultado = rodar_cenario(cenario, args)
+        imprimir(resultado)
+        execucao["resultados"].append(resultado)
+
+    if args.saida:
+        historico = []
+        if os.path.exists(args.saida):
+            with open(args.saida) as f:
+                historico = json.load(f)
+        historico.append(execucao)
+        with open(args.saida, "w") as f:
+            json.dump(historico, f, indent=2)
+        print(f"Resultados salvos em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
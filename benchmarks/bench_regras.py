@@ -0,0 +1,118 @@
+# =================================================================
+# ==== BENCHMARK: MOTOR DE REGRAS DE ALERTA ====
+# =================================================================
+# Mede a avaliação das regras (ver regras.py) sobre leituras do simulador
+# de frota, em lotes como os da ingestão:
+#   - leituras/s e avaliações de regra/s
+#   - avisos emitidos x silenciados/suprimidos (tempestade de alertas)
+# As regras são geradas com limites perto das bordas da faixa normal de
+# cada métrica (como alertas reais: a maioria das leituras não dispara),
+# com uma fração de sobrescritas por dispositivo.
+#
+#   python benchmarks/bench_regras.py --regras 1000 --dispositivos 5000
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formato_telemetria import decodificar_telemetria
+from regras import MotorRegras
+from simulador import SimuladorFrota, READ_INTERVAL_S
+
+# Faixa normal de cada métrica no simulador
+FAIXAS = {
+    "temperatura": (18.0, 30.0),
+    "umidade": (35.0, 70.0),
+    "luminosidade": (200.0, 4000.0),
+    "distancia": (20.0, 300.0),
+}
+
+
+def sortear_limite(aleatorio, metrica, operador):
+    # ">" perto do topo da faixa, "<" perto da base
+    minimo, maximo = FAIXAS[metrica]
+    faixa = maximo - minimo
+    if operador == ">":
+        return aleatorio.uniform(maximo - 0.15 * faixa, maximo + 0.25 * faixa)
+    return aleatorio.uniform(minimo - 0.25 * faixa, minimo + 0.15 * faixa)
+
+
+def gerar_regras(quantidade, dispositivos, fracao_sobrescritas, semente):
+    aleatorio = random.Random(semente)
+    metricas = list(FAIXAS)
+    regras = []
+    for i in range(quantidade):
+        metrica = metricas[i % len(metricas)]
+        minimo, maximo = FAIXAS[metrica]
+        operador = aleatorio.choice((">", "<"))
+        regras.append({
+            "nome": f"r{i}", "metrica": metrica, "operador": operador,
+            "limite": sortear_limite(aleatorio, metrica, operador), "histerese": (maximo - minimo) * 0.02,
+            "duracao_s": aleatorio.choice((0, 30, 120)), "intervalo_min_s": 300,
+        })
+    sobrescritas = {}
+    for device_id in aleatorio.sample(dispositivos, int(len(dispositivos) * fracao_sobrescritas)):
+        regra = aleatorio.choice(regras)
+        sobrescritas[device_id] = {
+            regra["nome"]: {"limite": sortear_limite(aleatorio, regra["metrica"], regra["operador"])}}
+    return regras, sobrescritas
+
+
+def gerar_lotes(frota, ciclos, tamanho_lote):
+    # Telemetria de "ciclos" leituras de cada dispositivo, com o ts simulado
+    leituras = []
+    ts = 1_700_000_000.0
+    for _ in range(ciclos):
+        for dispositivo in frota.dispositivos:
+            payload = frota.leitura(dispositivo)[-1][1]
+            leituras.append((dispositivo.device_id, ts, decodificar_telemetria(payload)))
+        ts += READ_INTERVAL_S
+    return [leituras[i:i + tamanho_lote] for i in range(0, len(leituras), tamanho_lote)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do motor de regras do EcoWork")
+    parser.add_argument("--regras", type=int, default=1000)
+    parser.add_argument("--dispositivos", type=int, default=2000)
+    parser.add_argument("--ciclos", type=int, default=20, help="leituras por dispositivo")
+    parser.add_argument("--lote", type=int, default=256, help="leituras por lote (INGESTAO_TAMANHO_LOTE)")
+    parser.add_argument("--sobrescritas", type=float, default=0.1, help="fração de dispositivos com sobrescrita")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    frota = SimuladorFrota(args.dispositivos, semente=args.semente)
+    ids = [d.device_id for d in frota.dispositivos]
+    regras, sobrescritas = gerar_regras(args.regras, ids, args.sobrescritas, args.semente)
+
+    inicio = time.perf_counter()
+    motor = MotorRegras(regras, sobrescritas)
+    compilacao_ms = (time.perf_counter() - inicio) * 1000
+
+    lotes = gerar_lotes(frota, args.ciclos, args.lote)
+    leituras = sum(map(len, lotes))
+    avisos = 0
+    inicio = time.perf_counter()
+    for lote in lotes:
+        avisos += len(motor.avaliar_lote(lote))
+    decorrido = time.perf_counter() - inicio
+
+    m = motor.metricas()
+    print(f"Regras: {args.regras} ({len(sobrescritas)} dispositivos com sobrescrita) | "
+          f"compilação {compilacao_ms:.1f} ms")
+    print(f"Leituras: {leituras} de {args.dispositivos} dispositivos, lotes de {args.lote}")
+    print(f"  {leituras / decorrido:>12,.0f} leituras/s")
+    print(f"  {m['avaliacoes'] / decorrido:>12,.0f} comparações com limites/s "
+          f"({m['avaliacoes'] / leituras:.1f} por leitura, com {args.regras} regras)")
+    print(f"  {decorrido * 1e6 / leituras:>12.1f} µs por leitura")
+    print(f"Alertas: {m['disparos']} disparos | {avisos} avisos emitidos | "
+          f"{m['silenciados']} silenciados | {m['suprimidos']} suprimidos | "
+          f"{len(motor.ativos())} ativos no fim")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# =================================================================
+# ==== BENCHMARK: CONEXÕES WEBSOCKET (threading x asyncio) ====
+# =================================================================
+# Sobe o dashboard num subprocesso (sem broker MQTT: uma thread injeta
+# telemetria direto no pipeline de ingestão) e conecta N navegadores
+# simulados (python-socketio AsyncClient, só websocket) inscritos no mesmo
+# dispositivo. Cada telemetria leva o horário de envio, então o cliente
+# mede a latência ponta a ponta (ingestão -> lote -> websocket).
+#
+# Relata: conexões aceitas, latência p50/p99, CPU e RSS do servidor.
+#
+#   pip install "python-socketio[asyncio_client]" uvicorn asgiref
+#   python benchmarks/bench_websocket.py --modo threading --clientes 500
+#   python benchmarks/bench_websocket.py --modo asyncio --clientes 20000 --processos 8
+#
+# Para muitos clientes, aumente o limite de arquivos abertos (ulimit -n).
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+DISPOSITIVO_BENCH = "BENCH00000001"
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def aumentar_limite_arquivos():
+    suave, rigido = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if suave < rigido:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (rigido, rigido))
+    return rigido
+
+
+# ---- Lado do servidor (roda no subprocesso) ----
+def injetar(dashboard, taxa):
+    topico = f"{dashboard.MQTT_TOPIC_PREFIXO}/{DISPOSITIVO_BENCH}/{dashboard.TIPO_TELEMETRIA}"
+    intervalo = 1.0 / taxa
+    while True:
+        payload = json.dumps({"temperatura": 22.5, "umidade": 50, "luminosidade": 2000,
+                              "enviado_em": time.time()}).encode()
+        dashboard.pipeline_ingestao.enfileirar(topico, payload, time.time())
+        time.sleep(intervalo)
+
+
+def rodar_servidor(modo, porta, taxa):
+    aumentar_limite_arquivos()
+    import dashboard
+    threading.Thread(target=injetar, args=(dashboard, taxa), daemon=True).start()
+    if modo == dashboard.MODO_ASYNCIO:
+        import servidor_async
+        servidor_async.rodar("127.0.0.1", porta, conectar_mqtt=False)
+    else:
+        dashboard.iniciar_servicos()
+        dashboard.broadcast.iniciar(dashboard.socketio.start_background_task, dashboard.socketio.sleep)
+        dashboard.socketio.run(dashboard.app, host="127.0.0.1", port=porta, use_reloader=False,
+                               log_output=False, allow_unsafe_werkzeug=True)
+
+
+# ---- Lado dos clientes (um event loop por processo) ----
+async def clientes_async(url, quantidade, duracao, concorrencia, inscricao=None):
+    # inscricao: auth do Socket.IO (padrão: só o dispositivo do benchmark)
+    import socketio
+
+    inscricao = inscricao or {"dispositivos": [DISPOSITIVO_BENCH]}
+
+    latencias = []
+    conectados = 0
+    falhas = 0
+    clientes = []
+    limite = asyncio.Semaphore(concorrencia)
+
+    async def conectar():
+        nonlocal conectados, falhas
+        sio = socketio.AsyncClient(reconnection=False)
+
+        @sio.on("atualiza_telemetria")
+        async def ao_receber(lote):
+            agora = time.time()
+            for item in lote:
+                enviado = item["valor"].get("enviado_em")
+                if enviado is not None:
+                    latencias.append((agora - enviado) * 1000)
+
+        async with limite:
+            try:
+                await sio.connect(url, transports=["websocket"], wait_timeout=30,
+                                  auth=inscricao)
+                conectados += 1
+                clientes.append(sio)
+            except Exception:
+                falhas += 1
+
+    await asyncio.gather(*(conectar() for _ in range(quantidade)))
+    # Descarta as mensagens da fase de conexão: mede só com todos conectados
+    latencias.clear()
+    await asyncio.sleep(duracao)
+    medidas = list(latencias)
+    await asyncio.gather(*(c.disconnect() for c in clientes), return_exceptions=True)
+    return conectados, falhas, medidas
+
+
+def processo_clientes(url, quantidade, duracao, concorrencia, saida, inscricao=None):
+    aumentar_limite_arquivos()
+    saida.put(asyncio.run(clientes_async(url, quantidade, duracao, concorrencia, inscricao)))
+
+
+def uso_servidor(pid):
+    # (segundos de CPU, RSS em MB) lidos do /proc (Linux)
+    with open(f"/proc/{pid}/stat") as f:
+        campos = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")
+    with open(f"/proc/{pid}/status") as f:
+        rss_kb = next(int(l.split()[1]) for l in f if l.startswith("VmRSS:"))
+    return cpu, rss_kb / 1024
+
+
+def esperar_servidor(url, timeout=30):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            urllib.request.urlopen(url + "/api/dispositivos", timeout=2).read()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de conexões websocket do EcoWork")
+    parser.add_argument("--modo", choices=("threading", "asyncio"), default="asyncio")
+    parser.add_argument("--clientes", type=int, default=1000)
+    parser.add_argument("--processos", type=int, default=2, help="processos de clientes")
+    parser.add_argument("--duracao", type=float, default=15.0, help="segundos de medição")
+    parser.add_argument("--taxa", type=float, default=10.0, help="telemetrias/s injetadas")
+    parser.add_argument("--concorrencia", type=int, default=100, help="conexões abertas em paralelo")
+    parser.add_argument("--porta", type=int, default=5055)
+    parser.add_argument("--servidor", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servidor:
+        rodar_servidor(args.modo, args.porta, args.taxa)
+        return
+
+    print(f"Limite de arquivos abertos: {aumentar_limite_arquivos()}")
+    url = f"http://127.0.0.1:{args.porta}"
+    diretorio = tempfile.mkdtemp(prefix="ecowork-bench-")
+    servidor = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--servidor", "--modo", args.modo,
+         "--porta", str(args.porta), "--taxa", str(args.taxa)],
+        cwd=diretorio)  # o ecowork.db do benchmark fica no diretório temporário
+    try:
+        if not esperar_servidor(url):
+            print("Servidor não respondeu")
+            return
+        cpu_inicio, _ = uso_servidor(servidor.pid)
+        inicio = time.perf_counter()
+        saida = multiprocessing.Queue()
+        por_processo = [args.clientes // args.processos + (i < args.clientes % args.processos)
+                        for i in range(args.processos)]
+        processos = [multiprocessing.Process(
+            target=processo_clientes, args=(url, n, args.duracao, args.concorrencia, saida))
+            for n in por_processo if n]
+        for p in processos:
+            p.start()
+        resultados = [saida.get() for _ in processos]
+        for p in processos:
+            p.join()
+        decorrido = time.perf_counter() - inicio
+        cpu_fim, rss_mb = uso_servidor(servidor.pid)
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+    conectados = sum(r[0] for r in resultados)
+    falhas = sum(r[1] for r in resultados)
+    latencias = [l for r in resultados for l in r[2]]
+    print(f"Modo: {args.modo}")
+    print(f"Conexões: {conectados}/{args.clientes} ({falhas} falhas)")
+    if latencias:
+        print(f"Mensagens recebidas: {len(latencias)} em {args.duracao:.0f} s")
+        print(f"Latência: p50 {percentil(latencias, 50):.1f} ms | "
+              f"p99 {percentil(latencias, 99):.1f} ms | máx {max(latencias):.1f} ms")
+    print(f"Servidor: CPU {100 * (cpu_fim - cpu_inicio) / decorrido:.0f}% | RSS {rss_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# =================================================================
+# ==== SIMULADOR DE FROTA ESP32 ====
+# =================================================================
+# Gera o mesmo tráfego que o readSensorsAndAct() do EcoWork.c++, para N
+# dispositivos: a cada ciclo, status ("Presente"/"Ausente"), os alertas
+# de luz/clima (só com presença) e a telemetria JSON no formato exato do
+# firmware. Os sensores fazem um passeio aleatório em torno de valores
+# plausíveis, então presença, luz e clima mudam ao longo do tempo.
+#
+# Usado pelos benchmarks (bench_ponta_a_ponta.py) e também sozinho, para
+# publicar num broker MQTT de verdade:
+#
+#   python benchmarks/simulador.py --broker localhost --dispositivos 500
+#   python benchmarks/simulador.py --binario   # telemetria binária (TELEMETRIA_BINARIA=1)
+#   python benchmarks/simulador.py --lote 10 --so-mudancas   # firmware com TELEMETRIA_LOTE=10
+
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formato_telemetria import codificar_telemetria, codificar_lote
+
+# Constantes do EcoWork.c++
+PRESENCE_THRESHOLD_CM = 100
+LIGHT_THRESHOLD_HIGH_LIGHT = 1500
+TEMP_HIGH_THRESHOLD = 26.0
+TEMP_LOW_THRESHOLD = 20.0
+READ_INTERVAL_S = 3.0
+
+TOPICO_PREFIXO = "ecowork"
+
+
+def _limitar(valor, minimo, maximo):
+    return max(minimo, min(maximo, valor))
+
+
+class DispositivoSimulado:
+    __slots__ = ("device_id", "topicos", "temperatura", "umidade", "luz", "distancia", "_rng",
+                 "_ultimos", "_lote", "_presente")
+
+    def __init__(self, device_id, rng):
+        self.device_id = device_id
+        self.topicos = {tipo: f"{TOPICO_PREFIXO}/{device_id}/{tipo}"
+                        for tipo in ("telemetria", "status", "alerta")}
+        self._rng = rng
+        self.temperatura = rng.uniform(18.0, 30.0)
+        self.umidade = rng.uniform(35.0, 70.0)
+        self.luz = rng.randint(200, 4000)
+        self.distancia = rng.randint(20, 300)
+        # Firmware novo: últimos status/alertas publicados e leituras do lote
+        self._ultimos = {}
+        self._lote = []
+        self._presente = None
+
+    def _passo(self):
+        rng = self._rng
+        self.temperatura = _limitar(self.temperatura + rng.gauss(0, 0.2), -10.0, 60.0)
+        self.umidade = _limitar(self.umidade + rng.gauss(0, 0.5), 0.0, 100.0)
+        self.luz = int(_limitar(self.luz + rng.gauss(0, 150), 0, 4095))
+        # De vez em quando alguém chega ou sai da mesa
+        if rng.random() < 0.02:
+            self.distancia = rng.randint(20, 80) if self.distancia > PRESENCE_THRESHOLD_CM else rng.randint(150, 400)
+        else:
+            self.distancia = int(_limitar(self.distancia + rng.gauss(0, 3), 2, 400))
+
+    def _publicar_se_mudou(self, mensagens, tipo, chave, payload, so_mudancas):
+        if so_mudancas and self._ultimos.get(chave) == payload:
+            return
+        self._ultimos[chave] = payload
+        mensagens.append((self.topicos[tipo], payload))
+
+    def ler(self, extras=None, binario=False, lote=1, so_mudancas=False):
+        # Uma leitura: lista de (tópico, payload) na ordem em que o firmware publica.
+        # binario=True usa o formato de 10 bytes (os extras só cabem no JSON)
+        # lote > 1 / so_mudancas=True: firmware com TELEMETRIA_LOTE e status/alertas só na mudança
+        self._passo()
+        mensagens = []
+        presente = self.distancia <= PRESENCE_THRESHOLD_CM
+        if not presente:
+            self._publicar_se_mudou(mensagens, "status", "status", b"Ausente", so_mudancas)
+            self._ultimos.pop("luz", None)
+            self._ultimos.pop("clima", None)
+        else:
+            self._publicar_se_mudou(mensagens, "status", "status", b"Presente", so_mudancas)
+            if self.luz < LIGHT_THRESHOLD_HIGH_LIGHT:
+                self._publicar_se_mudou(mensagens, "alerta", "luz",
+                                        "Luz artificial desligada (ambiente claro)".encode(), so_mudancas)
+            else:
+                self._ultimos.pop("luz", None)
+            if self.temperatura < TEMP_LOW_THRESHOLD:
+                alerta = "Clima Frio. AC Desligado."
+            elif self.temperatura > TEMP_HIGH_THRESHOLD:
+                alerta = "Clima Quente. AC Ligado."
+            else:
+                alerta = "Clima Confortavel. Modo Eco."
+            self._publicar_se_mudou(mensagens, "alerta", "clima", alerta.encode(), so_mudancas)
+        if lote > 1:
+            # Idade em múltiplos do intervalo de leitura, como no ESP32
+            self._lote.append({"temperatura": self.temperatura, "umidade": self.umidade,
+                               "luminosidade": self.luz, "distancia": self.distancia})
+            mudou_presenca = self._presente is not None and presente != self._presente
+            self._presente = presente
+            if len(self._lote) >= lote or mudou_presenca:
+                n = len(self._lote)
+                mensagens.append((self.topicos["telemetria"], codificar_lote(
+                    [((n - 1 - i) * READ_INTERVAL_S, dados) for i, dados in enumerate(self._lote)])))
+                self._lote = []
+            return mensagens
+        if binario and not extras:
+            mensagens.append((self.topicos["telemetria"], codificar_telemetria({
+                "temperatura": self.temperatura, "umidade": self.umidade,
+                "luminosidade": self.luz, "distancia": self.distancia})))
+            return mensagens
+        # Mesmo formato do firmware: String(temp, 1), sem espaços
+        payload = (f'{{"temperatura":{self.temperatura:.1f},"umidade":{self.umidade:.1f},'
+                   f'"luminosidade":{self.luz},"distancia":{self.distancia}')
+        if extras:
+            payload += "," + json.dumps(extras, separators=(",", ":"))[1:-1]
+        mensagens.append((self.topicos["telemetria"], (payload + "}").encode()))
+        return mensagens
+
+
+class SimuladorFrota:
+    def __init__(self, dispositivos, intervalo_s=READ_INTERVAL_S, semente=42, sondas=0, binario=False,
+                 lote=1, so_mudancas=False):
+        # sondas: quantos dispositivos levam "enviado_em" na telemetria,
+        # para os clientes medirem a latência ponta a ponta
+        rng = random.Random(semente)
+        self.intervalo_s = intervalo_s
+        self.binario = binario
+        self.lote = lote
+        self.so_mudancas = so_mudancas
+        self.dispositivos = [DispositivoSimulado(f"SIM{i:09d}", rng) for i in range(dispositivos)]
+        self.sondas = {d.device_id for d in self.dispositivos[:sondas]}
+        # Fases espalhadas: os ESP32 não ligam todos no mesmo instante
+        self._fases = [rng.random() * intervalo_s for _ in self.dispositivos]
+
+    def ids_sonda(self):
+        return sorted(self.sondas)
+
+    def leitura(self, dispositivo):
+        extras = {"enviado_em": time.time()} if dispositivo.device_id in self.sondas else None
+        return dispositivo.ler(extras, self.binario, self.lote, self.so_mudancas)
+
+    def rodar(self, publicar, duracao_s, parar=None):
+        # Chama publicar(tópico, payload) no ritmo real de cada dispositivo.
+        # Retorna quantas mensagens foram publicadas.
+        inicio = time.monotonic()
+        fim = inicio + duracao_s
+        # Heap de (próxima leitura, índice): só olha quem está na vez
+        agenda = [(inicio + fase, i) for i, fase in enumerate(self._fases)]
+        heapq.heapify(agenda)
+        publicadas = 0
+        while agenda and not (parar and parar.is_set()):
+            proximo, i = agenda[0]
+            if proximo >= fim:
+                break
+            espera = proximo - time.monotonic()
+            if espera > 0:
+                time.sleep(min(espera, 0.05))
+                continue
+            for topico, payload in self.leitura(self.dispositivos[i]):
+                publicar(topico, payload)
+                publicadas += 1
+            heapq.heapreplace(agenda, (proximo + self.intervalo_s, i))
+        return publicadas
+
+    def rajada(self, publicar, duracao_s):
+        # Publica o mais rápido possível (mede a vazão máxima de ingestão)
+        inicio = time.monotonic()
+        publicadas = 0
+        while time.monotonic() - inicio < duracao_s:
+            for dispositivo in self.dispositivos:
+                for topico, payload in self.leitura(dispositivo):
+                    publicar(topico, payload)
+                    publicadas += 1
+        return publicadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulador de frota ESP32 do EcoWork")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--porta", type=int, default=1883)
+    parser.add_argument("--dispositivos", type=int, default=100)
+    parser.add_argument("--intervalo", type=float, default=READ_INTERVAL_S, help="segundos entre leituras")
+    parser.add_argument("--duracao", type=float, default=60.0)
+    parser.add_argument("--binario", action="store_true", help="telemetria no formato binário")
+    parser.add_argument("--lote", type=int, default=1, help="leituras por mensagem de telemetria (TELEMETRIA_LOTE)")
+    parser.add_argument("--so-mudancas", action="store_true", help="status/alertas só quando mudam")
+    args = parser.parse_args()
+
+    import paho.mqtt.client as mqtt
+
+    cliente = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"EcoWorkSimulador-{random.getrandbits(32):08x}")
+    cliente.connect(args.broker, args.porta)
+    cliente.loop_start()
+    frota = SimuladorFrota(args.dispositivos, args.intervalo, binario=args.binario,
+                           lote=args.lote, so_mudancas=args.so_mudancas)
+    publicadas = frota.rodar(lambda topico, payload: cliente.publish(topico, payload), args.duracao)
+    cliente.loop_stop()
+    cliente.disconnect()
+    print(f"[Simulador] {publicadas} mensagens de {args.dispositivos} dispositivos em {args.duracao:.0f} s")
+
+
+if __name__ == "__main__":
+    main()
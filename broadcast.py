@@ -0,0 +1,187 @@
+# =================================================================
+# ==== AGENDADOR DE BROADCAST ECOWORK ====
+# =================================================================
+# Junta as atualizações que vão para o frontend e envia em lotes.
+#
+# Em vez de um socketio.emit por mensagem MQTT, os workers chamam
+# publicar(evento, device_id, valor). Só o valor mais recente de cada
+# (evento, dispositivo) é guardado ("o último vence") e, a cada tick,
+# cada evento é enviado UMA vez com a lista de atualizações:
+#   socketio.emit("atualiza_telemetria", [{"dispositivo": ..., "valor": ...}, ...])
+#
+# Os envios são por SALA do Socket.IO, não para todos os clientes:
+#   "dispositivo:<id>" -> quem acompanha um ESP32
+#   "grupo:<nome>"     -> quem acompanha uma equipe/empresa
+#   "frota"            -> quem acompanha só o resumo da frota
+# Cada lote é serializado uma vez por sala (o python-socketio reaproveita
+# o pacote codificado para todos os participantes) e salas vazias são puladas.
+
+import asyncio
+import json
+import logging
+import threading
+import time
+
+log = logging.getLogger("ecowork.broadcast")
+
+INTERVALO_PADRAO_S = 0.25
+
+SALA_FROTA = "frota"
+EVENTO_RESUMO_FROTA = "resumo_frota"
+EVENTO_AGREGADOS_FROTA = "agregados_frota"
+
+
+def sala_dispositivo(device_id):
+    return f"dispositivo:{device_id}"
+
+
+def sala_grupo(nome):
+    return f"grupo:{nome}"
+
+
+class MapaGrupos:
+    # Quais grupos (equipe, empresa...) cada dispositivo integra
+    def __init__(self, grupos=None):
+        self._lock = threading.Lock()
+        self._grupos = {}
+        self._por_dispositivo = {}
+        for nome, dispositivos in (grupos or {}).items():
+            self.definir(nome, dispositivos)
+
+    @classmethod
+    def de_arquivo(cls, caminho):
+        # JSON no formato {"equipe-a": ["24A160123ABC", ...], ...}
+        with open(caminho, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def definir(self, nome, dispositivos):
+        with self._lock:
+            for device_id in self._grupos.get(nome, ()):
+                self._por_dispositivo[device_id] = tuple(
+                    g for g in self._por_dispositivo.get(device_id, ()) if g != nome)
+            self._grupos[nome] = tuple(dispositivos)
+            for device_id in self._grupos[nome]:
+                self._por_dispositivo[device_id] = self._por_dispositivo.get(device_id, ()) + (nome,)
+
+    def grupos_de(self, device_id):
+        return self._por_dispositivo.get(device_id, ())
+
+    def dispositivos_de(self, nome):
+        return self._grupos.get(nome, ())
+
+    def como_dict(self):
+        with self._lock:
+            return {nome: list(dispositivos) for nome, dispositivos in self._grupos.items()}
+
+
+class AgendadorBroadcast:
+    def __init__(self, emitir, intervalo=INTERVALO_PADRAO_S, mapa_grupos=None,
+                 sala_ativa=None, resumo_frota=None, observar_envio=None, periodicos=()):
+        # emitir(evento, lista_de_atualizacoes, sala) faz o envio de fato
+        # sala_ativa(sala) diz se alguém está na sala (None = envia sempre)
+        # resumo_frota(n_atualizacoes) monta o payload da sala "frota"
+        # observar_envio(segundos) recebe o tempo de cada tick com envios
+        # periodicos: [(evento, sala, intervalo_s, montar)] enviados em
+        # cadência fixa, com ou sem atualizações pendentes (montar() -> payload)
+        self._emitir = emitir
+        self.intervalo = intervalo
+        self.mapa_grupos = mapa_grupos or MapaGrupos()
+        self.sala_ativa = sala_ativa or (lambda sala: True)
+        self._resumo_frota = resumo_frota
+        self._observar_envio = observar_envio
+        self._periodicos = [[evento, sala, intervalo_s, montar, 0.0]
+                            for evento, sala, intervalo_s, montar in periodicos]
+        self._pendentes = {}
+        self._lock = threading.Lock()
+        self._rodando = False
+        self.publicadas = 0
+        self.coalescidas = 0
+        self.frames = 0
+
+    def publicar(self, evento, device_id, valor):
+        chave = (evento, device_id)
+        with self._lock:
+            if chave in self._pendentes:
+                self.coalescidas += 1
+            self._pendentes[chave] = valor
+            self.publicadas += 1
+
+    def coletar(self):
+        # Troca o dict inteiro sob o lock (O(1)); a montagem dos lotes
+        # acontece fora dele para não travar os workers da ingestão.
+        # Retorna {(evento, sala): [atualizacoes]} só para salas com ouvintes.
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, {}
+        ativa = {}
+        lotes = {}
+        for (evento, device_id), valor in pendentes.items():
+            item = {"dispositivo": device_id, "valor": valor}
+            salas = [sala_dispositivo(device_id)]
+            salas.extend(sala_grupo(g) for g in self.mapa_grupos.grupos_de(device_id))
+            for sala in salas:
+                if sala not in ativa:
+                    ativa[sala] = self.sala_ativa(sala)
+                if ativa[sala]:
+                    lotes.setdefault((evento, sala), []).append(item)
+        if self._resumo_frota is not None and pendentes and self.sala_ativa(SALA_FROTA):
+            lotes[(EVENTO_RESUMO_FROTA, SALA_FROTA)] = self._resumo_frota(len(pendentes))
+        agora = time.monotonic()
+        for periodico in self._periodicos:
+            evento, sala, intervalo_s, montar, proximo = periodico
+            if agora >= proximo:
+                periodico[4] = agora + intervalo_s
+                if self.sala_ativa(sala):
+                    lotes[(evento, sala)] = montar()
+        return lotes
+
+    def descarregar(self):
+        inicio = time.perf_counter()
+        lotes = self.coletar()
+        for (evento, sala), dados in lotes.items():
+            self._emitir(evento, dados, sala)
+            self.frames += 1
+        if lotes and self._observar_envio is not None:
+            self._observar_envio(time.perf_counter() - inicio)
+
+    def iniciar(self, start_background_task, sleep):
+        # Recebe socketio.start_background_task/socketio.sleep para funcionar
+        # com qualquer async_mode do Flask-SocketIO
+        self._rodando = True
+        return start_background_task(self._loop, sleep)
+
+    def parar(self):
+        self._rodando = False
+
+    def _loop(self, sleep):
+        while self._rodando:
+            sleep(self.intervalo)
+            try:
+                self.descarregar()
+            except Exception as e:
+                log.error("Erro ao enviar lote: %s", e)
+
+    async def loop_async(self, emitir_async):
+        # Versão asyncio do _loop (modo de servidor "asyncio"):
+        # emitir_async(evento, dados, sala) é uma corrotina
+        self._rodando = True
+        while self._rodando:
+            await asyncio.sleep(self.intervalo)
+            try:
+                inicio = time.perf_counter()
+                lotes = self.coletar()
+                for (evento, sala), dados in lotes.items():
+                    await emitir_async(evento, dados, sala)
+                    self.frames += 1
+                if lotes and self._observar_envio is not None:
+                    self._observar_envio(time.perf_counter() - inicio)
+            except Exception as e:
+                log.error("Erro ao enviar lote: %s", e)
+
+    def metricas(self):
+        return {
+            "intervalo_s": self.intervalo,
+            "publicadas": self.publicadas,
+            "coalescidas": self.coalescidas,
+            "frames": self.frames,
+            "pendentes": len(self._pendentes),
+        }
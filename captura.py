@@ -0,0 +1,315 @@
+# =================================================================
+# ==== CAPTURA E REPLAY DO TRÁFEGO MQTT ECOWORK ====
+# =================================================================
+# Gravação: com ECOWORK_CAPTURA=<diretório>, o on_message guarda cada
+# mensagem bruta (ts de recebimento, tópico, payload) em arquivos gzip
+# rotativos. O on_message só põe a mensagem numa fila; uma thread
+# escritora comprime e grava (fora da thread de rede do paho).
+#
+# Replay: as capturas passam pelo MESMO processamento do dashboard
+# (processar_lote), lidas em streaming, sem carregar arquivos inteiros:
+#
+#   python captura.py capturas/                       # tempo real
+#   python captura.py capturas/ --velocidade 60       # 60x mais rápido
+#   python captura.py capturas/ --velocidade 0        # o mais rápido possível
+#   python captura.py capturas/ --dispositivo 24A160123ABC --de 1718000000
+#   python captura.py capturas/ --servidor            # replay com o dashboard no ar
+#   python captura.py capturas/ --banco recalculo.db  # banco do replay (padrão: ecowork-replay.db)
+#
+# Serve para reproduzir bugs sem os dispositivos e para recalcular dados
+# derivados (banco, energia, agregados) depois de mudar a lógica.
+#
+# Formato de cada registro (little-endian), em sequência dentro do gzip:
+#   float64 ts | uint16 tamanho do tópico | uint32 tamanho do payload | tópico | payload
+
+import argparse
+import gzip
+import heapq
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from datetime import datetime
+
+log = logging.getLogger("ecowork.captura")
+
+EXTENSAO = ".ecap.gz"
+# O replay grava em arquivos próprios, separados do ecowork.db/ecowork.estado
+BANCO_REPLAY = "ecowork-replay.db"
+ESTADO_REPLAY = "ecowork-replay.estado"
+_CABECALHO = struct.Struct("<dHI")
+
+
+class GravadorCaptura:
+    def __init__(self, diretorio, prefixo="captura", max_bytes_arquivo=64 * 1024 * 1024,
+                 max_arquivos=48, capacidade_fila=100000, intervalo_flush_s=1.0, nivel_compressao=5):
+        # max_bytes_arquivo: bytes (antes da compressão) por arquivo antes de rodar
+        # max_arquivos: arquivos mantidos no diretório; os mais antigos são apagados
+        self.diretorio = diretorio
+        self.prefixo = prefixo
+        self.max_bytes_arquivo = max_bytes_arquivo
+        self.max_arquivos = max_arquivos
+        self.intervalo_flush_s = intervalo_flush_s
+        self.nivel_compressao = nivel_compressao
+        self._fila = queue.Queue(maxsize=capacidade_fila)
+        self._rodando = False
+        self._thread = None
+        self._arquivo = None
+        self._bytes_arquivo = 0
+        self.gravadas = 0
+        self.descartadas = 0
+        self.arquivos = 0
+
+    def registrar(self, ts, topic, payload):
+        # Chamado na thread de rede do paho: não bloqueia nunca
+        try:
+            self._fila.put_nowait((ts, topic, payload))
+        except queue.Full:
+            self.descartadas += 1
+
+    def iniciar(self):
+        os.makedirs(self.diretorio, exist_ok=True)
+        self._rodando = True
+        self._thread = threading.Thread(target=self._escritor, name="ecowork-captura", daemon=True)
+        self._thread.start()
+
+    def parar(self, timeout=10.0):
+        self._rodando = False
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _abrir(self):
+        nome = f"{self.prefixo}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{EXTENSAO}"
+        self._arquivo = gzip.open(os.path.join(self.diretorio, nome), "wb", compresslevel=self.nivel_compressao)
+        self._bytes_arquivo = 0
+        self.arquivos += 1
+        antigos = listar_capturas(self.diretorio, self.prefixo)[:-self.max_arquivos]
+        for caminho in antigos:
+            os.remove(caminho)
+
+    def _fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def _escritor(self):
+        proximo_flush = time.monotonic() + self.intervalo_flush_s
+        while self._rodando or not self._fila.empty():
+            try:
+                registros = [self._fila.get(timeout=self.intervalo_flush_s)]
+            except queue.Empty:
+                registros = []
+            while len(registros) < 5000:
+                try:
+                    registros.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if registros:
+                    self._gravar(registros)
+                if self._arquivo is not None and time.monotonic() >= proximo_flush:
+                    # Sync flush: um crash perde no máximo ~1 s de captura
+                    self._arquivo.flush()
+                    proximo_flush = time.monotonic() + self.intervalo_flush_s
+            except OSError as e:
+                log.error("Erro ao gravar captura: %s", e)
+                self._fechar()
+        self._fechar()
+
+    def _gravar(self, registros):
+        partes = []
+        for ts, topic, payload in registros:
+            topico = topic.encode("utf-8")
+            partes.append(_CABECALHO.pack(ts, len(topico), len(payload)))
+            partes.append(topico)
+            partes.append(payload)
+        dados = b"".join(partes)
+        if self._arquivo is None or self._bytes_arquivo >= self.max_bytes_arquivo:
+            self._fechar()
+            self._abrir()
+        self._arquivo.write(dados)
+        self._bytes_arquivo += len(dados)
+        self.gravadas += len(registros)
+
+    def metricas(self):
+        return {
+            "fila": self._fila.qsize(),
+            "gravadas": self.gravadas,
+            "descartadas": self.descartadas,
+            "arquivos": self.arquivos,
+        }
+
+
+# ---- Leitura (geradores: um registro por vez na memória) ----
+def _prefixo(nome):
+    # "captura-p1-20240610-120000-000000.ecap.gz" -> "captura-p1"
+    return nome[:-len(EXTENSAO)].rsplit("-", 3)[0]
+
+
+def listar_capturas(caminho, prefixo=None):
+    # Arquivo único ou diretório. O nome tem o horário, então para um mesmo
+    # prefixo a ordem é a de gravação (prefixos diferentes, não: ver ler_capturas)
+    if os.path.isfile(caminho):
+        return [caminho]
+    return sorted(os.path.join(caminho, nome) for nome in os.listdir(caminho)
+                  if nome.endswith(EXTENSAO) and (prefixo is None or _prefixo(nome) == prefixo))
+
+
+def ler_captura(caminho):
+    # (ts, topic, payload) de um arquivo. Um arquivo truncado (processo
+    # morto no meio da gravação) é lido até o último registro completo.
+    with gzip.open(caminho, "rb") as f:
+        try:
+            while True:
+                cabecalho = f.read(_CABECALHO.size)
+                if len(cabecalho) < _CABECALHO.size:
+                    return
+                ts, n_topico, n_payload = _CABECALHO.unpack(cabecalho)
+                topico = f.read(n_topico)
+                payload = f.read(n_payload)
+                if len(payload) < n_payload:
+                    return
+                yield ts, topico.decode("utf-8"), payload
+        except (EOFError, gzip.BadGzipFile) as e:
+            log.warning("Captura %s termina incompleta: %s", caminho, e)
+
+
+def _encadear(caminhos):
+    for caminho in caminhos:
+        yield from ler_captura(caminho)
+
+
+def ler_capturas(caminhos):
+    # Os arquivos de cada prefixo (um por partição no multiprocesso) são lidos
+    # em sequência, e as sequências são intercaladas por ts: a saída fica em
+    # ordem de tempo mesmo com várias partições no mesmo diretório
+    sequencias = {}
+    for caminho in caminhos:
+        sequencias.setdefault(_prefixo(os.path.basename(caminho)), []).append(caminho)
+    if len(sequencias) == 1:
+        return _encadear(caminhos)
+    return heapq.merge(*(_encadear(s) for s in sequencias.values()), key=lambda registro: registro[0])
+
+
+def filtrar(registros, dispositivos=None, de=None, ate=None, analisar_topico=None):
+    # dispositivos: conjunto de ids (precisa de analisar_topico(topic) -> (device_id, tipo))
+    for registro in registros:
+        ts = registro[0]
+        if de is not None and ts < de:
+            continue
+        if ate is not None and ts > ate:
+            return  # ler_capturas entrega os registros em ordem de tempo
+        if dispositivos is not None and analisar_topico(registro[1])[0] not in dispositivos:
+            continue
+        yield registro
+
+
+def em_lotes(registros, tamanho, velocidade=0.0, espera_max_s=0.25, dormir=time.sleep, relogio=time.monotonic):
+    # Junta registros em lotes de até "tamanho". Com velocidade > 0 reproduz
+    # os intervalos originais divididos pela velocidade; um registro nunca
+    # fica mais que espera_max_s esperando o lote: antes de dormir até o
+    # próximo registro, o lote pendente sai se a espera passaria do limite
+    lote = []
+    limite = 0.0
+    inicio_real = inicio_captura = None
+    for registro in registros:
+        if velocidade > 0:
+            if inicio_captura is None:
+                inicio_real, inicio_captura = relogio(), registro[0]
+            atraso = inicio_real + (registro[0] - inicio_captura) / velocidade - relogio()
+            if atraso > 0:
+                if lote and relogio() + atraso >= limite:
+                    yield lote
+                    lote = []
+                dormir(atraso)
+        if not lote:
+            limite = relogio() + espera_max_s
+        lote.append(registro)
+        if len(lote) >= tamanho or relogio() >= limite:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+# ---- Replay pelo processamento do dashboard ----
+def reproduzir(caminho, velocidade=1.0, dispositivos=None, de=None, ate=None, servidor=False,
+               banco=BANCO_REPLAY, estado=ESTADO_REPLAY):
+    import dashboard
+
+    # Não regrava o que está sendo reproduzido, nem mistura com o banco e o
+    # estado salvo de produção
+    dashboard.gravador_captura = None
+    dashboard.PERSISTENCIA_ARQUIVO = banco
+    dashboard.salvamento_estado.caminho = estado
+    dashboard.iniciar_servicos(replay=True)
+    if servidor:
+        # Dashboard no ar para acompanhar o replay no navegador (sem MQTT)
+        dashboard.broadcast.iniciar(dashboard.socketio.start_background_task, dashboard.socketio.sleep)
+        threading.Thread(target=dashboard.socketio.run, args=(dashboard.app,), daemon=True, kwargs={
+            "host": dashboard.HOST, "port": dashboard.PORTA, "use_reloader": False,
+            "allow_unsafe_werkzeug": True}).start()
+
+    registros = ler_capturas(listar_capturas(caminho))
+    registros = filtrar(registros, dispositivos, de, ate, dashboard.analisar_topico)
+    energia = dashboard.energia
+    inicio = time.perf_counter()
+    total = 0
+    ts_captura = proxima_varredura = None
+    if dashboard.armazem is not None:
+        # Retenção do banco pelo relógio da captura: com o de parede, um replay
+        # antigo apagaria as leituras brutas logo depois de gravá-las
+        dashboard.armazem.relogio = lambda: 0.0 if ts_captura is None else ts_captura
+    try:
+        for lote in em_lotes(registros, dashboard.INGESTAO_TAMANHO_LOTE, velocidade):
+            # Direto no processar_lote (e não pela fila da ingestão): em ordem, sem descartes
+            dashboard.processar_lote([(topic, payload, ts) for ts, topic, payload in lote])
+            total += len(lote)
+            # A varredura dos calados segue o relógio da captura, não o de parede
+            ts_captura = lote[-1][0]
+            if proxima_varredura is None:
+                proxima_varredura = ts_captura + energia.intervalo_varredura_s
+            elif ts_captura >= proxima_varredura:
+                dashboard.expirar_calados(ts_captura)
+                proxima_varredura = ts_captura + energia.intervalo_varredura_s
+    except KeyboardInterrupt:
+        pass
+    decorrido = time.perf_counter() - inicio
+    log.info("Replay: %d mensagens em %.1f s (%.0f msg/s)", total, decorrido, total / max(decorrido, 1e-9))
+    if ts_captura is not None:
+        # Depois da última mensagem não há dados: nada fica consumindo até o "agora"
+        energia.encerrar(ts_captura)
+    if dashboard.armazem is not None:
+        dashboard.armazem.flush()
+    if servidor:
+        log.info("Replay terminado; dashboard segue no ar (Ctrl+C para sair)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    dashboard.parar_servicos()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay de capturas MQTT do EcoWork")
+    parser.add_argument("caminho", help="arquivo .ecap.gz ou diretório de capturas")
+    parser.add_argument("--velocidade", type=float, default=1.0,
+                        help="1 = tempo real, 10 = 10x mais rápido, 0 = o mais rápido possível")
+    parser.add_argument("--dispositivo", action="append", help="só estes dispositivos (repetível)")
+    parser.add_argument("--de", type=float, help="epoch inicial")
+    parser.add_argument("--ate", type=float, help="epoch final")
+    parser.add_argument("--servidor", action="store_true", help="sobe o dashboard durante o replay")
+    parser.add_argument("--banco", default=BANCO_REPLAY, help=f"banco SQLite do replay (padrão: {BANCO_REPLAY})")
+    parser.add_argument("--estado", default=ESTADO_REPLAY, help=f"estado salvo do replay (padrão: {ESTADO_REPLAY})")
+    args = parser.parse_args()
+    reproduzir(args.caminho, args.velocidade, set(args.dispositivo) if args.dispositivo else None,
+               args.de, args.ate, args.servidor, args.banco, args.estado)
+
+
+if __name__ == "__main__":
+    main()
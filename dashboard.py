@@ -1,148 +1,656 @@
-from flask import Flask, render_template_string
-from flask_socketio import SocketIO
+from flask import Flask, Response, has_request_context, jsonify, redirect, request, stream_with_context
+from flask_socketio import SocketIO, join_room, leave_room, rooms
 import paho.mqtt.client as mqtt
 import json
+import logging
+import os
+import signal
+import sys
 import time
+import urllib.parse
+import urllib.request
+import zlib
+from collections import deque
+
+from estado import EstadoFrota, STATUS_INICIAL
+from ingestao import PipelineIngestao, POLITICA_DESCARTAR_ANTIGA
+from historico import HistoricoFrota, METRICAS
+from persistencia import ArmazemTelemetria, TIERS, TIER_BRUTO, TIER_1M, TIER_1H, colunas_exportacao
+from downsampling import reduzir_colunas, escolher_tier, METODO_LTTB, METODOS
+from assets import PacoteAssets, Recurso, CACHE_REVALIDAR, PREFIXO_URL, TIPO_HTML
+from broadcast import (AgendadorBroadcast, MapaGrupos, SALA_FROTA, EVENTO_AGREGADOS_FROTA,
+                       sala_dispositivo, sala_grupo)
+from observabilidade import RegistroMetricas, configurar_logs, TIPO_CONTEUDO
+from formato_telemetria import decodificar_leituras, FormatoInvalido
+from energia import ContabilidadeEnergia, GRANULARIDADES, GRANULARIDADE_DIA
+from agregados import AgregadosFrota
+from regras import MotorRegras
+from barramento import GerenciadorBarramento, ESQUEMA as ESQUEMA_BARRAMENTO
+from captura import GravadorCaptura
+from estado_salvo import SalvamentoPeriodico
+from exportacao import (MedidorExportacao, FORMATO_CSV, TIPOS_CONTEUDO, EXTENSOES,
+                        TAMANHO_BLOCO, formatos_disponiveis)
 
 # =================================================================
 # ==== CONFIGURAÇÃO ECOWORK ====
 # =================================================================
 
 # ATENÇÃO: Use o MESMO broker que está no seu código do ESP32
-MQTT_BROKER = "broker.hivemq.com"
-MQTT_PORT = 1883
+MQTT_BROKER = os.environ.get("ECOWORK_BROKER", "broker.hivemq.com")
+MQTT_PORT = int(os.environ.get("ECOWORK_BROKER_PORTA", "1883"))
 MQTT_KEEPALIVE = 60
+# Reconexão ao broker: espera dobra a cada falha, de MIN até MAX segundos
+MQTT_RECONEXAO_MIN_S = 1
+MQTT_RECONEXAO_MAX_S = 120
 
 # ATENÇÃO: Use os MESMOS tópicos que estão no seu código do ESP32
-MQTT_TOPIC_TELEMETRIA = "ecowork/telemetria"
-MQTT_TOPIC_STATUS = "ecowork/status"
-MQTT_TOPIC_ALERTA = "ecowork/alerta"
+# Cada ESP32 publica em "ecowork/<device_id>/<tipo>", então o servidor
+# se inscreve com curinga ("+") e recebe a frota inteira.
+MQTT_TOPIC_PREFIXO = "ecowork"
+TIPO_TELEMETRIA = "telemetria"
+TIPO_STATUS = "status"
+TIPO_ALERTA = "alerta"
+MQTT_TOPIC_TELEMETRIA = f"{MQTT_TOPIC_PREFIXO}/+/{TIPO_TELEMETRIA}"
+MQTT_TOPIC_STATUS = f"{MQTT_TOPIC_PREFIXO}/+/{TIPO_STATUS}"
+MQTT_TOPIC_ALERTA = f"{MQTT_TOPIC_PREFIXO}/+/{TIPO_ALERTA}"
+
+# Tópicos antigos (sem device_id), ainda usados por firmwares não atualizados.
+# As mensagens deles são atribuídas a um dispositivo fixo.
+MQTT_TOPICS_LEGADOS = [f"{MQTT_TOPIC_PREFIXO}/{tipo}" for tipo in (TIPO_TELEMETRIA, TIPO_STATUS, TIPO_ALERTA)]
+DISPOSITIVO_LEGADO = "ecowork-hub"
 
 # Limiar do sensor LDR (do código C++ do ESP32)
 # No Wokwi, valor < 1500 significa LUZ ALTA (desliga a lâmpada)
 LIGHT_THRESHOLD_HIGH_LIGHT = 1500
 
+# Modo do servidor (variável de ambiente ECOWORK_MODO):
+# - "threading" (padrão): servidor de desenvolvimento do Werkzeug, uma thread por conexão
+# - "asyncio": produção; Socket.IO, HTTP e o cliente MQTT no mesmo event loop
+#   (precisa de: pip install uvicorn asgiref)
+MODO_THREADING = "threading"
+MODO_ASYNCIO = "asyncio"
+MODO_SERVIDOR = os.environ.get("ECOWORK_MODO", MODO_THREADING)
+# Debug só no modo de desenvolvimento (ECOWORK_DEBUG=0 desliga)
+DEBUG = MODO_SERVIDOR == MODO_THREADING and os.environ.get("ECOWORK_DEBUG", "1") == "1"
+HOST = os.environ.get("ECOWORK_HOST", "0.0.0.0")
+PORTA = int(os.environ.get("ECOWORK_PORTA", "5000"))
+
+# Modo multiprocesso (ver multiprocesso.py), um processo por partição:
+# - ECOWORK_PARTICAO="<i>/<n>": este processo só processa os dispositivos
+#   com crc32(device_id) % n == i (cada dispositivo tem um dono, então a
+#   ordem das mensagens de um dispositivo continua garantida)
+# - ECOWORK_FILA_MENSAGENS: fila do Socket.IO compartilhada entre os
+#   processos (barramento://host:porta, redis://..., amqp://...)
+PARTICAO_INDICE, PARTICAO_TOTAL = (int(x) for x in os.environ.get("ECOWORK_PARTICAO", "0/1").split("/"))
+FILA_MENSAGENS = os.environ.get("ECOWORK_FILA_MENSAGENS")
+
+# Logs (ver observabilidade.py): DEBUG mostra cada mensagem MQTT recebida;
+# INFO (padrão) só conexões e erros, com repetições limitadas
+LOG_NIVEL = os.environ.get("ECOWORK_LOG", "INFO")
+# Teto de séries por dispositivo no /metrics (o resto soma em "_outros")
+METRICAS_MAX_SERIES_DISPOSITIVO = 10000
+
+# Pipeline de ingestão (ver ingestao.py)
+# O on_message só enfileira; os workers decodificam e enviam ao frontend.
+INGESTAO_NUM_WORKERS = 4
+INGESTAO_CAPACIDADE_FILA = 20000
+INGESTAO_TAMANHO_LOTE = 256
+# "descartar_antiga", "descartar_nova" ou "bloquear"
+INGESTAO_POLITICA_FILA_CHEIA = POLITICA_DESCARTAR_ANTIGA
+
+# Broadcast em lotes (ver broadcast.py): o frontend recebe no máximo
+# um frame por evento a cada tick, só com o valor mais recente de cada dispositivo
+BROADCAST_INTERVALO_S = 0.25
+
+# Histórico em memória (ver historico.py), usado pelos gráficos e por /api/history
+HISTORICO_RETENCAO_S = 60 * 60        # guarda a última 1 hora de cada dispositivo
+HISTORICO_INTERVALO_LEITURA_S = 3.0   # READ_INTERVAL_MS do ESP32
+
+# Tier "mem" = buffers em memória; os outros vêm do banco
+TIER_MEMORIA = "mem"
+# Teto de pontos por resposta do /api/history (com "points", ver downsampling.py)
+HISTORY_MAX_PONTOS = 5000
+
+# Persistência em disco (ver persistencia.py): SQLite em modo WAL
+PERSISTENCIA_ATIVA = True
+# Com partições, cada processo grava os seus dispositivos no próprio arquivo
+PERSISTENCIA_ARQUIVO = "ecowork.db" if PARTICAO_TOTAL == 1 else f"ecowork-{PARTICAO_INDICE}.db"
+PERSISTENCIA_RETENCAO_BRUTO_S = 24 * 3600        # leituras de 3 s: 1 dia
+PERSISTENCIA_RETENCAO_1M_S = 30 * 24 * 3600      # min/média/max por minuto: 30 dias
+PERSISTENCIA_RETENCAO_1H_S = 2 * 365 * 24 * 3600 # min/média/max por hora: 2 anos
+# Exportação em massa (/api/exportar): intervalo padrão e máximo de dispositivos por filtro
+EXPORTACAO_PERIODO_PADRAO_S = 30 * 24 * 3600
+EXPORTACAO_MAX_DISPOSITIVOS = 10000
+
+# Captura do tráfego MQTT bruto para replay (ver captura.py). Ligada com
+# ECOWORK_CAPTURA=<diretório>; arquivos gzip rotativos
+CAPTURA_DIRETORIO = os.environ.get("ECOWORK_CAPTURA")
+CAPTURA_MAX_BYTES_ARQUIVO = 64 * 1024 * 1024   # antes da compressão
+CAPTURA_MAX_ARQUIVOS = 48
+
+# Último estado de cada dispositivo e acumuladores de energia salvos em disco
+# e restaurados no boot (ver estado_salvo.py): o dashboard não volta todo
+# "Aguardando..." e o consumo do dia/semana/mês não zera
+ESTADO_SALVO_ARQUIVO = "ecowork.estado" if PARTICAO_TOTAL == 1 else f"ecowork-{PARTICAO_INDICE}.estado"
+ESTADO_SALVO_INTERVALO_S = 30.0
+
+# Energia e CO2 (ver energia.py). Ajuste para o escritório real.
+ENERGIA_POTENCIAS_W = {
+    "lampada": 9.0,       # LED branco (LED_WHITE_PIN)
+    "ac": 1200.0,         # ar-condicionado (LED_RED_PIN)
+    "ventilador": 60.0,   # modo Eco (LED_GREEN_PIN)
+}
+# kg de CO2 por kWh da rede (média do SIN brasileiro, ~0,0385 t/MWh)
+ENERGIA_FATOR_EMISSAO_KG_KWH = 0.0385
+# Sem mensagens por mais que isso, o dispositivo conta como desligado. O
+# firmware limita o lote de leituras (TELEMETRIA_LOTE) a 80% disto
+ENERGIA_TEMPO_MAX_SEM_DADOS_S = 5 * 60
+# Alertas de clima do ESP32 -> (ar-condicionado, ventilador)
+ALERTAS_CLIMA = {
+    "Clima Quente. AC Ligado.": (True, False),
+    "Clima Frio. AC Desligado.": (False, False),
+    "Clima Confortavel. Modo Eco.": (False, True),
+}
+# Teto de períodos por consulta em /api/energia
+ENERGIA_MAX_PERIODOS = 62
+# Firmwares antigos republicam status e alertas a cada leitura (3 s). Um
+# status igual ao atual é descartado; um alerta igual ao último enviado da
+# mesma família (clima, ou o próprio texto) há menos disto não é reenviado
+# (o estado de AC/ventilador é aplicado mesmo assim)
+ALERTA_JANELA_REPETICAO_S = 60.0
+
+# Agregados da frota (ver agregados.py), enviados para a sala "frota"
+AGREGADOS_INTERVALO_S = 2.0
+AGREGADOS_TOP_K = 10
+# "Lâmpada acesa com luz natural": lâmpada Ligada com luminosidade abaixo
+# disso. Fica acima do LIGHT_THRESHOLD_HIGH_LIGHT (que já apaga a lâmpada)
+# para pegar salas razoavelmente claras com a luz acesa.
+AGREGADOS_LIMIAR_CLARO = 2000
+
+# Bibliotecas e fontes servidas localmente (baixe com: python baixar_assets.py)
+DIRETORIO_STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# Grupos de dispositivos (equipes/empresas) para as salas "grupo:<nome>"
+# Formato: {"equipe-a": ["24A160123ABC", "24A160456DEF"], ...}
+ARQUIVO_GRUPOS = "grupos.json"
+
+# Regras de alerta do servidor (ver regras.py). Com "regras.json" presente,
+# ele substitui REGRAS_PADRAO; formato:
+#   {"regras": [...], "sobrescritas": {"<device_id>": {"<regra>": {"limite": 30}}}}
+ARQUIVO_REGRAS = "regras.json"
+REGRAS_PADRAO = [
+    {"nome": "temperatura_alta", "metrica": "temperatura", "operador": ">", "limite": 30.0,
+     "histerese": 1.0, "duracao_s": 120, "mensagem": "Temperatura alta: {valor:.1f} °C"},
+    {"nome": "umidade_alta", "metrica": "umidade", "operador": ">", "limite": 80.0,
+     "histerese": 5.0, "duracao_s": 300, "mensagem": "Umidade alta: {valor:.0f}%"},
+    {"nome": "umidade_baixa", "metrica": "umidade", "operador": "<", "limite": 30.0,
+     "histerese": 5.0, "duracao_s": 300, "mensagem": "Umidade baixa: {valor:.0f}%"},
+]
+# Tempestade de alertas: no máximo isso de avisos por segundo (com rajada)
+REGRAS_MAX_AVISOS_POR_S = 20.0
+REGRAS_RAJADA_AVISOS = 100
+# Limite de salas por cliente (evita um navegador assinar a frota inteira, um a um)
+MAX_SALAS_POR_CLIENTE = 200
+
+# Snapshot enviado na conexão/inscrição: estado atual + histórico recente.
+# Os limites mantêm a mensagem pequena (primeira pintura rápida).
+SNAPSHOT_MAX_DISPOSITIVOS = 50
+SNAPSHOT_PONTOS_HISTORICO = 20      # MAX_DATA_POINTS dos gráficos
+SNAPSHOT_MAX_LISTA = 1000           # ids enviados para preencher o seletor
+SNAPSHOT_METRICAS = ("temperatura", "umidade", "luminosidade")
+
 # =================================================================
 # ==== Flask / SocketIO ====
 # =================================================================
 app = Flask(__name__)
 # O async_mode="threading" é importante para rodar o MQTT em background
-socketio = SocketIO(app, async_mode="threading", cors_allowed_origins="*")
+# Com FILA_MENSAGENS, um emit de qualquer processo chega aos clientes de todos
+if FILA_MENSAGENS is None:
+    _opcoes_fila = {}
+elif FILA_MENSAGENS.startswith(ESQUEMA_BARRAMENTO + "://"):
+    _opcoes_fila = {"client_manager": GerenciadorBarramento(FILA_MENSAGENS)}
+else:
+    _opcoes_fila = {"message_queue": FILA_MENSAGENS}
+socketio = SocketIO(app, async_mode="threading", cors_allowed_origins="*", **_opcoes_fila)
 
-# Variáveis globais para guardar o último estado
-ultimo_valor_telemetria = {}
-ultimo_valor_status = "Aguardando..."
-ultimo_valor_alerta = "Nenhum alerta recente."
+configurar_logs(LOG_NIVEL)
+log = logging.getLogger("ecowork")
+log_mqtt = logging.getLogger("ecowork.mqtt")
+
+# =================================================================
+# ==== Métricas (Prometheus, rota /metrics) ====
+# =================================================================
+registro_metricas = RegistroMetricas()
+mensagens_mqtt = registro_metricas.contador(
+    "ecowork_mqtt_mensagens_total", "Mensagens MQTT processadas por tipo e dispositivo",
+    ("tipo", "dispositivo"), max_series=METRICAS_MAX_SERIES_DISPOSITIVO)
+mensagens_repetidas = registro_metricas.contador(
+    "ecowork_mqtt_repetidas_total", "Status/alertas sem mudança, descartados sem reenviar", ("tipo",))
+topicos_ignorados = registro_metricas.contador(
+    "ecowork_mqtt_topicos_ignorados_total", "Mensagens em tópicos fora do padrão")
+erros_decodificacao = registro_metricas.contador(
+    "ecowork_mqtt_erros_decodificacao_total", "Payloads de telemetria inválidos (nem JSON nem binário)")
+erros_processamento = registro_metricas.contador(
+    "ecowork_mqtt_erros_processamento_total", "Erros inesperados ao processar mensagens")
+tempo_processamento = registro_metricas.histograma(
+    "ecowork_processamento_mensagem_segundos", "Tempo de processamento de cada mensagem MQTT")
+tempo_envio = registro_metricas.histograma(
+    "ecowork_broadcast_envio_segundos", "Tempo de cada tick de envio para as salas do Socket.IO")
+conexoes_mqtt = registro_metricas.contador("ecowork_mqtt_conexoes_total", "Conexões aceitas pelo broker")
+reconexoes_mqtt = registro_metricas.contador("ecowork_mqtt_reconexoes_total", "Conexões ao broker depois da primeira")
+avisos_regras = registro_metricas.contador(
+    "ecowork_regras_avisos_total", "Avisos das regras de alerta do servidor", ("regra", "evento"),
+    max_series=METRICAS_MAX_SERIES_DISPOSITIVO)
+
+def contar_clientes(manager):
+    # O python-socketio põe todo cliente conectado na sala None do namespace
+    return len(manager.rooms.get("/", {}).get(None, ()))
+
+registro_metricas.medidor("ecowork_ingestao_fila_profundidade", "Mensagens esperando nas filas da ingestão",
+                 lambda: pipeline_ingestao.metricas()["profundidade"])
+registro_metricas.medidor("ecowork_ingestao_descartadas_total", "Mensagens descartadas com a fila cheia",
+                 lambda: pipeline_ingestao.metricas()["descartadas"], tipo="counter")
+medidor_clientes = registro_metricas.medidor("ecowork_socketio_clientes", "Clientes Socket.IO conectados",
+                                    lambda: contar_clientes(socketio.server.manager))
+registro_metricas.medidor("ecowork_dispositivos", "Dispositivos conhecidos", lambda: len(estado_frota))
+registro_metricas.medidor("ecowork_energia_potencia_frota_watts", "Potência somada das cargas ligadas na frota",
+                          lambda: energia.metricas()["potencia_frota_w"])
+registro_metricas.medidor("ecowork_regras_suprimidos_total", "Avisos descartados pelo limite global de alertas",
+                          lambda: motor_regras.suprimidos, tipo="counter")
+
+class MetricasSnapshot:
+    # Guarda as últimas medições (janela fixa) para p50/p95/máx.
+    def __init__(self, janela=500):
+        self.montagens_ms = deque(maxlen=janela)
+        self.primeiras_pinturas_ms = deque(maxlen=janela)
+
+    def registrar_montagem(self, segundos):
+        self.montagens_ms.append(segundos * 1000)
+
+    def registrar_primeira_pintura(self, ms):
+        self.primeiras_pinturas_ms.append(float(ms))
+
+    @staticmethod
+    def _estatisticas(valores):
+        if not valores:
+            return {"n": 0}
+        ordenados = sorted(valores)
+        return {
+            "n": len(ordenados),
+            "p50": ordenados[len(ordenados) // 2],
+            "p95": ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))],
+            "max": ordenados[-1],
+        }
+
+    def resumo(self):
+        return {
+            "montagem_ms": self._estatisticas(list(self.montagens_ms)),
+            "primeira_pintura_ms": self._estatisticas(list(self.primeiras_pinturas_ms)),
+        }
+
+metricas_snapshot = MetricasSnapshot()
+medidor_exportacao = MedidorExportacao()
+
+def sala_tem_ouvintes(sala):
+    # Evita serializar lotes para salas sem ninguém. Com a fila compartilhada,
+    # os ouvintes podem estar em outro processo: envia sempre.
+    if FILA_MENSAGENS is not None:
+        return True
+    return bool(socketio.server.manager.rooms.get("/", {}).get(sala))
+
+def resumo_frota(n_atualizacoes):
+    # "particao": no modo multiprocesso cada processo manda o resumo da sua parte
+    return {"dispositivos": len(estado_frota), "atualizacoes": n_atualizacoes, "particao": PARTICAO_INDICE}
+
+# Médias, percentis, ocupação e top-k de energia da frota inteira
+agregados = AgregadosFrota(AGREGADOS_LIMIAR_CLARO, AGREGADOS_TOP_K, ENERGIA_TEMPO_MAX_SEM_DADOS_S)
+
+mapa_grupos = MapaGrupos.de_arquivo(ARQUIVO_GRUPOS) if os.path.exists(ARQUIVO_GRUPOS) else MapaGrupos()
+broadcast = AgendadorBroadcast(
+    lambda evento, dados, sala: socketio.emit(evento, dados, to=sala),
+    intervalo=BROADCAST_INTERVALO_S,
+    mapa_grupos=mapa_grupos,
+    sala_ativa=sala_tem_ouvintes,
+    resumo_frota=resumo_frota,
+    observar_envio=tempo_envio.observar,
+    periodicos=[(EVENTO_AGREGADOS_FROTA, SALA_FROTA, AGREGADOS_INTERVALO_S,
+                 lambda: {**agregados.resumo(), "particao": PARTICAO_INDICE})],
+)
+
+# Último estado de cada dispositivo (shards com lock, ver estado.py)
+estado_frota = EstadoFrota()
+# Séries recentes de cada dispositivo (buffers circulares de tamanho fixo)
+historico = HistoricoFrota(HISTORICO_RETENCAO_S, HISTORICO_INTERVALO_LEITURA_S)
+# Leituras em disco, gravadas em lotes por uma thread própria. O banco só é
+# aberto em iniciar_servicos(): um "import dashboard" (benchmarks, replay)
+# não cria arquivos no diretório atual
+armazem = None
+# kWh e CO2 por dispositivo e da frota, somados a cada evento
+energia = ContabilidadeEnergia(
+    ENERGIA_POTENCIAS_W, ENERGIA_FATOR_EMISSAO_KG_KWH, ENERGIA_TEMPO_MAX_SEM_DADOS_S)
+# Estado da frota e acumuladores de energia em disco (reinício a quente)
+salvamento_estado = SalvamentoPeriodico(estado_frota, ESTADO_SALVO_ARQUIVO, ESTADO_SALVO_INTERVALO_S, energia)
+# Mensagens MQTT brutas em disco, para replay (None = captura desligada)
+gravador_captura = GravadorCaptura(
+    CAPTURA_DIRETORIO,
+    prefixo="captura" if PARTICAO_TOTAL == 1 else f"captura-p{PARTICAO_INDICE}",
+    max_bytes_arquivo=CAPTURA_MAX_BYTES_ARQUIVO,
+    max_arquivos=CAPTURA_MAX_ARQUIVOS,
+) if CAPTURA_DIRETORIO else None
+# Regras de alerta compiladas uma vez, avaliadas a cada lote da ingestão
+_opcoes_regras = {"max_avisos_por_s": REGRAS_MAX_AVISOS_POR_S, "rajada_avisos": REGRAS_RAJADA_AVISOS}
+motor_regras = (MotorRegras.de_arquivo(ARQUIVO_REGRAS, **_opcoes_regras) if os.path.exists(ARQUIVO_REGRAS)
+                else MotorRegras(REGRAS_PADRAO, **_opcoes_regras))
 
 # =================================================================
 # ==== Callbacks MQTT (Paho V1 API) ====
 # =================================================================
 def on_connect(client, userdata, flags, rc):
-    print(f"[MQTT] Conectado ao broker. Código: {rc}")
-    
-    # Se inscreve nos 3 tópicos do projeto EcoWork
-    client.subscribe(MQTT_TOPIC_TELEMETRIA)
-    client.subscribe(MQTT_TOPIC_STATUS)
-    client.subscribe(MQTT_TOPIC_ALERTA)
-    
-    print(f"[MQTT] Inscrito em: {MQTT_TOPIC_TELEMETRIA}")
-    print(f"[MQTT] Inscrito em: {MQTT_TOPIC_STATUS}")
-    print(f"[MQTT] Inscrito em: {MQTT_TOPIC_ALERTA}")
+    log_mqtt.info("Conectado ao broker. Código: %s", rc)
+    if conexoes_mqtt.valor():
+        reconexoes_mqtt.inc()
+    conexoes_mqtt.inc()
+
+    # Se inscreve nos 3 tópicos do projeto EcoWork (curinga = frota inteira)
+    for topico in (MQTT_TOPIC_TELEMETRIA, MQTT_TOPIC_STATUS, MQTT_TOPIC_ALERTA, *MQTT_TOPICS_LEGADOS):
+        client.subscribe(topico)
+        log_mqtt.info("Inscrito em: %s", topico)
+
+def on_disconnect(client, userdata, rc):
+    if rc != 0:
+        log_mqtt.warning("Conexão com o broker perdida. Código: %s", rc)
+
+def on_connect_fail(client, userdata):
+    # Só no modo threading (connect_async): o loop tenta de novo sozinho
+    log_mqtt.warning("Falha ao conectar em %s:%s, tentando de novo", MQTT_BROKER, MQTT_PORT)
+
+def analisar_topico(topic):
+    # "ecowork/<device_id>/<tipo>" -> (device_id, tipo)
+    # "ecowork/<tipo>" (legado)   -> (DISPOSITIVO_LEGADO, tipo)
+    partes = topic.split("/")
+    if len(partes) == 3 and partes[0] == MQTT_TOPIC_PREFIXO:
+        return partes[1], partes[2]
+    if len(partes) == 2 and partes[0] == MQTT_TOPIC_PREFIXO:
+        return DISPOSITIVO_LEGADO, partes[1]
+    return None, None
+
+def particao_do_dispositivo(device_id):
+    # crc32 e não hash(): precisa dar o mesmo resultado em todos os processos
+    return zlib.crc32(device_id.encode("utf-8")) % PARTICAO_TOTAL
+
+def eh_da_particao(topic):
+    device_id = analisar_topico(topic)[0]
+    return device_id is None or particao_do_dispositivo(device_id) == PARTICAO_INDICE
 
 def on_message(client, userdata, msg):
-    global ultimo_valor_telemetria, ultimo_valor_status, ultimo_valor_alerta
-    
+    # Roda na thread de rede do paho: só enfileira e retorna na hora,
+    # para nunca atrasar a leitura do socket nem o keepalive do broker
+    if PARTICAO_TOTAL > 1 and not eh_da_particao(msg.topic):
+        return  # outro processo é o dono deste dispositivo
+    ts = time.time()
+    if gravador_captura is not None:
+        gravador_captura.registrar(ts, msg.topic, msg.payload)
+    pipeline_ingestao.enfileirar(msg.topic, msg.payload, ts)
+
+def processar_lote(lote):
+    # Chamado pelos workers do pipeline com uma lista de (topic, payload, ts)
+    leituras = []
+    for topic, payload, ts_recebimento in lote:
+        with tempo_processamento.cronometrar():
+            leituras_mensagem = processar_mensagem(topic, payload, ts_recebimento)
+        if leituras_mensagem:
+            leituras.extend(leituras_mensagem)
+    # As regras veem o lote inteiro de uma vez (na ordem de chegada)
+    if leituras:
+        avisar_regras(motor_regras.avaliar_lote(leituras))
+
+def avisar_regras(eventos):
+    # Disparos/normalizações das regras viram 'novo_alerta', como os do firmware
+    for device_id, ts, evento, regra, valor, mensagem in eventos:
+        avisos_regras.inc(regra, evento)
+        with estado_frota.registro(device_id) as registro:
+            registro.alerta = mensagem
+        broadcast.publicar("novo_alerta", device_id, mensagem)
+        log.info("Regra %s %s (%s): %s", regra, evento, device_id, mensagem)
+
+def status_lampada(registro, dados_json):
+    # --- LÓGICA DA LÂMPADA CORRIGIDA ---
+    # A lógica agora depende do status de presença DESTE dispositivo!
     try:
-        # Pega o tópico e o payload (mensagem)
-        topic = msg.topic
-        payload_str = msg.payload.decode("utf-8", errors="replace").strip()
-        print(f"[MQTT] Mensagem recebida | Tópico: {topic} | Payload: {payload_str}")
+        # Só pode estar "Ligada" se o status for "Presente"
+        if registro.status == "Presente" and dados_json.get('luminosidade') is not None:
+
+            if dados_json['luminosidade'] < LIGHT_THRESHOLD_HIGH_LIGHT:
+                # Presente, mas com luz alta (claro)
+                return "Desligada"
+            # Presente e com luz baixa (escuro)
+            return "Ligada"
+        # Se está "Ausente" ou não tem dados, a lâmpada está "Desligada"
+        return "Desligada"
+    except Exception:
+        return "N/A" # Caso o dado venha quebrado
+    # --- FIM DA LÓGICA DA LÂMPADA ---
+
+def processar_mensagem(topic, payload, ts_recebimento):
+    # Retorna [(device_id, ts, dados)] da telemetria, para as regras de alerta
+    try:
+        log_mqtt.debug("Mensagem recebida | Tópico: %s | Payload: %r", topic, payload)
+
+        device_id, tipo = analisar_topico(topic)
+        if device_id is None:
+            topicos_ignorados.inc()
+            log_mqtt.warning("Tópico fora do padrão ignorado: %s", topic)
+            return
+        mensagens_mqtt.inc(tipo, device_id)
+        # Status e alerta são texto; a telemetria é decodificada direto dos bytes
+        payload_str = "" if tipo == TIPO_TELEMETRIA else payload.decode("utf-8", errors="replace").strip()
 
         # LÓGICA DE ROTEAMENTO DE MENSAGEM
-        # 1. Se for uma mensagem de TELEMETRIA (JSON)
-        if topic == MQTT_TOPIC_TELEMETRIA:
-            dados_json = json.loads(payload_str)
-            
-            # --- LÓGICA DA LÂMPADA CORRIGIDA ---
-            # A lógica agora depende do status de presença!
-            try:
-                # Só pode estar "Ligada" se o status for "Presente"
-                if ultimo_valor_status == "Presente" and dados_json.get('luminosidade') is not None:
-                    
-                    if dados_json['luminosidade'] < LIGHT_THRESHOLD_HIGH_LIGHT:
-                        # Presente, mas com luz alta (claro)
-                        dados_json['lamp_status'] = "Desligada"
-                    else:
-                        # Presente e com luz baixa (escuro)
-                        dados_json['lamp_status'] = "Ligada"
-                else:
-                    # Se está "Ausente" ou não tem dados, a lâmpada está "Desligada"
-                    dados_json['lamp_status'] = "Desligada"
-            except Exception:
-                dados_json['lamp_status'] = "N/A" # Caso o dado venha quebrado
-            # --- FIM DA LÓGICA DA LÂMPADA ---
-            
-            ultimo_valor_telemetria = dados_json
-            # Envia para o frontend no evento 'atualiza_telemetria'
-            socketio.emit("atualiza_telemetria", {"valor": dados_json})
-            print(f"[MQTT->SocketIO] Telemetria enviada: {dados_json}")
+        # 1. Se for uma mensagem de TELEMETRIA (JSON, binário ou lote de
+        #    leituras, ver formato_telemetria.py)
+        if tipo == TIPO_TELEMETRIA:
+            # [(ts, dados)], da leitura mais antiga para a mais nova
+            leituras = [(ts_recebimento - idade_s, dados_json)
+                        for idade_s, dados_json in decodificar_leituras(payload)]
+
+            # O lock do shard garante que o status lido aqui é o do próprio
+            # dispositivo e não muda no meio da lógica da lâmpada
+            with estado_frota.registro(device_id) as registro:
+                for _, dados_json in leituras:
+                    dados_json['lamp_status'] = status_lampada(registro, dados_json)
+                registro.telemetria = leituras[-1][1]
+
+            for ts, dados_json in leituras:
+                # Timestamp do servidor (o ESP32 não tem relógio confiável)
+                historico.registrar(device_id, ts, dados_json)
+                if armazem is not None:
+                    armazem.registrar(device_id, ts, dados_json)
+                agregados.registrar_energia(device_id, *energia.atualizar(
+                    device_id, ts, lampada=dados_json.get('lamp_status') == "Ligada"))
+            ts, dados_json = leituras[-1]
+            agregados.registrar_telemetria(device_id, dados_json, ts)
+
+            # Agenda o envio no evento 'atualiza_telemetria' (vai no próximo lote).
+            # De um lote de leituras, só a mais nova vai para os navegadores
+            broadcast.publicar("atualiza_telemetria", device_id, dados_json)
+            log_mqtt.debug("Telemetria agendada (%s, %d leituras): %s", device_id, len(leituras), dados_json)
+            return [(device_id, ts, dados) for ts, dados in leituras]
 
         # 2. Se for uma mensagem de STATUS (String)
-        elif topic == MQTT_TOPIC_STATUS:
-            ultimo_valor_status = payload_str
-            # Envia para o frontend no evento 'atualiza_status'
-            socketio.emit("atualiza_status", {"valor": payload_str})
-            print(f"[MQTT->SocketIO] Status enviado: {payload_str}")
-            
-            # --- GATILHO EXTRA ---
-            # Se o status mudou, força uma re-avaliação da lâmpada
-            # Isso corrige o status da lâmpada IMEDIATAMENTE quando o usuário sai
-            if ultimo_valor_status == "Ausente":
-                # É importante atualizar o .get() para evitar erro se 'ultimo_valor_telemetria' estiver vazio
-                if ultimo_valor_telemetria.get('lamp_status') != "Desligada":
-                    ultimo_valor_telemetria['lamp_status'] = "Desligada"
-                    socketio.emit("atualiza_telemetria", {"valor": ultimo_valor_telemetria})
-                    print(f"[MQTT->SocketIO] Forçando status da lâmpada para Desligada (Ausente)")
+        elif tipo == TIPO_STATUS:
+            telemetria_corrigida = None
+            with estado_frota.registro(device_id) as registro:
+                repetido = registro.status == payload_str
+                registro.status = payload_str
+                if not repetido:
+                    # Com o status novo o firmware reenvia os alertas (ex: volta do
+                    # Ausente com "AC Ligado"): nenhum deles conta como repetido
+                    registro.alertas_vistos.clear()
+                
+                # --- GATILHO EXTRA ---
+                # Se o status mudou, força uma re-avaliação da lâmpada
+                # Isso corrige o status da lâmpada IMEDIATAMENTE quando o usuário sai
+                if payload_str == "Ausente":
+                    # É importante usar o .get() para evitar erro se a telemetria ainda estiver vazia
+                    if registro.telemetria.get('lamp_status') != "Desligada":
+                        # Cria um dict novo: o anterior pode ainda estar a caminho do frontend
+                        telemetria_corrigida = {**registro.telemetria, 'lamp_status': "Desligada"}
+                        registro.telemetria = telemetria_corrigida
+
+            if repetido and telemetria_corrigida is None:
+                # Nada mudou: sem agregados, energia nem envio aos navegadores
+                mensagens_repetidas.inc(tipo)
+                return
+            agregados.registrar_status(device_id, payload_str, ts_recebimento)
+            if payload_str == "Ausente":
+                # Sem ninguém, o firmware desliga lâmpada, AC e ventilador
+                agregados.registrar_energia(device_id, *energia.desligar_tudo(device_id, ts_recebimento))
+
+            # Agenda o envio no evento 'atualiza_status' (vai no próximo lote)
+            broadcast.publicar("atualiza_status", device_id, payload_str)
+            log_mqtt.debug("Status agendado (%s): %s", device_id, payload_str)
+            if telemetria_corrigida is not None:
+                broadcast.publicar("atualiza_telemetria", device_id, telemetria_corrigida)
+                log_mqtt.debug("Forçando status da lâmpada para Desligada (%s Ausente)", device_id)
 
         # 3. Se for uma mensagem de ALERTA (String)
-        elif topic == MQTT_TOPIC_ALERTA:
-            ultimo_valor_alerta = payload_str
-            # Envia para o frontend no evento 'novo_alerta'
-            socketio.emit("novo_alerta", {"valor": payload_str})
-            print(f"[MQTT->SocketIO] Alerta enviado: {payload_str}")
-
-    except json.JSONDecodeError:
-        print(f"[MQTT] Erro: A mensagem no tópico de telemetria não era um JSON. Payload: {payload_str}")
+        elif tipo == TIPO_ALERTA:
+            clima = ALERTAS_CLIMA.get(payload_str)
+            familia = "clima" if clima is not None else payload_str
+            with estado_frota.registro(device_id) as registro:
+                anterior = registro.alertas_vistos.get(familia)
+                repetido = (anterior is not None and anterior[0] == payload_str
+                            and ts_recebimento - anterior[1] < ALERTA_JANELA_REPETICAO_S)
+                if not repetido:
+                    # A janela conta a partir do último envio: repetições não a estendem
+                    registro.alertas_vistos[familia] = (payload_str, ts_recebimento)
+                    registro.alerta = payload_str
+            # O estado das cargas vale sempre (o AC pode ter sido desligado por
+            # um Ausente no meio); repetido só evita reenviar aos navegadores
+            if clima is not None:
+                agregados.registrar_energia(device_id, *energia.atualizar(
+                    device_id, ts_recebimento, ac=clima[0], ventilador=clima[1]))
+            if repetido:
+                mensagens_repetidas.inc(tipo)
+                return
+            # Agenda o envio no evento 'novo_alerta' (vai no próximo lote)
+            broadcast.publicar("novo_alerta", device_id, payload_str)
+            log_mqtt.debug("Alerta agendado (%s): %s", device_id, payload_str)
+
+    except (json.JSONDecodeError, UnicodeDecodeError, FormatoInvalido) as e:
+        erros_decodificacao.inc()
+        log_mqtt.warning("Erro: telemetria inválida (nem JSON nem binário): %s. Payload: %r", e, payload[:64])
     except Exception as e:
-        print(f"[MQTT] Erro ao processar payload: {e}")
+        erros_processamento.inc()
+        log_mqtt.error("Erro ao processar payload: %s", e)
+
+# ---- Configura e inicia o pipeline de ingestão ----
+def chave_particao(topic):
+    # Mesmo dispositivo -> mesmo worker -> mensagens processadas em ordem
+    return analisar_topico(topic)[0]
 
-# ---- Configura e inicia o cliente MQTT ----
+pipeline_ingestao = PipelineIngestao(
+    processar_lote,
+    num_workers=INGESTAO_NUM_WORKERS,
+    capacidade=INGESTAO_CAPACIDADE_FILA,
+    politica=INGESTAO_POLITICA_FILA_CHEIA,
+    tamanho_lote=INGESTAO_TAMANHO_LOTE,
+    chave_particao=chave_particao,
+)
+# ---- Configura o cliente MQTT ----
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
 client.on_connect = on_connect
+client.on_disconnect = on_disconnect
+client.on_connect_fail = on_connect_fail
 client.on_message = on_message
 
-client.connect(MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE)
-client.loop_start() # Inicia o loop em uma thread separada
+# ---- Inicialização (chamada no __main__, não na importação) ----
+def restaurar_estado():
+    # Antes do MQTT: os primeiros navegadores já recebem o último estado conhecido
+    if salvamento_estado.restaurar():
+        # Os agregados da frota também partem do estado restaurado
+        for estado in estado_frota.snapshot():
+            if estado["status"] != STATUS_INICIAL:
+                agregados.registrar_status(estado["dispositivo"], estado["status"], estado["atualizado_em"])
+            if estado["telemetria"]:
+                agregados.registrar_telemetria(estado["dispositivo"], estado["telemetria"], estado["atualizado_em"])
+    # O ranking de energia do dia volta com os acumuladores restaurados
+    for device_id, dia, kwh in energia.kwh_do_dia():
+        agregados.registrar_energia(device_id, dia, kwh)
+
+def abrir_armazem():
+    global armazem
+    if PERSISTENCIA_ATIVA and armazem is None:
+        armazem = ArmazemTelemetria(
+            PERSISTENCIA_ARQUIVO,
+            retencao_bruto_s=PERSISTENCIA_RETENCAO_BRUTO_S,
+            retencao_1m_s=PERSISTENCIA_RETENCAO_1M_S,
+            retencao_1h_s=PERSISTENCIA_RETENCAO_1H_S,
+        )
+    return armazem
+
+def expirar_calados(agora=None):
+    # Dispositivos calados há mais de ENERGIA_TEMPO_MAX_SEM_DADOS_S: cargas
+    # desligadas e fora dos agregados. Roda na varredura da energia; o
+    # replay chama com o horário da captura
+    agora = time.time() if agora is None else agora
+    energia.expirar(agora)
+    agregados.expirar(agora)
+
+def iniciar_servicos(replay=False):
+    # Threads de processamento, comuns aos dois modos de servidor. No replay
+    # (captura.py) o relógio é o da captura: sem restaurar o estado salvo,
+    # sem salvamento periódico e sem a varredura de energia pelo relógio de
+    # parede (o replay chama expirar_calados() com o horário das mensagens)
+    if not replay:
+        restaurar_estado()
+        salvamento_estado.iniciar()
+    if abrir_armazem() is not None:
+        armazem.iniciar()
+    if gravador_captura is not None:
+        gravador_captura.iniciar()
+    if not replay:
+        energia.iniciar(expirar_calados)
+    pipeline_ingestao.iniciar()
+
+def parar_servicos():
+    # Ordem inversa: esvazia a fila, depois grava estado, energia e banco
+    pipeline_ingestao.parar()
+    salvamento_estado.parar()
+    energia.parar()
+    if armazem is not None:
+        armazem.parar()
+    if gravador_captura is not None:
+        gravador_captura.parar()
+
+def iniciar_modo_threading():
+    iniciar_servicos()
+    broadcast.iniciar(socketio.start_background_task, socketio.sleep)
+    # connect_async não bloqueia: a thread do loop conecta em segundo plano
+    # (broker fora do ar não impede o servidor web de subir) e reconecta
+    # sozinha, com a espera dobrando a cada falha
+    client.reconnect_delay_set(MQTT_RECONEXAO_MIN_S, MQTT_RECONEXAO_MAX_S)
+    client.connect_async(MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE)
+    client.loop_start() # Inicia o loop em uma thread separada
 
 # =================================================================
 # ==== Página Web (HTML/CSS/JS) ====
 # =================================================================
-@app.route("/")
-def index():
-    # Este HTML foi 100% adaptado para o projeto EcoWork
-    return render_template_string("""
+# Este HTML foi 100% adaptado para o projeto EcoWork
+# É renderizado uma única vez na inicialização (ver pagina_dashboard abaixo)
+TEMPLATE_DASHBOARD = """
 <!DOCTYPE html>
 <html lang="pt-BR">
 <head>
     <meta charset="UTF-8" />
     <meta name="viewport" content="width=device-width, initial-scale=1.0"/>
     <title>EcoWork Hub - Dashboard</title>
-    <link rel="stylesheet" href="https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/css/bootstrap.min.css">
-    <script src="https://code.jquery.com/jquery-3.5.1.min.js"></script>
-    <script src="https://cdn.socket.io/4.7.2/socket.io.min.js"></script>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js@3.7.0/dist/chart.min.js"></script>
-    <script src="https://cdn.jsdelivr.net/npm/chartjs-adapter-date-fns/dist/chartjs-adapter-date-fns.bundle.min.js"></script>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&display=swap" rel="stylesheet">
+    {% for url in estilos %}
+    <link rel="stylesheet" href="{{ url }}">
+    {% endfor %}
+    {% for url in scripts %}
+    <script src="{{ url }}"></script>
+    {% endfor %}
     <style>
         :root {
             --eco-green: #2d8a4a;
@@ -250,6 +758,13 @@ def index():
 <body>
     <div class="container">
         <h1 class="mt-4 text-center">Dashboard de Sustentabilidade <span class="eco-title">EcoWork</span></h1>
+
+        <div class="form-inline justify-content-center">
+            <label for="device-select" class="mr-2">Dispositivo:</label>
+            <select id="device-select" class="form-control">
+                <option value="">Aguardando dispositivos...</option>
+            </select>
+        </div>
         
         <div class="row">
             <div class="col-md-3">
@@ -328,6 +843,76 @@ def index():
             </div>
         </div>
 
+        <div class="row">
+            <div class="col-md-6">
+                <div class="card text-center">
+                    <div class="card-body">
+                        <h5 class="card-title">⚡ Energia Hoje (Dispositivo)</h5>
+                        <p class="kpi-value">
+                            <span id="val-kwh">--</span> <small>kWh</small>
+                        </p>
+                        <p class="text-muted mb-0"><span id="val-co2">--</span> kg CO₂ · semana: <span id="val-kwh-semana">--</span> kWh</p>
+                    </div>
+                </div>
+            </div>
+            <div class="col-md-6">
+                <div class="card text-center">
+                    <div class="card-body">
+                        <h5 class="card-title">🌎 Energia Hoje (Frota)</h5>
+                        <p class="kpi-value">
+                            <span id="val-kwh-frota">--</span> <small>kWh</small>
+                        </p>
+                        <p class="text-muted mb-0"><span id="val-co2-frota">--</span> kg CO₂ · agora: <span id="val-potencia-frota">--</span> W</p>
+                    </div>
+                </div>
+            </div>
+        </div>
+
+        <!-- Visão da frota (evento 'agregados_frota', a cada poucos segundos) -->
+        <div class="row">
+            <div class="col-md-3">
+                <div class="card text-center">
+                    <div class="card-body">
+                        <h5 class="card-title">🏢 Frota: Clima Médio</h5>
+                        <p class="kpi-value">
+                            <span id="val-temp-media">--</span> <small>°C</small>
+                        </p>
+                        <p class="text-muted mb-0">umidade <span id="val-umid-media">--</span>% · p90 <span id="val-temp-p90">--</span> °C</p>
+                    </div>
+                </div>
+            </div>
+            <div class="col-md-3">
+                <div class="card text-center">
+                    <div class="card-body">
+                        <h5 class="card-title">👥 Escritórios Ocupados</h5>
+                        <p class="kpi-value">
+                            <span id="val-ocupacao">--</span> <small>%</small>
+                        </p>
+                        <p class="text-muted mb-0"><span id="val-presentes">--</span> de <span id="val-dispositivos-frota">--</span> dispositivos</p>
+                    </div>
+                </div>
+            </div>
+            <div class="col-md-3">
+                <div class="card text-center">
+                    <div class="card-body">
+                        <h5 class="card-title">🔆 Luz Acesa com Sol</h5>
+                        <p class="kpi-value">
+                            <span id="val-desperdicio">--</span>
+                        </p>
+                        <p class="text-muted mb-0">lâmpadas ligadas em sala clara</p>
+                    </div>
+                </div>
+            </div>
+            <div class="col-md-3">
+                <div class="card">
+                    <div class="card-body">
+                        <h5 class="card-title text-center">🏆 Maior Consumo Hoje</h5>
+                        <ol id="lista-top-energia" class="mb-0 small"></ol>
+                    </div>
+                </div>
+            </div>
+        </div>
+
         <div class="row">
             <div class="col-md-4">
                 <div class="card">
@@ -365,8 +950,16 @@ def index():
 
     <script>
         $(function() {
+            // Dispositivo exibido (lembrado entre recargas da página)
+            let dispositivoAtual = localStorage.getItem('ecowork.dispositivo');
+
             // Conecta ao servidor SocketIO
-            const socket = io({ transports: ['websocket', 'polling'] });
+            // O "auth" vai a cada (re)conexão: o servidor já coloca o cliente nas
+            // salas certas e responde na hora com um 'snapshot' do estado atual
+            const socket = io({
+                transports: ['websocket', 'polling'],
+                auth: (cb) => cb({ frota: true, dispositivos: dispositivoAtual ? [dispositivoAtual] : [] })
+            });
             const MAX_DATA_POINTS = 20; // Pontos no gráfico
 
             // Configurações comuns dos gráficos
@@ -448,7 +1041,81 @@ def index():
                 options: { ...commonChartOptions, plugins: { ...commonChartOptions.plugins, title: { display: true, text: 'Histórico de Luminosidade' } } }
             });
 
+            // --- Seleção de dispositivo ---
+            const dispositivosConhecidos = new Set();
+
+            function registrarDispositivo(id) {
+                if (!dispositivosConhecidos.has(id)) {
+                    dispositivosConhecidos.add(id);
+                    if (dispositivosConhecidos.size === 1) $('#device-select').empty();
+                    $('#device-select').append($('<option>').val(id).text(id));
+                }
+                return id === dispositivoAtual;
+            }
+
+            function limparPainel() {
+                $('#val-temp, #val-hum, #val-lum, #val-dist, #val-lamp').text('--');
+                $('#val-status').text('Aguardando...');
+                $('#val-alerta').text('Nenhum alerta recente.');
+                $('#val-ts').text('Aguardando dados...');
+                $('#val-kwh, #val-co2, #val-kwh-semana').text('--');
+                $('#lamp-card').css('background-color', '#fff');
+                [tempChart, humChart, lumChart].forEach((chart) => {
+                    chart.data.labels = [];
+                    chart.data.datasets[0].data = [];
+                    chart.update();
+                });
+            }
+
+            // O servidor só envia o que o cliente assina (salas do Socket.IO)
+            // e responde cada inscrição com um 'snapshot'
+            function inscrever() {
+                const pedido = { frota: true, dispositivos: dispositivoAtual ? [dispositivoAtual] : [] };
+                socket.emit('inscrever', pedido);
+            }
+
+            function selecionarDispositivo(id) {
+                dispositivoAtual = id;
+                localStorage.setItem('ecowork.dispositivo', id);
+                $('#device-select').val(id);
+                limparPainel();
+                inscrever();
+                atualizarEnergia();
+            }
+
+            function carregarDispositivos() {
+                $.getJSON('/api/dispositivos', (resp) => {
+                    resp.dispositivos.forEach(registrarDispositivo);
+                });
+            }
+
+            // --- Energia (ver /api/energia): atualizada a cada 30 s ---
+            function atualizarEnergia() {
+                const hoje = (resp) => resp.series[resp.series.length - 1];
+                $.getJSON('/api/energia', { periodo: 'dia', n: 1 }, (resp) => {
+                    $('#val-kwh-frota').text(hoje(resp).kwh.total.toFixed(3));
+                    $('#val-co2-frota').text(hoje(resp).co2_kg.toFixed(3));
+                    const w = Object.values(resp.potencia_atual_w).reduce((a, b) => a + b, 0);
+                    $('#val-potencia-frota').text(w.toFixed(0));
+                });
+                if (!dispositivoAtual) return;
+                $.getJSON('/api/energia', { device: dispositivoAtual, periodo: 'dia', n: 1 }, (resp) => {
+                    $('#val-kwh').text(hoje(resp).kwh.total.toFixed(3));
+                    $('#val-co2').text(hoje(resp).co2_kg.toFixed(3));
+                }).fail(() => $('#val-kwh, #val-co2').text('--'));
+                $.getJSON('/api/energia', { device: dispositivoAtual, periodo: 'semana', n: 1 }, (resp) => {
+                    $('#val-kwh-semana').text(hoje(resp).kwh.total.toFixed(2));
+                }).fail(() => $('#val-kwh-semana').text('--'));
+            }
+            atualizarEnergia();
+            setInterval(atualizarEnergia, 30000);
+
+            $('#device-select').on('change', function() {
+                selecionarDispositivo($(this).val());
+            });
+
             // --- Função para atualizar gráficos ---
+            // Só empilha o ponto; o chart.update() é feito uma vez por lote
             function updateChart(chart, label, data) {
                 chart.data.labels.push(label);
                 chart.data.datasets[0].data.push(data);
@@ -456,81 +1123,564 @@ def index():
                     chart.data.labels.shift();
                     chart.data.datasets[0].data.shift();
                 }
-                chart.update();
+            }
+
+            // ---- LÓGICA DA LUMINOSIDADE EM % ----
+            function lumParaPercentual(lum_raw) {
+                // Converte 0-4095 (invertido) para 0-100%
+                // Clamp: Garante que o valor esteja entre 0 e 4095
+                if (lum_raw < 0) lum_raw = 0;
+                if (lum_raw > 4095) lum_raw = 4095;
+                return ((4095 - lum_raw) / 4095) * 100;
+            }
+
+            // O servidor envia os eventos em lotes: [{dispositivo, valor}, ...]
+            // (aceita também o formato antigo, com um objeto só)
+            function comoLote(data) {
+                return Array.isArray(data) ? data : [data];
+            }
+
+            // Retorna o item do dispositivo selecionado (o último do lote), se houver
+            function itemDoDispositivoAtual(data) {
+                let atual = null;
+                comoLote(data).forEach((item) => {
+                    if (registrarDispositivo(item.dispositivo)) atual = item;
+                });
+                return atual;
             }
 
             // ======================================================
             // ==== LISTENERS DO SOCKET.IO ====
             // ======================================================
 
+            // Atualiza os cards com uma telemetria; comGrafico=false só mexe nos KPIs
+            function aplicarTelemetria(dados, timestamp, comGrafico) {
+                // Atualiza os 4 KPIs de telemetria
+                $('#val-temp').text(dados.temperatura ? dados.temperatura.toFixed(1) : '--');
+                $('#val-hum').text(dados.umidade ? dados.umidade.toFixed(1) : '--');
+                
+                // ---- LÓGICA DA LUMINOSIDADE EM % ----
+                if (dados.luminosidade !== undefined) {
+                    let lum_percent = lumParaPercentual(dados.luminosidade);
+                    
+                    $('#val-lum').text(lum_percent.toFixed(0)); // Mostra 0-100%
+                    if (comGrafico) updateChart(lumChart, timestamp, lum_percent); // Envia % para o gráfico
+                } else {
+                    $('#val-lum').text('--');
+                }
+                // ---- FIM DA LÓGICA ----
+                
+                $('#val-dist').text(dados.distancia !== undefined ? dados.distancia : '--');
+                
+                $('#val-ts').text(timestamp.toLocaleString('pt-BR'));
+
+                // ---- LÓGICA DO CARD DA LÂMPADA ----
+                $('#val-lamp').text(dados.lamp_status ? dados.lamp_status : '--');
+                // Muda a cor do card da lâmpada para feedback visual
+                if (dados.lamp_status === "Ligada") {
+                    $('#lamp-card').css('background-color', '#fff8e1'); // Amarelo claro
+                } else { // Desligada, --, N/A
+                    $('#lamp-card').css('background-color', '#fff'); // Branco
+                }
+                // ---- FIM DA LÓGICA ----
+
+                // Atualiza os 2 gráficos restantes
+                if (comGrafico) {
+                    if(dados.temperatura) updateChart(tempChart, timestamp, dados.temperatura);
+                    if(dados.umidade) updateChart(humChart, timestamp, dados.umidade);
+                }
+            }
+
+            // 0. SNAPSHOT: estado atual + histórico recente numa mensagem só,
+            // enviado na conexão e a cada inscrição (nada de "--" esperando o ESP32)
+            let primeiraPintura = true;
+            socket.on('snapshot', (snap) => {
+                snap.lista.forEach(registrarDispositivo);
+                const estado = snap.dispositivos.find((d) => d.dispositivo === dispositivoAtual);
+                if (!estado) {
+                    // Sem dispositivo escolhido: pega o primeiro da frota. Um
+                    // dispositivo escolhido e ainda sem dados continua selecionado
+                    if (!dispositivoAtual && snap.lista.length) selecionarDispositivo(snap.lista[0]);
+                    return;
+                }
+                $('#device-select').val(dispositivoAtual);
+
+                [['temperatura', tempChart], ['umidade', humChart], ['luminosidade', lumChart]].forEach(([metrica, chart]) => {
+                    const serie = estado.historico[metrica];
+                    chart.data.labels = serie.ts.map((t) => new Date(t * 1000));
+                    chart.data.datasets[0].data = metrica === 'luminosidade' ? serie.valores.map(lumParaPercentual) : serie.valores;
+                    chart.update();
+                });
+                if (Object.keys(estado.telemetria).length) {
+                    aplicarTelemetria(estado.telemetria, new Date(estado.atualizado_em * 1000), false);
+                }
+                $('#val-status').text(estado.status);
+                $('#val-alerta').text(estado.alerta);
+
+                // Tempo até a primeira pintura útil (desde o início da navegação)
+                if (primeiraPintura) {
+                    primeiraPintura = false;
+                    socket.emit('metrica_cliente', { primeira_pintura_ms: Math.round(performance.now()) });
+                }
+            });
+
             // 1. Ouve por dados de TELEMETRIA
             socket.on('atualiza_telemetria', (data) => {
-                let dados = data.valor;
+                const item = itemDoDispositivoAtual(data);
+                if (!item) return;
+                let dados = item.valor;
 
                 if (dados) {
                     const timestamp = new Date(); // Gera o timestamp na chegada
-                    
-                    // Atualiza os 4 KPIs de telemetria
-                    $('#val-temp').text(dados.temperatura ? dados.temperatura.toFixed(1) : '--');
-                    $('#val-hum').text(dados.umidade ? dados.umidade.toFixed(1) : '--');
-                    
-                    // ---- LÓGICA DA LUMINOSIDADE EM % ----
-                    if (dados.luminosidade !== undefined) {
-                        // Converte 0-4095 (invertido) para 0-100%
-                        let lum_raw = dados.luminosidade;
-                        // Clamp: Garante que o valor esteja entre 0 e 4095
-                        if (lum_raw < 0) lum_raw = 0;
-                        if (lum_raw > 4095) lum_raw = 4095;
-                        
-                        let lum_percent = ((4095 - lum_raw) / 4095) * 100;
-                        
-                        $('#val-lum').text(lum_percent.toFixed(0)); // Mostra 0-100%
-                        updateChart(lumChart, timestamp, lum_percent); // Envia % para o gráfico
-                    } else {
-                        $('#val-lum').text('--');
-                    }
-                    // ---- FIM DA LÓGICA ----
-                    
-                    $('#val-dist').text(dados.distancia !== undefined ? dados.distancia : '--');
-                    
-                    $('#val-ts').text(timestamp.toLocaleString('pt-BR'));
-
-                    // ---- LÓGICA DO CARD DA LÂMPADA ----
-                    $('#val-lamp').text(dados.lamp_status ? dados.lamp_status : '--');
-                    // Muda a cor do card da lâmpada para feedback visual
-                    if (dados.lamp_status === "Ligada") {
-                        $('#lamp-card').css('background-color', '#fff8e1'); // Amarelo claro
-                    } else { // Desligada, --, N/A
-                        $('#lamp-card').css('background-color', '#fff'); // Branco
-                    }
-                    // ---- FIM DA LÓGICA ----
+                    aplicarTelemetria(dados, timestamp, true);
 
-                    // Atualiza os 2 gráficos restantes
-                    if(dados.temperatura) updateChart(tempChart, timestamp, dados.temperatura);
-                    if(dados.umidade) updateChart(humChart, timestamp, dados.umidade);
+                    // Um único redesenho por lote
+                    tempChart.update();
+                    humChart.update();
+                    lumChart.update();
                 }
             });
 
             // 2. Ouve por dados de STATUS
             socket.on('atualiza_status', (data) => {
-                $('#val-status').text(data.valor);
+                const item = itemDoDispositivoAtual(data);
+                if (!item) return;
+                $('#val-status').text(item.valor);
             });
 
             // 3. Ouve por dados de ALERTA
             socket.on('novo_alerta', (data) => {
-                $('#val-alerta').text(data.valor);
+                const item = itemDoDispositivoAtual(data);
+                if (!item) return;
+                $('#val-alerta').text(item.valor);
                 
                 // Efeito visual para destacar o novo alerta
                 $("#alert-card-wrapper").css("opacity", 0.5).animate({ opacity: 1.0 }, 500);
             });
+
+            // 4. Resumo da frota: novos dispositivos aparecem no seletor
+            // (no modo multiprocesso chega um resumo por partição)
+            const dispositivosPorParticao = {};
+            socket.on('resumo_frota', (resumo) => {
+                const particao = resumo.particao || 0;
+                if (dispositivosPorParticao[particao] === resumo.dispositivos) return;
+                dispositivosPorParticao[particao] = resumo.dispositivos;
+                const total = Object.values(dispositivosPorParticao).reduce((a, b) => a + b, 0);
+                if (total !== dispositivosConhecidos.size) carregarDispositivos();
+            });
+
+            // 5. Agregados da frota (médias, ocupação, top-k de energia)
+            const fixo = (v, casas) => (v === null || v === undefined) ? '--' : v.toFixed(casas);
+            // No modo multiprocesso chega um resumo por partição: junta todos
+            const agregadosPorParticao = {};
+            socket.on('agregados_frota', (parte) => {
+                agregadosPorParticao[parte.particao || 0] = parte;
+                const partes = Object.values(agregadosPorParticao);
+                const soma = (f) => partes.reduce((a, p) => a + f(p), 0);
+                const media = (m) => {
+                    const n = soma((p) => p.amostras[m]);
+                    return n ? soma((p) => (p.media[m] || 0) * p.amostras[m]) / n : null;
+                };
+                // p90 da frota ~ maior p90 das partições (a divisão por hash deixa as partes parecidas)
+                const p90s = partes.map((p) => p.percentis.temperatura.p90).filter((v) => v !== null);
+                const comStatus = soma((p) => p.com_status);
+                const presentes = soma((p) => p.presentes);
+                $('#val-temp-media').text(fixo(media('temperatura'), 1));
+                $('#val-umid-media').text(fixo(media('umidade'), 0));
+                $('#val-temp-p90').text(fixo(p90s.length ? Math.max(...p90s) : null, 1));
+                $('#val-ocupacao').text(fixo(comStatus ? 100 * presentes / comStatus : null, 0));
+                $('#val-presentes').text(presentes);
+                $('#val-dispositivos-frota').text(soma((p) => p.dispositivos));
+                $('#val-desperdicio').text(soma((p) => p.lampadas_acesas_com_luz));
+                const lista = $('#lista-top-energia').empty();
+                partes.flatMap((p) => p.top_energia).sort((a, b) => b.kwh - a.kwh).slice(0, 5).forEach((item) => {
+                    lista.append($('<li>').text(`${item.dispositivo}: ${item.kwh.toFixed(3)} kWh`));
+                });
+            });
         });
     </script>
 </body>
 </html>
-    """)
+"""
+
+# ---- Página e assets montados uma vez (ver assets.py) ----
+pacote_assets = PacoteAssets(DIRETORIO_STATIC)
+if pacote_assets.faltando:
+    # Os assets não vêm no repositório: sem o baixar_assets.py o navegador
+    # precisa de internet para abrir o dashboard
+    log.warning("%d arquivo(s) ausente(s) em static/ (%s): o navegador vai buscá-los na CDN e o "
+                "dashboard NÃO abre sem internet. Rode 'python baixar_assets.py' uma vez numa máquina "
+                "com internet (ou copie a pasta static/ de outra instalação).",
+                len(pacote_assets.faltando), ", ".join(pacote_assets.faltando))
+pagina_dashboard = Recurso(
+    app.jinja_env.from_string(TEMPLATE_DASHBOARD)
+    .render(estilos=pacote_assets.estilos, scripts=pacote_assets.scripts)
+    .encode("utf-8"),
+    TIPO_HTML,
+)
+
+@app.route("/")
+def index():
+    # ETag + no-cache: recargas sem mudança na página viram 304
+    return pagina_dashboard.responder(CACHE_REVALIDAR)
+
+@app.route(PREFIXO_URL + "<path:nome>")
+def servir_asset(nome):
+    return pacote_assets.servir(nome)
+
+# =================================================================
+# ==== Eventos Socket.IO (salas) ====
+# =================================================================
+def salas_da_inscricao(dados):
+    # {"dispositivos": [...], "grupos": [...], "frota": true} -> nomes das salas
+    salas = set()
+    for device_id in dados.get("dispositivos") or ():
+        salas.add(sala_dispositivo(str(device_id)))
+    for nome in dados.get("grupos") or ():
+        salas.add(sala_grupo(str(nome)))
+    if dados.get("frota"):
+        salas.add(SALA_FROTA)
+    return salas
+
+def dispositivos_da_inscricao(dados):
+    # Dispositivos pedidos diretamente + os dos grupos, sem repetir e com limite
+    ids = list(dict.fromkeys(
+        [str(d) for d in dados.get("dispositivos") or ()]
+        + [d for nome in dados.get("grupos") or () for d in mapa_grupos.dispositivos_de(str(nome))]))
+    return ids[:SNAPSHOT_MAX_DISPOSITIVOS]
+
+def montar_snapshot(dados):
+    inicio = time.perf_counter()
+    ids = dispositivos_da_inscricao(dados)
+    dispositivos = []
+    for device_id in ids:
+        estado = estado_frota.obter(device_id)
+        if estado is None:
+            continue
+        estado["historico"] = {}
+        for metrica in SNAPSHOT_METRICAS:
+            ts, valores = historico.ultimos(device_id, metrica, SNAPSHOT_PONTOS_HISTORICO)
+            estado["historico"][metrica] = {"ts": ts, "valores": valores}
+        dispositivos.append(estado)
+    lista = set(estado_frota.dispositivos())
+    if PARTICAO_TOTAL > 1:
+        # Modo multiprocesso: a lista da frota inteira e o estado dos
+        # dispositivos pedidos que são de outras partições vêm dos donos
+        remotos = [d for d in ids if particao_do_dispositivo(d) != PARTICAO_INDICE]
+        consulta = urllib.parse.urlencode({"device": ",".join(remotos)})
+        for outra in consultar_outras_particoes(f"/api/snapshot?{consulta}"):
+            lista.update(outra["lista"])
+            dispositivos.extend(outra["dispositivos"])
+    snapshot = {
+        "gerado_em": time.time(),
+        "lista": sorted(lista)[:SNAPSHOT_MAX_LISTA],
+        "dispositivos": dispositivos,
+    }
+    metricas_snapshot.registrar_montagem(time.perf_counter() - inicio)
+    return snapshot
+
+def validar_inscricao(dados):
+    # Retorna (salas, erro); usado também pelo servidor asyncio (servidor_async.py)
+    if not isinstance(dados, dict):
+        return None, "formato inválido"
+    salas = salas_da_inscricao(dados)
+    if len(salas) > MAX_SALAS_POR_CLIENTE:
+        return None, f"máximo de {MAX_SALAS_POR_CLIENTE} salas por cliente"
+    return salas, None
+
+def aplicar_inscricao(dados):
+    # Troca as salas do cliente pelas pedidas agora (substitui, não soma)
+    salas, erro = validar_inscricao(dados)
+    if erro:
+        return {"erro": erro}
+    for sala in rooms():
+        if sala != request.sid and sala not in salas:
+            leave_room(sala)
+    for sala in salas:
+        join_room(sala)
+    # O snapshot vai numa mensagem só, direto para este cliente
+    socketio.emit("snapshot", montar_snapshot(dados), to=request.sid)
+    return {"salas": sorted(salas)}
+
+@socketio.on("connect")
+def ao_conectar(auth=None):
+    # io({auth: {dispositivos: [...], grupos: [...], frota: true}})
+    aplicar_inscricao(auth if isinstance(auth, dict) else {})
+
+@socketio.on("inscrever")
+def ao_inscrever(dados):
+    return aplicar_inscricao(dados)
+
+@socketio.on("metrica_cliente")
+def ao_receber_metrica_cliente(dados):
+    # Tempo até a primeira pintura útil medido no navegador
+    if isinstance(dados, dict) and isinstance(dados.get("primeira_pintura_ms"), (int, float)):
+        metricas_snapshot.registrar_primeira_pintura(dados["primeira_pintura_ms"])
+
+# =================================================================
+# ==== API ====
+# =================================================================
+def consultar_outras_particoes(caminho):
+    # Modo multiprocesso: a mesma rota nos outros processos, só com os dados
+    # locais deles ("local=1"). Um processo fora do ar fica de fora da resposta.
+    if PARTICAO_TOTAL == 1 or (has_request_context() and request.args.get("local")):
+        return []
+    separador = "&" if "?" in caminho else "?"
+    respostas = []
+    for particao in range(PARTICAO_TOTAL):
+        if particao == PARTICAO_INDICE:
+            continue
+        url = f"http://127.0.0.1:{PORTA - PARTICAO_INDICE + particao}{caminho}{separador}local=1"
+        try:
+            with urllib.request.urlopen(url, timeout=2) as resposta:
+                respostas.append(json.loads(resposta.read()))
+        except (OSError, ValueError) as e:
+            log.warning("Partição %d não respondeu em %s: %s", particao, caminho, e)
+    return respostas
+
+@app.route("/api/snapshot")
+def api_snapshot():
+    # O mesmo snapshot do Socket.IO: /api/snapshot?device=<id>,<id>[&group=<nome>]
+    # (no modo multiprocesso, com "local=1" só os dados desta partição)
+    return jsonify(montar_snapshot({
+        "dispositivos": [d for d in request.args.get("device", "").split(",") if d],
+        "grupos": [g for g in request.args.get("group", "").split(",") if g],
+    }))
+
+@app.route("/api/dispositivos")
+def listar_dispositivos():
+    dispositivos = set(estado_frota.dispositivos())
+    for outra in consultar_outras_particoes("/api/dispositivos"):
+        dispositivos.update(outra["dispositivos"])
+    return jsonify({"dispositivos": sorted(dispositivos), "grupos": mapa_grupos.como_dict()})
+
+def redirecionar_ao_dono(device_id):
+    # Modo multiprocesso: o histórico e a energia de um dispositivo ficam no
+    # processo dono dele, na porta base + partição (ver multiprocesso.py)
+    if PARTICAO_TOTAL == 1:
+        return None
+    dono = particao_do_dispositivo(device_id)
+    if dono == PARTICAO_INDICE:
+        return None
+    host = request.host.rsplit(":", 1)[0]
+    return redirect(f"{request.scheme}://{host}:{PORTA - PARTICAO_INDICE + dono}{request.full_path}", 307)
+
+@app.after_request
+def liberar_cors_entre_particoes(resposta):
+    # O redirecionamento leva o navegador para outra porta (outra origem)
+    if PARTICAO_TOTAL > 1 and request.path.startswith("/api/"):
+        resposta.headers["Access-Control-Allow-Origin"] = "*"
+    return resposta
+
+@app.route("/api/history")
+def api_history():
+    # /api/history?device=<id>&metric=temperatura&from=<epoch>&to=<epoch>
+    #             [&tier=mem|raw|1m|1h][&points=500&method=lttb|minmax]
+    # Sem "tier": memória (última hora), ou o tier escolhido pelo "points".
+    # Com "points": a série é reduzida no servidor para no máximo N pontos.
+    device_id = request.args.get("device")
+    metrica = request.args.get("metric", "temperatura")
+    tier = request.args.get("tier")
+    metodo = request.args.get("method", METODO_LTTB)
+    if not device_id:
+        return jsonify({"erro": "parâmetro 'device' é obrigatório"}), 400
+    desvio = redirecionar_ao_dono(device_id)
+    if desvio is not None:
+        return desvio
+    if metrica not in METRICAS:
+        return jsonify({"erro": f"métrica inválida, use uma de {list(METRICAS)}"}), 400
+    if metodo not in METODOS:
+        return jsonify({"erro": f"método inválido, use um de {list(METODOS)}"}), 400
+    try:
+        agora = time.time()
+        ate = float(request.args.get("to", agora))
+        de = float(request.args.get("from", ate - HISTORICO_RETENCAO_S))
+        pontos = request.args.get("points")
+        pontos = None if pontos is None else max(2, min(int(pontos), HISTORY_MAX_PONTOS))
+    except ValueError:
+        return jsonify({"erro": "'from'/'to' devem ser timestamps (segundos) e 'points' um inteiro"}), 400
+
+    if tier is None:
+        tier = TIER_MEMORIA if pontos is None or armazem is None else escolher_tier(de, ate, pontos, agora, tiers_historico())
+    if tier == TIER_MEMORIA:
+        ts, valores = historico.consultar(device_id, metrica, de, ate)
+        colunas = {"ts": ts, "valores": valores}
+    elif tier not in TIERS:
+        return jsonify({"erro": f"tier inválido, use um de {[TIER_MEMORIA, *TIERS]}"}), 400
+    elif armazem is None:
+        return jsonify({"erro": "persistência desativada (PERSISTENCIA_ATIVA = False)"}), 404
+    else:
+        colunas = armazem.consultar(device_id, metrica, de, ate, tier)
+
+    originais = len(colunas["ts"])
+    if pontos is not None and originais > pontos:
+        colunas = reduzir_colunas(colunas, pontos, metodo)
+    return jsonify({"dispositivo": device_id, "metrica": metrica, "tier": tier,
+                    "pontos_originais": originais, **colunas})
+
+def tiers_historico():
+    # (nome, resolução_s, retenção_s), do mais fino ao mais grosso
+    return [
+        (TIER_MEMORIA, HISTORICO_INTERVALO_LEITURA_S, HISTORICO_RETENCAO_S),
+        (TIER_BRUTO, HISTORICO_INTERVALO_LEITURA_S, PERSISTENCIA_RETENCAO_BRUTO_S),
+        (TIER_1M, 60, PERSISTENCIA_RETENCAO_1M_S),
+        (TIER_1H, 3600, PERSISTENCIA_RETENCAO_1H_S),
+    ]
+
+@app.route("/api/metricas/ingestao")
+def metricas_ingestao():
+    # Profundidade da fila, mensagens descartadas/processadas etc.
+    return jsonify(pipeline_ingestao.metricas())
+
+@app.route("/api/metricas/persistencia")
+def metricas_persistencia():
+    if armazem is None:
+        return jsonify({"ativa": False})
+    return jsonify({"ativa": True, **armazem.metricas()})
+
+@app.route("/api/metricas/snapshot")
+def api_metricas_snapshot():
+    # Tempo de montagem do snapshot e primeira pintura útil relatada pelos navegadores
+    return jsonify(metricas_snapshot.resumo())
+
+@app.route("/api/metricas/captura")
+def metricas_captura():
+    # Mensagens gravadas/descartadas pela captura (ECOWORK_CAPTURA)
+    if gravador_captura is None:
+        return jsonify({"ativa": False})
+    return jsonify({"ativa": True, **gravador_captura.metricas()})
+
+@app.route("/api/metricas/estado")
+def metricas_estado():
+    # Salvamentos periódicos do estado e a restauração do boot
+    return jsonify(salvamento_estado.metricas())
+
+@app.route("/api/metricas/broadcast")
+def metricas_broadcast():
+    # Atualizações recebidas x coalescidas x frames realmente enviados
+    return jsonify(broadcast.metricas())
+
+@app.route("/api/energia")
+def api_energia():
+    # /api/energia?device=<id>&periodo=dia|semana|mes&n=7 (sem device = frota inteira)
+    device_id = request.args.get("device") or None
+    desvio = device_id and redirecionar_ao_dono(device_id)
+    if desvio:
+        return desvio
+    granularidade = request.args.get("periodo", GRANULARIDADE_DIA)
+    if granularidade not in GRANULARIDADES:
+        return jsonify({"erro": f"período inválido, use um de {list(GRANULARIDADES)}"}), 400
+    try:
+        quantos = int(request.args.get("n", 7))
+    except ValueError:
+        return jsonify({"erro": "'n' deve ser um inteiro"}), 400
+    quantos = max(1, min(quantos, ENERGIA_MAX_PERIODOS))
+    totais = energia.totais(device_id, granularidade, quantos)
+    if totais is None:
+        return jsonify({"erro": f"dispositivo desconhecido: {device_id}"}), 404
+    if device_id is None:
+        # Frota inteira: soma as outras partições (mesmos períodos, mesmo relógio)
+        for outra in consultar_outras_particoes(f"/api/energia?periodo={granularidade}&n={quantos}"):
+            for carga, w in outra["potencia_atual_w"].items():
+                totais["potencia_atual_w"][carga] = totais["potencia_atual_w"].get(carga, 0.0) + w
+            for periodo, periodo_outra in zip(totais["series"], outra["series"]):
+                for carga, kwh in periodo_outra["kwh"].items():
+                    periodo["kwh"][carga] = round(periodo["kwh"].get(carga, 0.0) + kwh, 6)
+                periodo["co2_kg"] = round(periodo["co2_kg"] + periodo_outra["co2_kg"], 6)
+    return jsonify(totais)
+
+def tier_exportacao(de, agora):
+    # O tier mais fino que ainda guarda o início do intervalo pedido
+    for tier, retencao in ((TIER_BRUTO, PERSISTENCIA_RETENCAO_BRUTO_S), (TIER_1M, PERSISTENCIA_RETENCAO_1M_S)):
+        if de >= agora - retencao:
+            return tier
+    return TIER_1H
+
+@app.route("/api/exportar")
+def api_exportar():
+    # /api/exportar?from=<epoch>&to=<epoch>[&device=<id>...][&tier=raw|1m|1h][&format=csv|arrow|parquet]
+    # Resposta em streaming (bloco a bloco do banco): memória constante
+    # qualquer que seja o tamanho. Sem "device", exporta todos os dispositivos
+    # (no modo multiprocesso, os da partição deste processo).
+    if armazem is None:
+        return jsonify({"erro": "persistência desativada (PERSISTENCIA_ATIVA = False)"}), 404
+    dispositivos = [d for valor in request.args.getlist("device") for d in valor.split(",") if d] or None
+    if dispositivos is not None and len(dispositivos) > EXPORTACAO_MAX_DISPOSITIVOS:
+        return jsonify({"erro": f"no máximo {EXPORTACAO_MAX_DISPOSITIVOS} dispositivos por exportação"}), 400
+    if dispositivos is not None and len(dispositivos) == 1:
+        desvio = redirecionar_ao_dono(dispositivos[0])
+        if desvio is not None:
+            return desvio
+    formato = request.args.get("format", FORMATO_CSV)
+    if formato not in formatos_disponiveis():
+        return jsonify({"erro": f"formato indisponível, use um de {list(formatos_disponiveis())} "
+                                "(arrow/parquet precisam do pacote pyarrow)"}), 400
+    try:
+        agora = time.time()
+        ate = float(request.args.get("to", agora))
+        de = float(request.args.get("from", ate - EXPORTACAO_PERIODO_PADRAO_S))
+    except ValueError:
+        return jsonify({"erro": "'from'/'to' devem ser timestamps (segundos)"}), 400
+    tier = request.args.get("tier") or tier_exportacao(de, agora)
+    if tier not in TIERS:
+        return jsonify({"erro": f"tier inválido, use um de {list(TIERS)}"}), 400
+
+    blocos = armazem.exportar(dispositivos, de, ate, tier, TAMANHO_BLOCO[formato])
+    corpo = medidor_exportacao.exportar(blocos, colunas_exportacao(tier), formato, {
+        "tier": tier, "de": de, "ate": ate,
+        "dispositivos": len(dispositivos) if dispositivos is not None else "todos"})
+    nome = f"ecowork-{tier}-{int(de)}-{int(ate)}"
+    if PARTICAO_TOTAL > 1:
+        nome += f"-p{PARTICAO_INDICE}"
+    return Response(stream_with_context(corpo), content_type=TIPOS_CONTEUDO[formato], headers={
+        "Content-Disposition": f'attachment; filename="{nome}.{EXTENSOES[formato]}"',
+        "X-EcoWork-Tier": tier,
+        "X-EcoWork-Particao": f"{PARTICAO_INDICE}/{PARTICAO_TOTAL}",
+    })
+
+@app.route("/api/metricas/exportacao")
+def metricas_exportacao():
+    # Linhas/s, bytes e duração das últimas exportações
+    return jsonify(medidor_exportacao.resumo())
+
+@app.route("/api/regras")
+def api_regras():
+    # Regras carregadas, alertas ativos agora e contadores do motor
+    return jsonify({
+        "regras": motor_regras.definicoes,
+        "sobrescritas": motor_regras.sobrescritas,
+        "ativos": motor_regras.ativos(),
+        "metricas": motor_regras.metricas(),
+    })
+
+@app.route("/api/agregados")
+def api_agregados():
+    # O mesmo resumo enviado na sala "frota" (para quem não usa Socket.IO)
+    return jsonify(agregados.resumo())
+
+@app.route("/metrics")
+def metrics():
+    # Formato texto do Prometheus (scrape_configs -> targets: ["<host>:5000"])
+    return Response(registro_metricas.exportar(), content_type=TIPO_CONTEUDO)
 
 if __name__ == "__main__":
-    print("[Flask] Iniciando servidor web com SocketIO...")
-    # host='0.0.0.0' permite que você acesse o dashboard de outro dispositivo na sua rede
-    # (ex: seu celular, acessando o IP do seu computador, ex: http://192.168.1.10:5000)
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    if MODO_SERVIDOR == MODO_ASYNCIO:
+        # Produção: um event loop só para Socket.IO, HTTP e MQTT (ver servidor_async.py)
+        # servidor_async faz "import dashboard": reaproveita este módulo em vez
+        # de carregar uma segunda cópia (com outro pipeline e outro cliente MQTT)
+        sys.modules.setdefault("dashboard", sys.modules[__name__])
+        import servidor_async
+        servidor_async.rodar(HOST, PORTA)
+    else:
+        log.info("Iniciando servidor web com SocketIO...")
+        iniciar_modo_threading()
+        # host='0.0.0.0' permite que você acesse o dashboard de outro dispositivo na sua rede
+        # (ex: seu celular, acessando o IP do seu computador, ex: http://192.168.1.10:5000)
+        # O reloader fica desligado: ele reiniciaria o processo e duplicaria o cliente MQTT
+        # SIGTERM (supervisor, systemd) vira SystemExit para o finally salvar o estado
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            socketio.run(app, debug=DEBUG, use_reloader=False, host=HOST, port=PORTA, allow_unsafe_werkzeug=True)
+        finally:
+            client.loop_stop()
+            parar_servicos()
\ No newline at end of file
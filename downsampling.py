@@ -0,0 +1,158 @@
+# =================================================================
+# ==== REDUÇÃO DE SÉRIES (DOWNSAMPLING) ECOWORK ====
+# =================================================================
+# Semanas de leituras a cada 3 s travam o Chart.js e pesam na rede.
+# Aqui a série é reduzida no servidor para um número alvo de pontos,
+# mantendo o "desenho" do gráfico:
+#
+# - LTTB (Largest-Triangle-Three-Buckets): escolhe em cada balde o ponto
+#   que forma o maior triângulo com o escolhido no balde anterior e a
+#   média do próximo. Bom para linhas.
+# - min/max: guarda o mínimo e o máximo de cada balde. Não esconde picos.
+#
+# Com NumPy instalado, os cálculos de cada balde são vetorizados; sem ele
+# cai para Python puro (mesmo resultado).
+
+from bisect import bisect_left
+
+try:
+    import numpy as np
+except ImportError:  # NumPy é opcional
+    np = None
+
+METODO_LTTB = "lttb"
+METODO_MINMAX = "minmax"
+METODOS = (METODO_LTTB, METODO_MINMAX)
+
+
+def reduzir(ts, valores, pontos, metodo=METODO_LTTB):
+    # Retorna (ts, valores) com no máximo "pontos" pontos
+    if metodo not in METODOS:
+        raise ValueError(f"método inválido: {metodo!r} (use um de {METODOS})")
+    n = len(ts)
+    if pontos <= 2 or n <= pontos:
+        return list(ts), list(valores)
+    if metodo == METODO_LTTB:
+        return lttb(ts, valores, pontos)
+    return minmax(ts, valores, pontos)
+
+
+def _limites_baldes(n, baldes, inicio=0):
+    # Divide os índices [inicio, n) em "baldes" faixas contíguas
+    tamanho = (n - inicio) / baldes
+    return [inicio + int(i * tamanho) for i in range(baldes)] + [n]
+
+
+def lttb(ts, valores, pontos):
+    n = len(ts)
+    # O primeiro e o último ponto sempre ficam; o miolo vira pontos-2 baldes
+    limites = _limites_baldes(n - 1, pontos - 2, inicio=1)
+    if np is not None:
+        return _lttb_numpy(ts, valores, limites)
+    escolhidos = [0]
+    a = 0
+    for b in range(pontos - 2):
+        i0, i1 = limites[b], limites[b + 1]
+        # Média do próximo balde (ou o último ponto, no último balde)
+        j0, j1 = (limites[b + 1], limites[b + 2]) if b + 2 < len(limites) else (n - 1, n)
+        mx = sum(ts[j0:j1]) / (j1 - j0)
+        my = sum(valores[j0:j1]) / (j1 - j0)
+        ax, ay = ts[a], valores[a]
+        melhor, maior_area = i0, -1.0
+        for i in range(i0, i1):
+            area = abs((ax - mx) * (valores[i] - ay) - (ax - ts[i]) * (my - ay))
+            if area > maior_area:
+                melhor, maior_area = i, area
+        escolhidos.append(melhor)
+        a = melhor
+    escolhidos.append(n - 1)
+    return [ts[i] for i in escolhidos], [valores[i] for i in escolhidos]
+
+
+def _lttb_numpy(ts, valores, limites):
+    x = np.asarray(ts, dtype=float)
+    y = np.asarray(valores, dtype=float)
+    n = len(x)
+    baldes = len(limites) - 1
+    # Médias de todos os baldes de uma vez (somas acumuladas)
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    lim = np.asarray(limites)
+    prox_ini = np.append(lim[1:-1], n - 1)
+    prox_fim = np.append(lim[2:], n)
+    cont = prox_fim - prox_ini
+    mx = (cx[prox_fim] - cx[prox_ini]) / cont
+    my = (cy[prox_fim] - cy[prox_ini]) / cont
+    escolhidos = np.empty(baldes + 2, dtype=np.int64)
+    escolhidos[0] = 0
+    escolhidos[-1] = n - 1
+    a = 0
+    for b in range(baldes):
+        i0, i1 = limites[b], limites[b + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - mx[b]) * (y[i0:i1] - ay) - (ax - x[i0:i1]) * (my[b] - ay))
+        a = i0 + int(np.argmax(area))
+        escolhidos[b + 1] = a
+    return x[escolhidos].tolist(), y[escolhidos].tolist()
+
+
+def minmax(ts, valores, pontos):
+    # Cada balde vira 2 pontos (mín. e máx., na ordem em que aparecem)
+    n = len(ts)
+    baldes = max(1, pontos // 2)
+    limites = _limites_baldes(n, baldes)
+    if np is not None:
+        y = np.asarray(valores, dtype=float)
+        lim = np.asarray(limites[:-1])
+        # reduceat calcula o mín./máx. de todos os baldes numa passada só
+        minimos = np.minimum.reduceat(y, lim)
+        maximos = np.maximum.reduceat(y, lim)
+        escolhidos = []
+        for b in range(baldes):
+            i0, i1 = limites[b], limites[b + 1]
+            fatia = y[i0:i1]
+            i_min = i0 + int(np.argmax(fatia == minimos[b]))
+            i_max = i0 + int(np.argmax(fatia == maximos[b]))
+            escolhidos.extend(sorted({i_min, i_max}))
+        return [ts[i] for i in escolhidos], [valores[i] for i in escolhidos]
+    escolhidos = []
+    for b in range(baldes):
+        i0, i1 = limites[b], limites[b + 1]
+        i_min = min(range(i0, i1), key=valores.__getitem__)
+        i_max = max(range(i0, i1), key=valores.__getitem__)
+        escolhidos.extend(sorted({i_min, i_max}))
+    return [ts[i] for i in escolhidos], [valores[i] for i in escolhidos]
+
+
+def reduzir_colunas(colunas, pontos, metodo=METODO_LTTB):
+    # reduzir() para as colunas do ArmazemTelemetria.consultar(). Nos tiers
+    # agregados ("min"/"max"), cada ponto que fica leva o mín./máx. de todos
+    # os baldes desde o ponto anterior: a faixa não perde nenhum extremo e a
+    # resposta tem as mesmas colunas, reduzida ou não
+    ts, valores = reduzir(colunas["ts"], colunas["valores"], pontos, metodo)
+    if "min" not in colunas:
+        return {"ts": ts, "valores": valores}
+    # O ts de cada balde é único e crescente: acha o índice original por bisect
+    fins = [bisect_left(colunas["ts"], t) + 1 for t in ts]
+    inicios = [0] + fins[:-1]
+    return {
+        "ts": ts,
+        "valores": valores,
+        "min": [min(colunas["min"][i:j]) for i, j in zip(inicios, fins)],
+        "max": [max(colunas["max"][i:j]) for i, j in zip(inicios, fins)],
+    }
+
+
+def escolher_tier(de, ate, pontos, agora, tiers):
+    # tiers: lista de (nome, resolução_s, retenção_s), do mais fino ao mais grosso.
+    # Entre os que ainda cobrem "de", escolhe o mais grosso que rende pelo
+    # menos "pontos" pontos (o resto é reduzido por reduzir()); se nenhum
+    # rende tantos, o mais fino. Com a mesma resolução vale o que vem antes
+    # na lista (memória antes do banco).
+    cobrem = [(nome, res) for nome, res, retencao in tiers if retencao is None or de >= agora - retencao]
+    if not cobrem:
+        return tiers[-1][0]
+    for nome, resolucao in sorted(cobrem, key=lambda tier: -tier[1]):
+        if (ate - de) / resolucao >= pontos:
+            return nome
+    return cobrem[0][0]
@@ -0,0 +1,303 @@
+# =================================================================
+# ==== CONTABILIDADE DE ENERGIA E CO2 ECOWORK ====
+# =================================================================
+# Acompanha, por dispositivo, quando cada carga do escritório está ligada
+# e integra o consumo (kWh) e as emissões (kg CO2) em tempo real:
+#   lampada    -> "lamp_status" da telemetria ("Ligada"/"Desligada")
+#   ac         -> alertas de clima do ESP32 ("Clima Quente. AC Ligado.")
+#   ventilador -> modo Eco ("Clima Confortavel. Modo Eco.")
+# Status "Ausente" desliga tudo (igual ao firmware).
+#
+# Cada evento custa O(1): a energia do intervalo desde o evento anterior
+# (potência atual x tempo) é somada nos acumuladores do dia, da semana e
+# do mês, e só então a potência muda. Nada do histórico é relido. A frota
+# tem um acumulador próprio, com a soma das potências de todos os
+# dispositivos, atualizado no mesmo evento.
+#
+# Os períodos seguem o horário local do servidor (dia, semana ISO, mês).
+# Os acumuladores vão para o estado salvo (estado_salvo.py) com exportar()
+# e voltam no boot com restaurar(): um reinício não zera o consumo.
+
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+
+CARGAS = ("lampada", "ac", "ventilador")
+
+GRANULARIDADE_DIA = "dia"
+GRANULARIDADE_SEMANA = "semana"
+GRANULARIDADE_MES = "mes"
+GRANULARIDADES = (GRANULARIDADE_DIA, GRANULARIDADE_SEMANA, GRANULARIDADE_MES)
+
+# Quantos períodos de cada tipo ficam guardados
+RETENCAO_PERIODOS = {GRANULARIDADE_DIA: 62, GRANULARIDADE_SEMANA: 27, GRANULARIDADE_MES: 25}
+
+
+def _chave_dia(d):
+    return d.isoformat()
+
+
+def _chave_semana(d):
+    ano, semana, _ = d.isocalendar()
+    return f"{ano}-W{semana:02d}"
+
+
+def _chave_mes(d):
+    return f"{d.year}-{d.month:02d}"
+
+
+def _periodos(ts):
+    # (chaves de dia/semana/mês que contêm ts, timestamp da próxima meia-noite).
+    # Semana e mês só viram à meia-noite, então basta cortar nos dias.
+    d = datetime.fromtimestamp(ts).date()
+    fim_dia = datetime.combine(d + timedelta(days=1), datetime.min.time()).timestamp()
+    chaves = ((GRANULARIDADE_DIA, _chave_dia(d)), (GRANULARIDADE_SEMANA, _chave_semana(d)),
+              (GRANULARIDADE_MES, _chave_mes(d)))
+    return chaves, fim_dia
+
+
+def _ultimas_chaves(granularidade, quantas, agora):
+    # As "quantas" chaves mais recentes até agora, da mais antiga para a atual
+    d = datetime.fromtimestamp(agora).date()
+    if granularidade == GRANULARIDADE_DIA:
+        return [_chave_dia(d - timedelta(days=k)) for k in reversed(range(quantas))]
+    if granularidade == GRANULARIDADE_SEMANA:
+        return [_chave_semana(d - timedelta(weeks=k)) for k in reversed(range(quantas))]
+    chaves = []
+    ano, mes = d.year, d.month
+    for _ in range(quantas):
+        chaves.append(_chave_mes(date(ano, mes, 1)))
+        ano, mes = (ano, mes - 1) if mes > 1 else (ano - 1, 12)
+    return chaves[::-1]
+
+
+class _Acumulador:
+    # Potência atual por carga (W) e kWh por carga em cada período
+    __slots__ = ("potencia", "ultimo_ts", "visto_em", "kwh", "_ordem", "_chaves", "_fim_dia")
+
+    def __init__(self, ts):
+        self.potencia = [0.0] * len(CARGAS)
+        self.ultimo_ts = ts
+        self.visto_em = ts
+        self.kwh = {}                                   # (granularidade, chave) -> [kWh por carga]
+        self._ordem = {g: deque() for g in GRANULARIDADES}
+        self._chaves = None
+        self._fim_dia = 0.0
+
+    def integrar(self, ate):
+        # Soma a energia de [ultimo_ts, ate) com a potência atual
+        t = self.ultimo_ts
+        if ate <= t:
+            return
+        self.ultimo_ts = ate
+        if not any(self.potencia):
+            return
+        while t < ate:
+            if t >= self._fim_dia:
+                self._chaves, self._fim_dia = _periodos(t)
+            fim = min(ate, self._fim_dia)
+            horas = (fim - t) / 3600
+            for chave in self._chaves:
+                valores = self.kwh.get(chave)
+                if valores is None:
+                    valores = self._novo_periodo(chave)
+                for i, w in enumerate(self.potencia):
+                    if w:
+                        valores[i] += w * horas / 1000
+            t = fim
+
+    def _novo_periodo(self, chave):
+        granularidade = chave[0]
+        valores = self.kwh[chave] = [0.0] * len(CARGAS)
+        ordem = self._ordem[granularidade]
+        ordem.append(chave)
+        if len(ordem) > RETENCAO_PERIODOS[granularidade]:
+            self.kwh.pop(ordem.popleft(), None)
+        return valores
+
+
+class ContabilidadeEnergia:
+    def __init__(self, potencias_w, fator_emissao_kg_kwh, tempo_max_sem_dados_s=300.0,
+                 intervalo_varredura_s=30.0):
+        # potencias_w: {"lampada": W, "ac": W, "ventilador": W}
+        # fator_emissao_kg_kwh: kg de CO2 por kWh da rede elétrica
+        # tempo_max_sem_dados_s: um dispositivo calado por mais que isso é
+        # considerado desligado (não soma consumo para sempre)
+        self.potencias_w = [float(potencias_w.get(c, 0.0)) for c in CARGAS]
+        self.fator_emissao_kg_kwh = fator_emissao_kg_kwh
+        self.tempo_max_sem_dados_s = tempo_max_sem_dados_s
+        self.intervalo_varredura_s = intervalo_varredura_s
+        self._dispositivos = {}
+        self._frota = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        self.eventos = 0
+
+    # ---- Eventos (chamados pelos workers da ingestão) ----
+    def atualizar(self, device_id, ts, lampada=None, ac=None, ventilador=None):
+        # Cada carga: True (ligada), False (desligada) ou None (sem mudança).
+        # Retorna (dia, kWh do dispositivo no dia) para o ranking da frota.
+        with self._lock:
+            disp = self._dispositivos.get(device_id)
+            if disp is None:
+                disp = self._dispositivos[device_id] = _Acumulador(ts)
+            if self._frota is None:
+                self._frota = _Acumulador(ts)
+            disp.integrar(ts)
+            self._frota.integrar(ts)
+            disp.visto_em = max(disp.visto_em, ts)
+            for i, ligada in enumerate((lampada, ac, ventilador)):
+                if ligada is None:
+                    continue
+                w = self.potencias_w[i] if ligada else 0.0
+                delta = w - disp.potencia[i]
+                if delta:
+                    disp.potencia[i] = w
+                    self._frota.potencia[i] += delta
+            self.eventos += 1
+            if ts >= disp._fim_dia:
+                disp._chaves, disp._fim_dia = _periodos(ts)
+            chave_dia = disp._chaves[0]
+            return chave_dia[1], sum(disp.kwh.get(chave_dia, ()))
+
+    def desligar_tudo(self, device_id, ts):
+        return self.atualizar(device_id, ts, lampada=False, ac=False, ventilador=False)
+
+    def expirar(self, agora=None):
+        # Desliga os dispositivos que pararam de publicar (varredura periódica
+        # dos dispositivos, não do histórico)
+        agora = time.time() if agora is None else agora
+        limite = agora - self.tempo_max_sem_dados_s
+        with self._lock:
+            calados = [d for d, acc in self._dispositivos.items()
+                       if acc.visto_em < limite and any(acc.potencia)]
+        for device_id in calados:
+            self.desligar_tudo(device_id, agora)
+        return len(calados)
+
+    def encerrar(self, ts):
+        # Desliga todos os dispositivos em ts (fim de um replay: não há dados
+        # depois disso, então nada deve somar consumo até o horário atual)
+        with self._lock:
+            ligados = [d for d, acc in self._dispositivos.items() if any(acc.potencia)]
+        for device_id in ligados:
+            self.desligar_tudo(device_id, ts)
+        return len(ligados)
+
+    # ---- Consultas ----
+    def totais(self, device_id=None, granularidade=GRANULARIDADE_DIA, quantos=7, agora=None):
+        # Série dos últimos "quantos" períodos (o atual inclui até agora).
+        # device_id=None -> frota inteira. Retorna None se o dispositivo não existe.
+        if granularidade not in GRANULARIDADES:
+            raise ValueError(f"granularidade inválida: {granularidade!r} (use uma de {GRANULARIDADES})")
+        agora = time.time() if agora is None else agora
+        with self._lock:
+            acc = self._frota if device_id is None else self._dispositivos.get(device_id)
+            if acc is None:
+                if device_id is not None:
+                    return None
+                acc = _Acumulador(agora)
+            # Fecha o intervalo aberto até agora (a potência não mudou desde o último evento)
+            acc.integrar(agora)
+            serie = [(chave, list(acc.kwh.get((granularidade, chave), (0.0,) * len(CARGAS))))
+                     for chave in _ultimas_chaves(granularidade, quantos, agora)]
+            potencia = list(acc.potencia)
+        return {
+            "dispositivo": device_id,
+            "granularidade": granularidade,
+            "potencia_atual_w": dict(zip(CARGAS, potencia)),
+            "fator_emissao_kg_kwh": self.fator_emissao_kg_kwh,
+            "series": [self._periodo(chave, kwh) for chave, kwh in serie],
+        }
+
+    def _periodo(self, chave, kwh):
+        total = sum(kwh)
+        return {
+            "periodo": chave,
+            "kwh": {**{c: round(v, 6) for c, v in zip(CARGAS, kwh)}, "total": round(total, 6)},
+            "co2_kg": round(total * self.fator_emissao_kg_kwh, 6),
+        }
+
+    # ---- Estado salvo (reinício a quente) ----
+    def exportar(self, agora=None):
+        # [(device_id, ultimo_ts, visto_em, potência, [(granularidade, chave, kWh)])],
+        # com a frota em device_id=None. Tudo é integrado até agora antes
+        agora = time.time() if agora is None else agora
+        with self._lock:
+            itens = list(self._dispositivos.items())
+            if self._frota is not None:
+                itens.append((None, self._frota))
+            exportados = []
+            for device_id, acc in itens:
+                acc.integrar(agora)
+                periodos = [(*chave, tuple(acc.kwh[chave]))
+                            for g in GRANULARIDADES for chave in acc._ordem[g]]
+                exportados.append((device_id, acc.ultimo_ts, acc.visto_em, tuple(acc.potencia), periodos))
+        return exportados
+
+    def restaurar(self, acumuladores, agora=None):
+        # Boot, antes do MQTT. Um dispositivo já calado há mais de
+        # tempo_max_sem_dados_s volta desligado (a varredura o teria desligado).
+        # Retorna quantos dispositivos voltaram
+        agora = time.time() if agora is None else agora
+        limite = agora - self.tempo_max_sem_dados_s
+        n = 0
+        with self._lock:
+            for device_id, ultimo_ts, visto_em, potencia, periodos in acumuladores:
+                acc = _Acumulador(ultimo_ts)
+                acc.visto_em = visto_em
+                for granularidade, chave, kwh in periodos:
+                    if granularidade in RETENCAO_PERIODOS:
+                        acc._novo_periodo((granularidade, chave))[:] = kwh
+                if device_id is None:
+                    self._frota = acc
+                    continue
+                if visto_em >= limite:
+                    acc.potencia = [float(w) for w in potencia]
+                self._dispositivos[device_id] = acc
+                n += 1
+            if self._frota is not None:
+                # A potência da frota é a soma das dos dispositivos restaurados
+                self._frota.potencia = [sum(acc.potencia[i] for acc in self._dispositivos.values())
+                                        for i in range(len(CARGAS))]
+        return n
+
+    def kwh_do_dia(self, agora=None):
+        # [(device_id, dia, kWh no dia)] de quem consumiu hoje (refaz o ranking
+        # da frota depois de restaurar)
+        agora = time.time() if agora is None else agora
+        chave = (GRANULARIDADE_DIA, _chave_dia(datetime.fromtimestamp(agora).date()))
+        with self._lock:
+            return [(device_id, chave[1], sum(acc.kwh[chave]))
+                    for device_id, acc in self._dispositivos.items() if chave in acc.kwh]
+
+    # ---- Varredura em segundo plano ----
+    def iniciar(self, varredura=None):
+        # varredura: chamada a cada intervalo_varredura_s (padrão: expirar);
+        # o dashboard usa a mesma thread para expirar também os agregados
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._varrer, args=(varredura or self.expirar,),
+                                        name="energia-varredura", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _varrer(self, varredura):
+        while not self._parar.wait(self.intervalo_varredura_s):
+            varredura()
+
+    def metricas(self):
+        with self._lock:
+            ligados = sum(1 for acc in self._dispositivos.values() if any(acc.potencia))
+            potencia = sum(self._frota.potencia) if self._frota else 0.0
+        return {
+            "eventos": self.eventos,
+            "dispositivos": len(self._dispositivos),
+            "dispositivos_consumindo": ligados,
+            "potencia_frota_w": potencia,
+        }
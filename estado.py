@@ -0,0 +1,116 @@
+# =================================================================
+# ==== ESTADO DA FROTA ECOWORK ====
+# =================================================================
+# Guarda o último estado conhecido de cada ESP32 da frota.
+#
+# Cada dispositivo tem um registro compacto (com __slots__) e os
+# registros ficam espalhados em vários "shards", cada um com o seu
+# próprio lock. Assim a thread do MQTT e as requisições do Flask
+# disputam apenas o lock do shard do dispositivo, e não um lock global.
+
+import threading
+import time
+from contextlib import contextmanager
+
+STATUS_INICIAL = "Aguardando..."
+ALERTA_INICIAL = "Nenhum alerta recente."
+
+# Potência de 2 para o índice do shard ser um simples "&"
+NUM_SHARDS_PADRAO = 64
+
+
+class EstadoDispositivo:
+    # __slots__ evita um __dict__ por dispositivo (milhares de ESP32)
+    __slots__ = ("device_id", "telemetria", "status", "alerta", "atualizado_em", "alertas_vistos")
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.telemetria = {}
+        self.status = STATUS_INICIAL
+        self.alerta = ALERTA_INICIAL
+        self.atualizado_em = 0.0
+        # família do alerta -> (texto, ts): filtra as repetições do firmware
+        self.alertas_vistos = {}
+
+    def como_dict(self):
+        return {
+            "dispositivo": self.device_id,
+            "telemetria": dict(self.telemetria),
+            "status": self.status,
+            "alerta": self.alerta,
+            "atualizado_em": self.atualizado_em,
+        }
+
+
+class _Shard:
+    __slots__ = ("lock", "registros")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.registros = {}
+
+
+class EstadoFrota:
+    def __init__(self, num_shards=NUM_SHARDS_PADRAO):
+        if num_shards <= 0 or num_shards & (num_shards - 1):
+            raise ValueError("num_shards deve ser uma potência de 2")
+        self._mascara = num_shards - 1
+        self._shards = tuple(_Shard() for _ in range(num_shards))
+
+    def _shard(self, device_id):
+        return self._shards[hash(device_id) & self._mascara]
+
+    @contextmanager
+    def registro(self, device_id):
+        # Entrega o registro do dispositivo (criando se for novo) com o
+        # lock do shard adquirido. Toda leitura+escrita que precisa ser
+        # atômica (ex: status -> lâmpada) deve acontecer dentro do "with".
+        shard = self._shard(device_id)
+        with shard.lock:
+            reg = shard.registros.get(device_id)
+            if reg is None:
+                reg = shard.registros[device_id] = EstadoDispositivo(device_id)
+            yield reg
+            reg.atualizado_em = time.time()
+
+    def restaurar(self, estados):
+        # Recria registros a partir de (device_id, telemetria, status, alerta,
+        # atualizado_em), mantendo o atualizado_em original. Dispositivos que
+        # já publicaram desde o boot não são sobrescritos.
+        restaurados = 0
+        for device_id, telemetria, status, alerta, atualizado_em in estados:
+            shard = self._shard(device_id)
+            with shard.lock:
+                if device_id in shard.registros:
+                    continue
+                reg = shard.registros[device_id] = EstadoDispositivo(device_id)
+                reg.telemetria = telemetria
+                reg.status = status
+                reg.alerta = alerta
+                reg.atualizado_em = atualizado_em
+            restaurados += 1
+        return restaurados
+
+    def obter(self, device_id):
+        # Cópia do estado (ou None), segura para usar fora do lock
+        shard = self._shard(device_id)
+        with shard.lock:
+            reg = shard.registros.get(device_id)
+            return reg.como_dict() if reg is not None else None
+
+    def dispositivos(self):
+        ids = []
+        for shard in self._shards:
+            with shard.lock:
+                ids.extend(shard.registros)
+        return ids
+
+    def snapshot(self):
+        estados = []
+        for shard in self._shards:
+            with shard.lock:
+                estados.extend(reg.como_dict() for reg in shard.registros.values())
+        return estados
+
+    def __len__(self):
+        return sum(len(shard.registros) for shard in self._shards)
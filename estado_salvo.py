@@ -0,0 +1,245 @@
+# =================================================================
+# ==== ESTADO SALVO EM DISCO (REINÍCIO A QUENTE) ====
+# =================================================================
+# Sem isto, depois de reiniciar o servidor todo dispositivo aparece como
+# "Aguardando..." até publicar de novo. O último estado de cada ESP32
+# (telemetria, status, alerta) vai para um arquivo binário compacto a cada
+# poucos segundos e volta para o EstadoFrota no boot, antes do MQTT. Os
+# acumuladores de energia (kWh do dia, da semana e do mês) vão no mesmo
+# arquivo: sem eles, um reinício zeraria o consumo do período.
+#
+# Layout (little-endian), pensado para ser lido com mmap sem parse de texto:
+#   cabeçalho   "ECST" | uint16 versão | uint32 nº de textos |
+#               uint32 nº de registros | float64 salvo_em
+#   textos      uint16 tamanho | utf-8  (ids, status, alertas e lâmpada,
+#               cada texto repetido guardado uma vez só)
+#   registros   tamanho fixo: uint32 id | uint32 status | uint32 alerta |
+#               uint32 lâmpada | float64 atualizado_em |
+#               float64 temperatura, umidade, luminosidade, distancia
+#   energia     uint32 nº de acumuladores, cada um:
+#               uint32 id (0xFFFFFFFF = frota) | float64 ultimo_ts |
+#               float64 visto_em | float64 potência por carga |
+#               uint32 nº de períodos, seguido dos períodos:
+#               uint32 granularidade | uint32 chave | float64 kWh por carga
+#   (métrica ausente = NaN; texto ausente = 0xFFFFFFFF; a versão 1 não tem
+#   a seção de energia e continua sendo lida)
+#
+# A gravação é atômica (arquivo temporário + os.replace): um crash no meio
+# deixa o arquivo anterior intacto.
+
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from energia import CARGAS
+
+log = logging.getLogger("ecowork.estado_salvo")
+
+MAGICO = b"ECST"
+VERSAO = 2
+VERSOES_LIDAS = (1, 2)
+METRICAS = ("temperatura", "umidade", "luminosidade", "distancia")
+SEM_TEXTO = 0xFFFFFFFF
+
+_CABECALHO = struct.Struct("<4sHIId")
+_TAMANHO_TEXTO = struct.Struct("<H")
+_REGISTRO = struct.Struct("<IIIId" + "d" * len(METRICAS))
+_CONTAGEM = struct.Struct("<I")
+_ACUMULADOR = struct.Struct("<Idd" + "d" * len(CARGAS) + "I")
+_PERIODO = struct.Struct("<II" + "d" * len(CARGAS))
+_NAN = float("nan")
+
+
+class ArquivoEstadoInvalido(ValueError):
+    pass
+
+
+def _numero(valor):
+    return float(valor) if valor is not None and valor.__class__ in (int, float) else _NAN
+
+
+def salvar_estado(caminho, estados, energia=()):
+    # estados: [como_dict()] do EstadoFrota.snapshot(); energia: acumuladores
+    # de ContabilidadeEnergia.exportar(). Retorna quantos estados gravou
+    textos = {}
+
+    def id_texto(texto):
+        if texto is None:
+            return SEM_TEXTO
+        indice = textos.get(texto)
+        if indice is None:
+            indice = textos[texto] = len(textos)
+        return indice
+
+    registros = []
+    for estado in estados:
+        telemetria = estado["telemetria"]
+        registros.append(_REGISTRO.pack(
+            id_texto(estado["dispositivo"]), id_texto(estado["status"]), id_texto(estado["alerta"]),
+            id_texto(telemetria.get("lamp_status")), estado["atualizado_em"],
+            *(_numero(telemetria.get(m)) for m in METRICAS)))
+
+    acumuladores = []
+    for device_id, ultimo_ts, visto_em, potencia, periodos in energia:
+        acumuladores.append(_ACUMULADOR.pack(id_texto(device_id), ultimo_ts, visto_em,
+                                             *potencia, len(periodos)))
+        for granularidade, chave, kwh in periodos:
+            acumuladores.append(_PERIODO.pack(id_texto(granularidade), id_texto(chave), *kwh))
+    n_acumuladores = len(energia)
+
+    partes = [_CABECALHO.pack(MAGICO, VERSAO, len(textos), len(registros), time.time())]
+    for texto in textos:
+        codificado = texto.encode("utf-8")[:0xFFFF]
+        partes.append(_TAMANHO_TEXTO.pack(len(codificado)))
+        partes.append(codificado)
+    partes.extend(registros)
+    partes.append(_CONTAGEM.pack(n_acumuladores))
+    partes.extend(acumuladores)
+
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "wb") as f:
+        f.write(b"".join(partes))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+    return len(registros)
+
+
+def _ler_cabecalho(caminho, dados):
+    # (versão, textos, início e fim dos registros)
+    if len(dados) < _CABECALHO.size:
+        raise ArquivoEstadoInvalido(f"{caminho}: arquivo curto demais")
+    magico, versao, n_textos, n_registros, _ = _CABECALHO.unpack_from(dados)
+    if magico != MAGICO or versao not in VERSOES_LIDAS:
+        raise ArquivoEstadoInvalido(f"{caminho}: formato desconhecido ({magico!r} v{versao})")
+    textos = []
+    posicao = _CABECALHO.size
+    for _ in range(n_textos):
+        (tamanho,) = _TAMANHO_TEXTO.unpack_from(dados, posicao)
+        posicao += _TAMANHO_TEXTO.size
+        textos.append(dados[posicao:posicao + tamanho].decode("utf-8"))
+        posicao += tamanho
+    fim = posicao + n_registros * _REGISTRO.size
+    if fim > len(dados):
+        raise ArquivoEstadoInvalido(f"{caminho}: registros truncados")
+    return versao, textos, posicao, fim
+
+
+def carregar_estado(caminho):
+    # Gera (device_id, telemetria, status, alerta, atualizado_em) do arquivo
+    with open(caminho, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as dados:
+        _, textos, posicao, fim = _ler_cabecalho(caminho, dados)
+        visao = memoryview(dados)[posicao:fim]
+        try:
+            for id_disp, status, alerta, lampada, atualizado_em, *valores in _REGISTRO.iter_unpack(visao):
+                telemetria = {m: v for m, v in zip(METRICAS, valores) if not math.isnan(v)}
+                if lampada != SEM_TEXTO:
+                    telemetria["lamp_status"] = textos[lampada]
+                yield (textos[id_disp], telemetria, textos[status],
+                       textos[alerta], atualizado_em)
+        finally:
+            # O mmap só fecha sem nenhuma visão aberta sobre ele
+            visao.release()
+
+
+def carregar_energia(caminho):
+    # Acumuladores de energia do arquivo, no formato de ContabilidadeEnergia.exportar()
+    # ([] num arquivo da versão 1)
+    with open(caminho, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as dados:
+        versao, textos, _, posicao = _ler_cabecalho(caminho, dados)
+        if versao < 2:
+            return []
+        acumuladores = []
+        try:
+            (n_acumuladores,) = _CONTAGEM.unpack_from(dados, posicao)
+            posicao += _CONTAGEM.size
+            for _ in range(n_acumuladores):
+                id_disp, ultimo_ts, visto_em, *potencia, n_periodos = _ACUMULADOR.unpack_from(dados, posicao)
+                posicao += _ACUMULADOR.size
+                periodos = []
+                for _ in range(n_periodos):
+                    granularidade, chave, *kwh = _PERIODO.unpack_from(dados, posicao)
+                    posicao += _PERIODO.size
+                    periodos.append((textos[granularidade], textos[chave], kwh))
+                acumuladores.append((None if id_disp == SEM_TEXTO else textos[id_disp],
+                                     ultimo_ts, visto_em, potencia, periodos))
+        except struct.error as e:
+            raise ArquivoEstadoInvalido(f"{caminho}: energia truncada ({e})") from e
+    return acumuladores
+
+
+class SalvamentoPeriodico:
+    # Grava o EstadoFrota (e a energia, se houver) em disco a cada intervalo_s
+    # (thread própria)
+    def __init__(self, estado_frota, caminho, intervalo_s=30.0, energia=None):
+        self.estado_frota = estado_frota
+        self.energia = energia
+        self.caminho = caminho
+        self.intervalo_s = intervalo_s
+        self._parar = threading.Event()
+        self._thread = None
+        self.salvamentos = 0
+        self.ultimo_salvamento_ms = 0.0
+        self.restaurados = 0
+        self.energia_restaurados = 0
+        self.restauracao_ms = 0.0
+
+    def restaurar(self):
+        # Chamado no boot, antes do MQTT: devolve quantos dispositivos voltaram
+        if not os.path.exists(self.caminho):
+            return 0
+        inicio = time.perf_counter()
+        try:
+            self.restaurados = self.estado_frota.restaurar(carregar_estado(self.caminho))
+            if self.energia is not None:
+                self.energia_restaurados = self.energia.restaurar(carregar_energia(self.caminho))
+        except (OSError, ValueError, IndexError, struct.error, UnicodeDecodeError) as e:
+            # Arquivo truncado ou corrompido: o servidor sobe com o estado vazio
+            log.error("Estado salvo em %s ignorado: %s", self.caminho, e)
+            return 0
+        self.restauracao_ms = (time.perf_counter() - inicio) * 1000
+        log.info("Estado de %d dispositivos (energia de %d) restaurado de %s em %.1f ms",
+                 self.restaurados, self.energia_restaurados, self.caminho, self.restauracao_ms)
+        return self.restaurados
+
+    def salvar(self):
+        inicio = time.perf_counter()
+        try:
+            energia = self.energia.exportar() if self.energia is not None else ()
+            salvar_estado(self.caminho, self.estado_frota.snapshot(), energia)
+        except OSError as e:
+            log.error("Erro ao salvar o estado em %s: %s", self.caminho, e)
+            return
+        self.salvamentos += 1
+        self.ultimo_salvamento_ms = (time.perf_counter() - inicio) * 1000
+
+    def iniciar(self):
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._rodar, name="ecowork-estado-salvo", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        # Para a thread e grava uma última vez (desligamento limpo)
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.salvar()
+
+    def _rodar(self):
+        while not self._parar.wait(self.intervalo_s):
+            self.salvar()
+
+    def metricas(self):
+        return {
+            "arquivo": self.caminho,
+            "salvamentos": self.salvamentos,
+            "ultimo_salvamento_ms": round(self.ultimo_salvamento_ms, 2),
+            "restaurados": self.restaurados,
+            "energia_restaurados": self.energia_restaurados,
+            "restauracao_ms": round(self.restauracao_ms, 2),
+        }
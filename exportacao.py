@@ -0,0 +1,202 @@
+# =================================================================
+# ==== EXPORTAÇÃO EM MASSA DA TELEMETRIA ECOWORK ====
+# =================================================================
+# Exportações grandes (ex: o mês inteiro da frota, para relatórios ESG)
+# saem em streaming: os blocos do ArmazemTelemetria.exportar() viram
+# pedaços da resposta HTTP conforme são lidos do banco, então a memória do
+# processo não cresce com o tamanho da exportação.
+#
+# Formatos:
+# - csv: sempre disponível
+# - arrow (IPC stream) e parquet: colunares, para pandas/Polars/DuckDB;
+#   só com "pyarrow" instalado (opcional)
+#
+# Cada exportação mede linhas/s, registrado no log e em
+# /api/metricas/exportacao.
+
+import csv
+import io
+import logging
+import threading
+import time
+from collections import deque
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional; sem ele só CSV
+    pa = pq = None
+
+log = logging.getLogger("ecowork.exportacao")
+
+FORMATO_CSV = "csv"
+FORMATO_ARROW = "arrow"
+FORMATO_PARQUET = "parquet"
+FORMATOS_COLUNARES = (FORMATO_ARROW, FORMATO_PARQUET)
+
+TIPOS_CONTEUDO = {
+    FORMATO_CSV: "text/csv; charset=utf-8",
+    FORMATO_ARROW: "application/vnd.apache.arrow.stream",
+    FORMATO_PARQUET: "application/vnd.apache.parquet",
+}
+EXTENSOES = {FORMATO_CSV: "csv", FORMATO_ARROW: "arrows", FORMATO_PARQUET: "parquet"}
+
+# Linhas por pedaço da resposta. No parquet cada pedaço vira um row group,
+# então ele usa pedaços maiores (row groups pequenos comprimem mal)
+TAMANHO_BLOCO = {FORMATO_CSV: 5000, FORMATO_ARROW: 20000, FORMATO_PARQUET: 65536}
+
+
+def formatos_disponiveis():
+    return (FORMATO_CSV, *FORMATOS_COLUNARES) if pa is not None else (FORMATO_CSV,)
+
+
+def gerar_csv(blocos, colunas):
+    # Um pedaço de bytes por bloco (e um para o cabeçalho)
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator="\n")
+    escritor.writerow(colunas)
+    for bloco in blocos:
+        escritor.writerows(bloco)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _SaidaEmPedacos:
+    # "Arquivo" só de escrita para o pyarrow: guarda o que foi escrito até
+    # o gerador entregar como pedaço da resposta
+    def __init__(self):
+        self.pedacos = deque()
+        self.posicao = 0
+        self.closed = False
+
+    def write(self, dados):
+        dados = bytes(dados)
+        self.pedacos.append(dados)
+        self.posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self.posicao
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def esvaziar(self):
+        while self.pedacos:
+            yield self.pedacos.popleft()
+
+
+def reagrupar(blocos, tamanho):
+    # Junta blocos pequenos (ex: um dispositivo com poucas linhas) em blocos
+    # de ~tamanho linhas, para os row groups do parquet não ficarem minúsculos
+    pendente = []
+    for bloco in blocos:
+        pendente.extend(bloco)
+        if len(pendente) >= tamanho:
+            yield pendente
+            pendente = []
+    if pendente:
+        yield pendente
+
+
+def _esquema(colunas):
+    return pa.schema([pa.field(colunas[0], pa.string()), pa.field(colunas[1], pa.float64())]
+                     + [pa.field(c, pa.float64()) for c in colunas[2:]])
+
+
+def gerar_colunar(blocos, colunas, formato):
+    # Arrow IPC stream ou Parquet, um record batch por bloco
+    if pa is None:
+        raise RuntimeError("exportação colunar requer o pacote 'pyarrow'")
+    esquema = _esquema(colunas)
+    saida = _SaidaEmPedacos()
+    if formato == FORMATO_PARQUET:
+        escritor = pq.ParquetWriter(saida, esquema, compression="zstd")
+    else:
+        escritor = pa.ipc.new_stream(saida, esquema)
+    try:
+        for bloco in reagrupar(blocos, TAMANHO_BLOCO[formato]):
+            escritor.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(coluna, type=campo.type) for coluna, campo in zip(zip(*bloco), esquema)],
+                schema=esquema))
+            yield from saida.esvaziar()
+    finally:
+        escritor.close()
+    yield from saida.esvaziar()
+
+
+class MedidorExportacao:
+    # Conta linhas e bytes de cada exportação enquanto ela é transmitida
+    def __init__(self, janela=20):
+        self._lock = threading.Lock()
+        self._recentes = deque(maxlen=janela)
+        self.em_andamento = 0
+        self.exportacoes = 0
+        self.linhas = 0
+        self.bytes = 0
+
+    def contar_linhas(self, blocos, andamento):
+        for bloco in blocos:
+            andamento["linhas"] += len(bloco)
+            yield bloco
+
+    def acompanhar(self, pedacos, andamento, descricao):
+        # Envolve o gerador da resposta; no fim (ou se o cliente desistir) registra a taxa
+        inicio = time.perf_counter()
+        with self._lock:
+            self.em_andamento += 1
+        completa = False
+        try:
+            for pedaco in pedacos:
+                andamento["bytes"] += len(pedaco)
+                yield pedaco
+            completa = True
+        finally:
+            decorrido = max(time.perf_counter() - inicio, 1e-9)
+            resultado = {
+                **descricao,
+                "linhas": andamento["linhas"],
+                "bytes": andamento["bytes"],
+                "segundos": round(decorrido, 3),
+                "linhas_por_s": round(andamento["linhas"] / decorrido),
+                "completa": completa,
+            }
+            with self._lock:
+                self.em_andamento -= 1
+                self.exportacoes += 1
+                self.linhas += andamento["linhas"]
+                self.bytes += andamento["bytes"]
+                self._recentes.append(resultado)
+            log.info("Exportação %s: %d linhas, %.1f MB em %.1f s (%d linhas/s)%s",
+                     descricao.get("formato"), resultado["linhas"], resultado["bytes"] / 1e6,
+                     decorrido, resultado["linhas_por_s"], "" if completa else " [interrompida]")
+
+    def exportar(self, blocos, colunas, formato, descricao):
+        # Gerador de bytes da exportação, já medido
+        andamento = {"linhas": 0, "bytes": 0}
+        blocos = self.contar_linhas(blocos, andamento)
+        pedacos = gerar_csv(blocos, colunas) if formato == FORMATO_CSV else gerar_colunar(blocos, colunas, formato)
+        return self.acompanhar(pedacos, andamento, {"formato": formato, **descricao})
+
+    def resumo(self):
+        with self._lock:
+            return {
+                "formatos": list(formatos_disponiveis()),
+                "em_andamento": self.em_andamento,
+                "exportacoes": self.exportacoes,
+                "linhas": self.linhas,
+                "bytes": self.bytes,
+                "recentes": list(self._recentes),
+            }
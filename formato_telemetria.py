@@ -0,0 +1,134 @@
+# =================================================================
+# ==== FORMATO DA TELEMETRIA ECOWORK (JSON ou binário) ====
+# =================================================================
+# O ESP32 pode publicar a telemetria de dois jeitos no mesmo tópico:
+#
+# - JSON (padrão, firmwares antigos):
+#     {"temperatura":24.5,"umidade":55.1,"luminosidade":3050,"distancia":45}
+# - Binário compacto (TELEMETRIA_BINARIA no EcoWork.c++), 10 bytes,
+#   little-endian, layout fixo:
+#     byte 0    0xEC        marcador (um JSON nunca começa com esse byte)
+#     byte 1    versão      1
+#     int16     temperatura x 10  (24.5 °C -> 245)
+#     uint16    umidade x 10      (55.1 %  -> 551)
+#     uint16    luminosidade      (0-4095 do ADC)
+#     uint16    distancia (cm)
+#   Valores ausentes usam o sentinela do tipo (-32768 ou 65535).
+# - Lote binário (TELEMETRIA_LOTE > 1 no EcoWork.c++): K leituras numa
+#   mensagem só, 3 + 10*K bytes:
+#     byte 0    0xEC        marcador
+#     byte 1    versão      2
+#     byte 2    K           leituras no lote (1-255)
+#     K registros de 10 bytes, da mais antiga para a mais nova:
+#       uint16  idade (décimos de segundo antes do envio)
+#       int16 temperatura x 10 | uint16 umidade x 10 | uint16 luminosidade | uint16 distancia
+#   O ESP32 não tem relógio confiável: o servidor data cada leitura como
+#   recebimento - idade.
+#
+# O servidor detecta o formato pelo primeiro byte de cada mensagem, então
+# as duas versões de firmware convivem na mesma frota.
+
+import json
+import struct
+
+MARCADOR_BINARIO = 0xEC
+VERSAO_BINARIO = 1
+VERSAO_LOTE = 2
+MAX_LEITURAS_LOTE = 255
+
+# Struct pré-compilado: o unpack não precisa reinterpretar o formato
+_REGISTRO_V1 = struct.Struct("<BBhHHH")
+TAMANHO_BINARIO_V1 = _REGISTRO_V1.size
+_CABECALHO_LOTE = struct.Struct("<BBB")
+_LEITURA_LOTE = struct.Struct("<HhHHH")
+
+_AUSENTE_INT16 = -32768
+_AUSENTE_UINT16 = 0xFFFF
+
+
+class FormatoInvalido(ValueError):
+    # Payload binário com tamanho ou versão desconhecidos
+    pass
+
+
+def eh_binario(payload):
+    return bool(payload) and payload[0] == MARCADOR_BINARIO
+
+
+def decodificar_telemetria(payload):
+    # bytes -> dict com as métricas (mesmas chaves do JSON)
+    if eh_binario(payload):
+        if len(payload) != TAMANHO_BINARIO_V1:
+            raise FormatoInvalido(f"telemetria binária com {len(payload)} bytes (esperado {TAMANHO_BINARIO_V1})")
+        _, versao, temperatura, umidade, luminosidade, distancia = _REGISTRO_V1.unpack(payload)
+        if versao != VERSAO_BINARIO:
+            raise FormatoInvalido(f"versão de telemetria binária desconhecida: {versao}")
+        return {
+            "temperatura": None if temperatura == _AUSENTE_INT16 else temperatura / 10,
+            "umidade": None if umidade == _AUSENTE_UINT16 else umidade / 10,
+            "luminosidade": None if luminosidade == _AUSENTE_UINT16 else luminosidade,
+            "distancia": None if distancia == _AUSENTE_UINT16 else distancia,
+        }
+    # decode antes do json.loads: com bytes o json.loads ainda detecta a
+    # codificação e decodifica por conta própria, e fica mais lento
+    dados = json.loads(payload.decode("utf-8", errors="replace"))
+    if not isinstance(dados, dict):
+        raise FormatoInvalido("telemetria JSON precisa ser um objeto")
+    return dados
+
+
+def eh_lote(payload):
+    return len(payload) >= 2 and payload[0] == MARCADOR_BINARIO and payload[1] == VERSAO_LOTE
+
+
+def decodificar_leituras(payload):
+    # bytes -> [(idade_s, dados)] de qualquer formato. JSON e binário v1
+    # trazem uma leitura só, de idade 0
+    if not eh_lote(payload):
+        return [(0.0, decodificar_telemetria(payload))]
+    if len(payload) < _CABECALHO_LOTE.size:
+        raise FormatoInvalido("lote de telemetria sem cabeçalho")
+    quantas = payload[2]
+    if quantas == 0 or len(payload) != _CABECALHO_LOTE.size + quantas * _LEITURA_LOTE.size:
+        raise FormatoInvalido(f"lote de telemetria com {len(payload)} bytes para {quantas} leituras")
+    # iter_unpack percorre os K registros numa passada só, em C, sem fatiar o payload
+    return [(idade / 10, {
+        "temperatura": None if temperatura == _AUSENTE_INT16 else temperatura / 10,
+        "umidade": None if umidade == _AUSENTE_UINT16 else umidade / 10,
+        "luminosidade": None if luminosidade == _AUSENTE_UINT16 else luminosidade,
+        "distancia": None if distancia == _AUSENTE_UINT16 else distancia,
+    }) for idade, temperatura, umidade, luminosidade, distancia
+        in _LEITURA_LOTE.iter_unpack(memoryview(payload)[_CABECALHO_LOTE.size:])]
+
+
+def _inteiro(valor, escala, minimo, maximo, ausente):
+    if valor is None:
+        return ausente
+    return max(minimo, min(maximo, int(round(valor * escala))))
+
+
+def codificar_telemetria(dados):
+    # dict -> 10 bytes (o mesmo que o firmware monta; usado no simulador e nos testes de carga)
+    return _REGISTRO_V1.pack(
+        MARCADOR_BINARIO, VERSAO_BINARIO,
+        _inteiro(dados.get("temperatura"), 10, -32767, 32767, _AUSENTE_INT16),
+        _inteiro(dados.get("umidade"), 10, 0, 0xFFFE, _AUSENTE_UINT16),
+        _inteiro(dados.get("luminosidade"), 1, 0, 0xFFFE, _AUSENTE_UINT16),
+        _inteiro(dados.get("distancia"), 1, 0, 0xFFFE, _AUSENTE_UINT16),
+    )
+
+
+def codificar_lote(leituras):
+    # [(idade_s, dados)] -> lote v2 (o mesmo que o firmware monta com TELEMETRIA_LOTE > 1)
+    if not 0 < len(leituras) <= MAX_LEITURAS_LOTE:
+        raise ValueError(f"um lote leva de 1 a {MAX_LEITURAS_LOTE} leituras")
+    partes = [_CABECALHO_LOTE.pack(MARCADOR_BINARIO, VERSAO_LOTE, len(leituras))]
+    for idade_s, dados in leituras:
+        partes.append(_LEITURA_LOTE.pack(
+            max(0, min(0xFFFF, int(round(idade_s * 10)))),
+            _inteiro(dados.get("temperatura"), 10, -32767, 32767, _AUSENTE_INT16),
+            _inteiro(dados.get("umidade"), 10, 0, 0xFFFE, _AUSENTE_UINT16),
+            _inteiro(dados.get("luminosidade"), 1, 0, 0xFFFE, _AUSENTE_UINT16),
+            _inteiro(dados.get("distancia"), 1, 0, 0xFFFE, _AUSENTE_UINT16),
+        ))
+    return b"".join(partes)
@@ -0,0 +1,188 @@
+# =================================================================
+# ==== HISTÓRICO EM MEMÓRIA ECOWORK ====
+# =================================================================
+# Séries temporais recentes de cada dispositivo, para os gráficos não
+# começarem vazios quando a página é recarregada.
+#
+# Cada dispositivo tem um buffer circular com capacidade máxima fixa: uma
+# coluna de timestamps (atribuídos pelo servidor) e uma coluna por métrica,
+# todas em array('d') (8 bytes por valor, sem objetos Python por ponto).
+# As colunas começam pequenas e dobram até a capacidade conforme chegam
+# leituras: dispositivos novos ou que quase não publicam não reservam a
+# janela inteira (com 10 mil dispositivos seriam ~700 MB antes da 1ª leitura).
+# Os timestamps são crescentes, então consultas por intervalo são feitas
+# com busca binária direto no buffer, sem copiar o buffer inteiro.
+
+import math
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+METRICAS = ("temperatura", "umidade", "luminosidade", "distancia")
+
+NAN = float("nan")
+# Pontos alocados por coluna quando o buffer é criado (depois dobra)
+CAPACIDADE_INICIAL = 32
+
+
+def _como_float(v):
+    if v is None:
+        return NAN
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return NAN
+
+
+class _VisaoTimestamps:
+    # Enxerga a coluna circular de timestamps como uma sequência ordenada
+    # (índice lógico 0 = mais antigo) para o bisect funcionar sem cópia
+    __slots__ = ("_ts", "_inicio", "_tamanho", "_capacidade")
+
+    def __init__(self, ts, inicio, tamanho, capacidade):
+        self._ts = ts
+        self._inicio = inicio
+        self._tamanho = tamanho
+        self._capacidade = capacidade
+
+    def __len__(self):
+        return self._tamanho
+
+    def __getitem__(self, i):
+        return self._ts[(self._inicio + i) % self._capacidade]
+
+
+class BufferCircular:
+    __slots__ = ("capacidade", "retencao_s", "metricas", "_ts", "_colunas",
+                 "_alocado", "_inicio", "_tamanho", "_lock")
+
+    def __init__(self, capacidade, retencao_s=None, metricas=METRICAS):
+        if capacidade <= 0:
+            raise ValueError("capacidade deve ser maior que zero")
+        self.capacidade = capacidade
+        self.retencao_s = retencao_s
+        self.metricas = tuple(metricas)
+        self._alocado = min(capacidade, CAPACIDADE_INICIAL)
+        self._ts = array("d", bytes(8 * self._alocado))
+        self._colunas = {m: array("d", bytes(8 * self._alocado)) for m in self.metricas}
+        self._inicio = 0
+        self._tamanho = 0
+        self._lock = threading.Lock()
+
+    def adicionar(self, ts, valores):
+        # valores: dict métrica -> número (métricas ausentes viram NaN)
+        with self._lock:
+            if self._tamanho:
+                ultimo = self._ts[(self._inicio + self._tamanho - 1) % self._alocado]
+                # Relógio do servidor voltou? Mantém a coluna ordenada
+                if ts < ultimo:
+                    ts = ultimo
+            if self._tamanho == self._alocado and self._alocado < self.capacidade:
+                self._crescer()
+            if self._tamanho < self._alocado:
+                pos = (self._inicio + self._tamanho) % self._alocado
+                self._tamanho += 1
+            else:
+                # Cheio: sobrescreve o mais antigo
+                pos = self._inicio
+                self._inicio = (self._inicio + 1) % self._alocado
+            self._ts[pos] = ts
+            for m, coluna in self._colunas.items():
+                coluna[pos] = _como_float(valores.get(m))
+            if self.retencao_s is not None:
+                self._descartar_antes(ts - self.retencao_s)
+
+    def _crescer(self):
+        # Dobra as colunas (até a capacidade), com o mais antigo no índice 0
+        novo = min(self.capacidade, self._alocado * 2)
+        extra = array("d", bytes(8 * (novo - self._alocado)))
+        self._ts = self._fatiar(self._ts, 0, self._tamanho) + extra
+        for m, coluna in self._colunas.items():
+            self._colunas[m] = self._fatiar(coluna, 0, self._tamanho) + extra
+        self._inicio = 0
+        self._alocado = novo
+
+    def _descartar_antes(self, ts_min):
+        n = bisect_left(self._visao(), ts_min)
+        if n:
+            self._inicio = (self._inicio + n) % self._alocado
+            self._tamanho -= n
+
+    def _visao(self):
+        return _VisaoTimestamps(self._ts, self._inicio, self._tamanho, self._alocado)
+
+    def _fatiar(self, coluna, i0, i1):
+        # Copia só os índices lógicos [i0, i1) (no máximo duas fatias)
+        a = (self._inicio + i0) % self._alocado
+        n = i1 - i0
+        if a + n <= self._alocado:
+            return coluna[a:a + n]
+        return coluna[a:] + coluna[:a + n - self._alocado]
+
+    def consultar(self, metrica, de=None, ate=None):
+        # Retorna (timestamps, valores) de [de, ate], pulando leituras sem a métrica
+        if metrica not in self._colunas:
+            raise KeyError(metrica)
+        with self._lock:
+            visao = self._visao()
+            i0 = 0 if de is None else bisect_left(visao, de)
+            i1 = self._tamanho if ate is None else bisect_right(visao, ate)
+            if i1 <= i0:
+                return [], []
+            ts = self._fatiar(self._ts, i0, i1)
+            valores = self._fatiar(self._colunas[metrica], i0, i1)
+        pares = [(t, v) for t, v in zip(ts, valores) if not math.isnan(v)]
+        return [t for t, _ in pares], [v for _, v in pares]
+
+    def ultimos(self, metrica, n):
+        # Os n pontos mais recentes (usado para preencher gráficos)
+        with self._lock:
+            i0 = max(0, self._tamanho - n)
+            ts = self._fatiar(self._ts, i0, self._tamanho)
+            valores = self._fatiar(self._colunas[metrica], i0, self._tamanho)
+        pares = [(t, v) for t, v in zip(ts, valores) if not math.isnan(v)]
+        return [t for t, _ in pares], [v for _, v in pares]
+
+    def __len__(self):
+        return self._tamanho
+
+
+class HistoricoFrota:
+    def __init__(self, retencao_s, intervalo_leitura_s=3.0, folga=1.5, metricas=METRICAS):
+        # Capacidade máxima = pontos que cabem na janela de retenção (com folga
+        # para dispositivos que publiquem um pouco mais rápido)
+        self.retencao_s = retencao_s
+        self.metricas = tuple(metricas)
+        self.capacidade = max(1, int(retencao_s / intervalo_leitura_s * folga))
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def _buffer(self, device_id, criar=False):
+        buf = self._buffers.get(device_id)
+        if buf is None and criar:
+            with self._lock:
+                buf = self._buffers.get(device_id)
+                if buf is None:
+                    buf = self._buffers[device_id] = BufferCircular(
+                        self.capacidade, self.retencao_s, self.metricas)
+        return buf
+
+    def registrar(self, device_id, ts, dados):
+        self._buffer(device_id, criar=True).adicionar(ts, dados)
+
+    def consultar(self, device_id, metrica, de=None, ate=None):
+        if metrica not in self.metricas:
+            raise KeyError(metrica)
+        buf = self._buffer(device_id)
+        if buf is None:
+            return [], []
+        return buf.consultar(metrica, de, ate)
+
+    def ultimos(self, device_id, metrica, n):
+        buf = self._buffer(device_id)
+        if buf is None:
+            return [], []
+        return buf.ultimos(metrica, n)
+
+    def dispositivos(self):
+        return list(self._buffers)
@@ -0,0 +1,156 @@
+# =================================================================
+# ==== PIPELINE DE INGESTÃO ECOWORK ====
+# =================================================================
+# Separa a thread de rede do paho do processamento das mensagens.
+#
+# O on_message só coloca (topic, payload, ts_recebimento) numa fila
+# limitada e retorna. Um pool de workers retira as mensagens em lotes,
+# decodifica e roteia. Cada worker tem a sua própria fila e as mensagens
+# são distribuídas pelo hash do dispositivo: assim todas as mensagens de
+# um mesmo ESP32 são processadas em ordem (status antes da lâmpada),
+# mesmo com vários workers.
+
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger("ecowork.ingestao")
+
+# Políticas para quando a fila está cheia
+POLITICA_DESCARTAR_ANTIGA = "descartar_antiga"  # perde a mais velha, guarda a nova
+POLITICA_DESCARTAR_NOVA = "descartar_nova"      # perde a que acabou de chegar
+POLITICA_BLOQUEAR = "bloquear"                  # segura a thread do paho (cuidado!)
+POLITICAS = (POLITICA_DESCARTAR_ANTIGA, POLITICA_DESCARTAR_NOVA, POLITICA_BLOQUEAR)
+
+
+class FilaLimitada:
+    def __init__(self, capacidade, politica=POLITICA_DESCARTAR_ANTIGA):
+        if capacidade <= 0:
+            raise ValueError("capacidade deve ser maior que zero")
+        if politica not in POLITICAS:
+            raise ValueError(f"política desconhecida: {politica!r} (use uma de {POLITICAS})")
+        self.capacidade = capacidade
+        self.politica = politica
+        self.descartadas = 0
+        self._itens = deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._fechada = False
+
+    def colocar(self, item, timeout=None):
+        # Retorna False se a mensagem foi descartada
+        with self._cond:
+            if len(self._itens) >= self.capacidade:
+                if self.politica == POLITICA_DESCARTAR_NOVA:
+                    self.descartadas += 1
+                    return False
+                if self.politica == POLITICA_DESCARTAR_ANTIGA:
+                    self._itens.popleft()
+                    self.descartadas += 1
+                else:
+                    fim = None if timeout is None else time.monotonic() + timeout
+                    while len(self._itens) >= self.capacidade and not self._fechada:
+                        restante = None if fim is None else fim - time.monotonic()
+                        if restante is not None and restante <= 0:
+                            self.descartadas += 1
+                            return False
+                        self._cond.wait(restante)
+            if self._fechada:
+                return False
+            self._itens.append(item)
+            self._cond.notify_all()
+            return True
+
+    def retirar_lote(self, max_itens, timeout=None):
+        # Espera ao menos 1 item e devolve até max_itens de uma vez.
+        # Lista vazia = timeout ou fila fechada.
+        with self._cond:
+            if not self._itens and not self._fechada:
+                self._cond.wait(timeout)
+            itens = self._itens
+            n = min(len(itens), max_itens)
+            lote = [itens.popleft() for _ in range(n)]
+            if lote and self.politica == POLITICA_BLOQUEAR:
+                self._cond.notify_all()
+            return lote
+
+    @property
+    def fechada(self):
+        return self._fechada
+
+    def fechar(self):
+        with self._cond:
+            self._fechada = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._itens)
+
+
+class PipelineIngestao:
+    def __init__(self, processar_lote, num_workers=4, capacidade=10000,
+                 politica=POLITICA_DESCARTAR_ANTIGA, tamanho_lote=256,
+                 chave_particao=None):
+        # processar_lote(lote) recebe uma lista de (topic, payload, ts)
+        # chave_particao(topic) define qual worker atende a mensagem
+        if num_workers <= 0:
+            raise ValueError("num_workers deve ser maior que zero")
+        self._processar_lote = processar_lote
+        self._chave_particao = chave_particao or (lambda topic: topic)
+        self.tamanho_lote = tamanho_lote
+        por_worker = max(1, capacidade // num_workers)
+        self._filas = [FilaLimitada(por_worker, politica) for _ in range(num_workers)]
+        self._threads = []
+        self._lock_contadores = threading.Lock()
+        self.processadas = 0
+        self.lotes = 0
+        self.erros = 0
+
+    def iniciar(self):
+        for i, fila in enumerate(self._filas):
+            t = threading.Thread(target=self._worker, args=(fila,), name=f"ecowork-ingestao-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def parar(self, timeout=5.0):
+        for fila in self._filas:
+            fila.fechar()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def enfileirar(self, topic, payload, ts_recebimento, timeout=None):
+        # Chamado na thread do paho: precisa ser O(1) e não pode lançar exceção
+        fila = self._filas[hash(self._chave_particao(topic)) % len(self._filas)]
+        return fila.colocar((topic, payload, ts_recebimento), timeout)
+
+    def _worker(self, fila):
+        while True:
+            lote = fila.retirar_lote(self.tamanho_lote, timeout=1.0)
+            if not lote:
+                if fila.fechada and not len(fila):
+                    return
+                continue
+            try:
+                self._processar_lote(lote)
+            except Exception as e:
+                with self._lock_contadores:
+                    self.erros += 1
+                log.error("Erro ao processar lote: %s", e)
+            with self._lock_contadores:
+                self.processadas += len(lote)
+                self.lotes += 1
+
+    def metricas(self):
+        profundidades = [len(f) for f in self._filas]
+        return {
+            "profundidade": sum(profundidades),
+            "profundidade_por_worker": profundidades,
+            "capacidade": sum(f.capacidade for f in self._filas),
+            "descartadas": sum(f.descartadas for f in self._filas),
+            "processadas": self.processadas,
+            "lotes": self.lotes,
+            "erros": self.erros,
+            "workers": len(self._filas),
+            "politica": self._filas[0].politica,
+        }
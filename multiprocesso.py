@@ -0,0 +1,128 @@
+# =================================================================
+# ==== MODO MULTIPROCESSO ECOWORK ====
+# =================================================================
+# Um processo dashboard.py só usa um núcleo (GIL). Este supervisor sobe
+# N processos, cada um dono de uma partição da frota:
+#
+# - todos assinam os mesmos tópicos MQTT, e cada um descarta no on_message
+#   (antes de decodificar) os dispositivos que não são seus:
+#   crc32(device_id) % N. Assinaturas compartilhadas do broker
+#   ($share/<grupo>/...) distribuem mensagem a mensagem, então o status e
+#   a telemetria de um mesmo dispositivo poderiam cair em processos
+#   diferentes e a lógica da lâmpada veria o status errado.
+# - o Socket.IO dos processos é ligado por uma fila de mensagens: o
+#   processo dono emite para "dispositivo:<id>" e o navegador recebe em
+#   qualquer processo. Sem --fila, sobe o barramento local (barramento.py).
+# - o processo i escuta na porta --porta + i. Consultas de histórico e de
+#   energia de um dispositivo são redirecionadas ao processo dono dele.
+#
+#   python multiprocesso.py --workers 4
+#   python multiprocesso.py --workers 4 --fila redis://localhost:6379/0
+#   python multiprocesso.py --workers 4 --modo asyncio
+
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from barramento import HubBarramento, ESQUEMA as ESQUEMA_BARRAMENTO
+from observabilidade import configurar_logs
+
+log = logging.getLogger("ecowork.multiprocesso")
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+INTERVALO_VIGILANCIA_S = 1.0
+ESPERA_REINICIO_S = 2.0
+
+
+class Supervisor:
+    def __init__(self, workers, porta, fila, host="0.0.0.0", modo="threading"):
+        self.workers = workers
+        self.porta = porta
+        self.fila = fila
+        self.host = host
+        self.modo = modo
+        self._processos = [None] * workers
+        self._parando = False
+
+    def _ambiente(self, indice):
+        ambiente = dict(os.environ)
+        ambiente.update({
+            "ECOWORK_PARTICAO": f"{indice}/{self.workers}",
+            "ECOWORK_FILA_MENSAGENS": self.fila,
+            "ECOWORK_HOST": self.host,
+            "ECOWORK_PORTA": str(self.porta + indice),
+            # threading ou asyncio: os dois modos têm gerenciador para a fila
+            "ECOWORK_MODO": self.modo,
+            "ECOWORK_DEBUG": "0",
+        })
+        return ambiente
+
+    def _iniciar(self, indice):
+        self._processos[indice] = subprocess.Popen(
+            [sys.executable, os.path.join(RAIZ, "dashboard.py")], env=self._ambiente(indice))
+        log.info("Worker %d/%d iniciado (pid %d, porta %d)", indice, self.workers,
+                 self._processos[indice].pid, self.porta + indice)
+
+    def rodar(self):
+        for indice in range(self.workers):
+            self._iniciar(indice)
+        while not self._parando:
+            time.sleep(INTERVALO_VIGILANCIA_S)
+            for indice, processo in enumerate(self._processos):
+                if not self._parando and processo.poll() is not None:
+                    # Sem o dono, a partição inteira fica sem dados: sobe de novo
+                    log.error("Worker %d saiu com código %s, reiniciando", indice, processo.returncode)
+                    time.sleep(ESPERA_REINICIO_S)
+                    self._iniciar(indice)
+
+    def parar(self, *_):
+        self._parando = True
+        for processo in self._processos:
+            if processo is not None and processo.poll() is None:
+                processo.terminate()
+        for processo in self._processos:
+            if processo is not None:
+                try:
+                    processo.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    processo.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EcoWork com vários processos (partições da frota)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--porta", type=int, default=5000, help="porta do worker 0 (worker i usa porta + i)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--fila", help="fila do Socket.IO (redis://..., amqp://...); "
+                                       "sem ela, sobe o barramento local")
+    parser.add_argument("--porta-barramento", type=int, default=5100)
+    parser.add_argument("--modo", choices=("threading", "asyncio"), default="threading",
+                        help="servidor de cada worker (asyncio para muitos navegadores; ver servidor_async.py)")
+    args = parser.parse_args()
+
+    configurar_logs(os.environ.get("ECOWORK_LOG", "INFO"))
+    hub = None
+    fila = args.fila
+    if fila is None:
+        hub = HubBarramento("127.0.0.1", args.porta_barramento)
+        hub.iniciar()
+        fila = f"{ESQUEMA_BARRAMENTO}://127.0.0.1:{args.porta_barramento}"
+
+    supervisor = Supervisor(args.workers, args.porta, fila, args.host, args.modo)
+    signal.signal(signal.SIGTERM, supervisor.parar)
+    try:
+        supervisor.rodar()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.parar()
+        if hub is not None:
+            hub.parar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# =================================================================
+# ==== OBSERVABILIDADE ECOWORK (métricas e logs) ====
+# =================================================================
+# Métricas no formato texto do Prometheus (rota /metrics) sem depender do
+# prometheus_client:
+#   Contador   -> só sobe (mensagens, erros, reconexões), com rótulos
+#   Histograma -> distribuição de tempos em baldes fixos
+#   Medidor    -> valor lido na hora da coleta (fila, clientes conectados)
+#
+# Os contadores e histogramas são atualizados nos caminhos quentes, então
+# cada atualização é só um lock curto e uma soma.
+#
+# Logs: logging da biblioteca padrão, com nível configurável e um filtro
+# que limita quantas vezes a mesma mensagem aparece por intervalo (um
+# payload quebrado repetido não inunda o terminal). Logs por mensagem são
+# DEBUG: com o nível em INFO eles custam só uma comparação.
+
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+# Baldes (em segundos) para tempos de processamento e envio
+BALDES_PADRAO = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+ROTULO_OUTROS = "_outros"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(nomes, valores):
+    if not nomes:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)) + "}"
+
+
+def _formatar_numero(v):
+    if v == math.inf:
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15:
+        return str(int(v))
+    return repr(v)
+
+
+class Contador:
+    def __init__(self, nome, ajuda, rotulos=(), max_series=None):
+        # max_series: teto de combinações de rótulos (ex: um rótulo por
+        # dispositivo numa frota enorme); as excedentes somam em "_outros"
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.max_series = max_series
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *valores_rotulos, n=1):
+        with self._lock:
+            atual = self._valores.get(valores_rotulos)
+            if atual is None:
+                if self.max_series is not None and len(self._valores) >= self.max_series:
+                    valores_rotulos = (ROTULO_OUTROS,) * len(self.rotulos)
+                    atual = self._valores.get(valores_rotulos, 0)
+                else:
+                    atual = 0
+            self._valores[valores_rotulos] = atual + n
+
+    def valor(self, *valores_rotulos):
+        return self._valores.get(valores_rotulos, 0)
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            itens = list(self._valores.items())
+        if not itens and not self.rotulos:
+            itens = [((), 0)]
+        for valores, total in itens:
+            linhas.append(f"{self.nome}{_formatar_rotulos(self.rotulos, valores)} {_formatar_numero(total)}")
+        return linhas
+
+
+class Histograma:
+    def __init__(self, nome, ajuda, baldes=BALDES_PADRAO):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.baldes = tuple(sorted(baldes))
+        self._contagens = [0] * (len(self.baldes) + 1)  # último = +Inf
+        self._soma = 0.0
+        self._lock = threading.Lock()
+
+    def observar(self, valor):
+        i = bisect_left(self.baldes, valor)
+        with self._lock:
+            self._contagens[i] += 1
+            self._soma += valor
+
+    def cronometrar(self):
+        return _Cronometro(self)
+
+    def exportar(self):
+        with self._lock:
+            contagens = list(self._contagens)
+            soma = self._soma
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        acumulado = 0
+        for limite, n in zip(self.baldes + (math.inf,), contagens):
+            acumulado += n
+            linhas.append(f'{self.nome}_bucket{{le="{_formatar_numero(float(limite))}"}} {acumulado}')
+        linhas.append(f"{self.nome}_sum {_formatar_numero(soma)}")
+        linhas.append(f"{self.nome}_count {acumulado}")
+        return linhas
+
+
+class _Cronometro:
+    __slots__ = ("_histograma", "_inicio")
+
+    def __init__(self, histograma):
+        self._histograma = histograma
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histograma.observar(time.perf_counter() - self._inicio)
+        return False
+
+
+class Medidor:
+    def __init__(self, nome, ajuda, funcao, tipo="gauge"):
+        # funcao() é chamada só na coleta; tipo="counter" para totais que
+        # já são contados em outro lugar (ex: descartes da fila)
+        self.nome = nome
+        self.ajuda = ajuda
+        self.funcao = funcao
+        self.tipo = tipo
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        try:
+            linhas.append(f"{self.nome} {_formatar_numero(float(self.funcao()))}")
+        except Exception:
+            # Uma métrica quebrada não derruba a coleta das outras
+            pass
+        return linhas
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=(), max_series=None):
+        return self.registrar(Contador(nome, ajuda, rotulos, max_series))
+
+    def histograma(self, nome, ajuda, baldes=BALDES_PADRAO):
+        return self.registrar(Histograma(nome, ajuda, baldes))
+
+    def medidor(self, nome, ajuda, funcao, tipo="gauge"):
+        return self.registrar(Medidor(nome, ajuda, funcao, tipo))
+
+    def exportar(self):
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
+
+
+# =================================================================
+# ==== Logs ====
+# =================================================================
+class FiltroTaxa(logging.Filter):
+    # Deixa passar no máximo "limite" registros com o mesmo texto-modelo
+    # (record.msg, antes de formatar) a cada "intervalo_s" segundos. Quando
+    # a janela vira, o próximo registro avisa quantos foram suprimidos.
+    def __init__(self, limite=10, intervalo_s=10.0):
+        super().__init__()
+        self.limite = limite
+        self.intervalo_s = intervalo_s
+        self._janelas = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        chave = (record.name, record.msg)
+        agora = time.monotonic()
+        with self._lock:
+            inicio, contagem, suprimidos = self._janelas.get(chave, (agora, 0, 0))
+            if agora - inicio >= self.intervalo_s:
+                inicio, contagem = agora, 0
+            if contagem >= self.limite:
+                self._janelas[chave] = (inicio, contagem, suprimidos + 1)
+                return False
+            self._janelas[chave] = (inicio, contagem + 1, 0)
+        if suprimidos:
+            record.msg = f"{record.msg} (+{suprimidos} suprimidas)"
+        return True
+
+
+def configurar_logs(nivel="INFO", limite=10, intervalo_s=10.0):
+    # Configura o logger "ecowork" (e os filhos: ecowork.mqtt, ecowork.ingestao...)
+    logger = logging.getLogger("ecowork")
+    logger.setLevel(nivel.upper() if isinstance(nivel, str) else nivel)
+    if not any(getattr(h, "_ecowork", False) for h in logger.handlers):
+        handler = logging.StreamHandler()
+        handler._ecowork = True
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+        handler.addFilter(FiltroTaxa(limite, intervalo_s))
+        logger.addHandler(handler)
+        logger.propagate = False
+    return logger
@@ -0,0 +1,375 @@
+# =================================================================
+# ==== PERSISTÊNCIA DA TELEMETRIA ECOWORK ====
+# =================================================================
+# Guarda as leituras em SQLite (modo WAL) para não perder nada quando o
+# dashboard.py reinicia.
+#
+# - registrar() só coloca a leitura numa fila; uma thread escritora grava
+#   em lotes, uma transação por lote (fora do caminho da ingestão).
+# - As leituras brutas (a cada 3 s) ficam por uma janela curta e são
+#   consolidadas em dois níveis: 1 minuto e 1 hora, com min/média/max
+#   de cada métrica.
+# - A consolidação é incremental: cada passada lê só as linhas novas
+#   (rowid > marca) e soma nos agregados com UPSERT, então leituras
+#   atrasadas também entram no balde certo.
+# - O rowid das leituras é AUTOINCREMENT: mesmo depois da retenção esvaziar
+#   a tabela ele nunca volta para trás da marca de consolidação.
+# - A limpeza por retenção apaga por "ts < corte" pelo índice (disp, ts),
+#   em pedaços limitados. Leituras fora de ordem (replay, lotes, atrasadas)
+#   não fazem o rowid acompanhar o tempo, então ele não serve de corte.
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger("ecowork.persistencia")
+
+METRICAS = ("temperatura", "umidade", "luminosidade", "distancia")
+
+TIER_BRUTO = "raw"
+TIER_1M = "1m"
+TIER_1H = "1h"
+# tier -> (tabela, tamanho do balde em segundos)
+TIERS_AGREGADOS = {TIER_1M: ("agregados_1m", 60), TIER_1H: ("agregados_1h", 3600)}
+TIERS = (TIER_BRUTO, TIER_1M, TIER_1H)
+
+# Linhas apagadas por transação na limpeza por retenção
+TAMANHO_LIMPEZA = 50000
+
+
+def _sql_tabela_leituras():
+    colunas_brutas = ", ".join(f"{m} REAL" for m in METRICAS)
+    return ("CREATE TABLE IF NOT EXISTS leituras "
+            f"(id INTEGER PRIMARY KEY AUTOINCREMENT, disp INTEGER NOT NULL, ts REAL NOT NULL, {colunas_brutas})")
+
+
+def _sql_esquema():
+    colunas_agregadas = ", ".join(
+        f"{m}_min REAL, {m}_max REAL, {m}_soma REAL, {m}_n INTEGER" for m in METRICAS)
+    sql = [
+        "CREATE TABLE IF NOT EXISTS dispositivos (id INTEGER PRIMARY KEY, nome TEXT NOT NULL UNIQUE)",
+        _sql_tabela_leituras(),
+        "CREATE INDEX IF NOT EXISTS idx_leituras_disp_ts ON leituras (disp, ts)",
+        "CREATE TABLE IF NOT EXISTS marcas (nome TEXT PRIMARY KEY, valor INTEGER NOT NULL)",
+    ]
+    for tabela, _ in TIERS_AGREGADOS.values():
+        sql.append(f"CREATE TABLE IF NOT EXISTS {tabela} "
+                   f"(disp INTEGER NOT NULL, bucket REAL NOT NULL, {colunas_agregadas}, UNIQUE (disp, bucket))")
+    return sql
+
+
+def _sql_consolidar(tabela, balde_s):
+    # Agrega as linhas brutas novas por (dispositivo, balde) e soma no tier
+    selecao = ", ".join(
+        f"MIN({m}), MAX({m}), SUM({m}), COUNT({m})" for m in METRICAS)
+    colunas = ", ".join(f"{m}_min, {m}_max, {m}_soma, {m}_n" for m in METRICAS)
+    atualizacao = ", ".join(
+        f"{m}_min = MIN(COALESCE({m}_min, excluded.{m}_min), COALESCE(excluded.{m}_min, {m}_min)), "
+        f"{m}_max = MAX(COALESCE({m}_max, excluded.{m}_max), COALESCE(excluded.{m}_max, {m}_max)), "
+        f"{m}_soma = COALESCE({m}_soma, 0) + COALESCE(excluded.{m}_soma, 0), "
+        f"{m}_n = {m}_n + excluded.{m}_n"
+        for m in METRICAS)
+    # O WHERE antes do GROUP BY evita a ambiguidade do "ON" no UPSERT com SELECT
+    return (f"INSERT INTO {tabela} (disp, bucket, {colunas}) "
+            f"SELECT disp, CAST(ts / {balde_s} AS INTEGER) * {balde_s} AS b, {selecao} "
+            f"FROM leituras WHERE rowid > ? AND rowid <= ? GROUP BY disp, b "
+            f"ON CONFLICT (disp, bucket) DO UPDATE SET {atualizacao}")
+
+
+class ArmazemTelemetria:
+    def __init__(self, caminho, retencao_bruto_s=24 * 3600, retencao_1m_s=7 * 24 * 3600,
+                 retencao_1h_s=365 * 24 * 3600, tamanho_lote=2000, intervalo_flush_s=1.0,
+                 intervalo_consolidacao_s=60.0, capacidade_fila=200000, relogio=time.time):
+        # relogio: "agora" das retenções (o replay usa o horário da captura)
+        self.caminho = caminho
+        self.relogio = relogio
+        self.retencoes = {TIER_BRUTO: retencao_bruto_s, TIER_1M: retencao_1m_s, TIER_1H: retencao_1h_s}
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_flush_s = intervalo_flush_s
+        self.intervalo_consolidacao_s = intervalo_consolidacao_s
+        self._fila = queue.Queue(maxsize=capacidade_fila)
+        self._ids = {}
+        self._leitura = threading.local()
+        self._thread = None
+        self._rodando = False
+        self._pedido_flush = threading.Event()
+        self._flush_feito = threading.Event()
+        self.gravadas = 0
+        self.descartadas = 0
+        self.lotes = 0
+        self._conn = self._conectar()
+        self._migrar_leituras()
+        with self._conn:
+            for sql in _sql_esquema():
+                self._conn.execute(sql)
+        self._ids = dict((nome, i) for i, nome in self._conn.execute("SELECT id, nome FROM dispositivos"))
+        self._sql_consolidar = {tier: _sql_consolidar(tabela, balde) for tier, (tabela, balde) in TIERS_AGREGADOS.items()}
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL no WAL: durável a cada checkpoint, sem fsync por transação
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _migrar_leituras(self):
+        # Bancos antigos: "leituras" sem AUTOINCREMENT reaproveitava rowids
+        # depois de a retenção esvaziar a tabela, e as leituras novas ficavam
+        # abaixo da marca de consolidação (nunca entravam nos tiers 1m/1h)
+        conn = self._conn
+        linha = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'leituras'").fetchone()
+        if linha is None or "AUTOINCREMENT" in linha[0].upper():
+            return
+        log.info("Migrando a tabela de leituras de %s para rowid AUTOINCREMENT", self.caminho)
+        colunas = ", ".join(("disp", "ts") + METRICAS)
+        conn.execute("BEGIN")
+        conn.execute("DROP INDEX IF EXISTS idx_leituras_disp_ts")
+        conn.execute("ALTER TABLE leituras RENAME TO leituras_antiga")
+        conn.execute(_sql_tabela_leituras())
+        conn.execute(f"INSERT INTO leituras (id, {colunas}) SELECT rowid, {colunas} FROM leituras_antiga")
+        conn.execute("DROP TABLE leituras_antiga")
+        conn.execute("CREATE TABLE IF NOT EXISTS marcas (nome TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+        # Os próximos rowids ficam acima da marca, mesmo se ela já estava além do MAX(rowid)
+        marca = conn.execute("SELECT valor FROM marcas WHERE nome = 'consolidado'").fetchone()
+        if marca is not None and not conn.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'leituras'", (marca[0],)).rowcount:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('leituras', ?)", (marca[0],))
+        conn.execute("COMMIT")
+
+    def _conexao_leitura(self):
+        # Uma conexão por thread leitora; o WAL deixa ler enquanto a escritora grava
+        conn = getattr(self._leitura, "conn", None)
+        if conn is None:
+            conn = self._leitura.conn = sqlite3.connect(self.caminho, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    # ---- Escrita ----
+    def registrar(self, device_id, ts, dados):
+        # Chamado pelos workers da ingestão: não bloqueia nunca
+        linha = (device_id, ts) + tuple(_numero(dados.get(m)) for m in METRICAS)
+        try:
+            self._fila.put_nowait(linha)
+        except queue.Full:
+            self.descartadas += 1
+
+    def iniciar(self):
+        self._rodando = True
+        self._thread = threading.Thread(target=self._escritor, name="ecowork-persistencia", daemon=True)
+        self._thread.start()
+
+    def parar(self, timeout=10.0):
+        self._rodando = False
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def flush(self, timeout=30.0):
+        # Espera a fila atual ser gravada e consolidada (útil em testes/benchmarks)
+        if self._thread is None:
+            self._gravar_pendentes()
+            self.consolidar()
+            return
+        self._flush_feito.clear()
+        self._pedido_flush.set()
+        self._flush_feito.wait(timeout)
+
+    def _escritor(self):
+        proxima_consolidacao = time.monotonic() + self.intervalo_consolidacao_s
+        while self._rodando or not self._fila.empty():
+            lote = self._retirar_lote()
+            if lote:
+                self._gravar(lote)
+            if self._pedido_flush.is_set():
+                self._gravar_pendentes()
+                self.consolidar()
+                self._pedido_flush.clear()
+                self._flush_feito.set()
+            elif time.monotonic() >= proxima_consolidacao:
+                try:
+                    self.consolidar()
+                except sqlite3.Error as e:
+                    log.error("Erro na consolidação: %s", e)
+                proxima_consolidacao = time.monotonic() + self.intervalo_consolidacao_s
+        self.consolidar()
+
+    def _retirar_lote(self):
+        try:
+            lote = [self._fila.get(timeout=self.intervalo_flush_s)]
+        except queue.Empty:
+            return []
+        while len(lote) < self.tamanho_lote:
+            try:
+                lote.append(self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _gravar_pendentes(self):
+        while True:
+            lote = []
+            while len(lote) < self.tamanho_lote:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            if not lote:
+                return
+            self._gravar(lote)
+
+    def _id_dispositivo(self, nome):
+        i = self._ids.get(nome)
+        if i is None:
+            self._conn.execute("INSERT OR IGNORE INTO dispositivos (nome) VALUES (?)", (nome,))
+            i = self._conn.execute("SELECT id FROM dispositivos WHERE nome = ?", (nome,)).fetchone()[0]
+            self._ids[nome] = i
+        return i
+
+    def _gravar(self, lote):
+        conn = self._conn
+        try:
+            conn.execute("BEGIN")
+            linhas = [(self._id_dispositivo(l[0]),) + l[1:] for l in lote]
+            conn.executemany(
+                f"INSERT INTO leituras (disp, ts, {', '.join(METRICAS)}) "
+                f"VALUES (?, ?{', ?' * len(METRICAS)})", linhas)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            log.error("Erro ao gravar lote de %d leituras: %s", len(lote), e)
+            return
+        self.gravadas += len(lote)
+        self.lotes += 1
+
+    # ---- Consolidação e retenção ----
+    def _marca(self, nome):
+        linha = self._conn.execute("SELECT valor FROM marcas WHERE nome = ?", (nome,)).fetchone()
+        return linha[0] if linha else 0
+
+    def consolidar(self, agora=None):
+        # Soma as leituras brutas novas nos tiers 1m/1h e aplica as retenções
+        conn = self._conn
+        agora = self.relogio() if agora is None else agora
+        marca = self._marca("consolidado")
+        ultimo = conn.execute("SELECT MAX(rowid) FROM leituras").fetchone()[0] or 0
+        if ultimo > marca:
+            conn.execute("BEGIN")
+            for sql in self._sql_consolidar.values():
+                conn.execute(sql, (marca, ultimo))
+            conn.execute("INSERT OR REPLACE INTO marcas (nome, valor) VALUES ('consolidado', ?)", (ultimo,))
+            conn.execute("COMMIT")
+        # Só apaga leituras brutas que já foram consolidadas
+        self._apagar_antes("leituras", "ts", agora - self.retencoes[TIER_BRUTO], limite_rowid=ultimo)
+        for tier, (tabela, _) in TIERS_AGREGADOS.items():
+            if self.retencoes[tier] is not None:
+                self._apagar_antes(tabela, "bucket", agora - self.retencoes[tier])
+
+    def _apagar_antes(self, tabela, coluna_ts, corte, limite_rowid=None):
+        # Apaga as linhas com ts < corte pelo índice (disp, ts), um pedaço de
+        # até TAMANHO_LIMPEZA linhas por transação (não segura a escrita por
+        # muito tempo). limite_rowid protege as leituras ainda não consolidadas
+        conn = self._conn
+        filtro = f"disp IN (SELECT id FROM dispositivos) AND {coluna_ts} < ?"
+        parametros = (corte,)
+        if limite_rowid is not None:
+            filtro += " AND rowid <= ?"
+            parametros += (limite_rowid,)
+        sql = (f"DELETE FROM {tabela} WHERE rowid IN "
+               f"(SELECT rowid FROM {tabela} WHERE {filtro} LIMIT {TAMANHO_LIMPEZA})")
+        while conn.execute(sql, parametros).rowcount >= TAMANHO_LIMPEZA:
+            pass
+
+    # ---- Leitura ----
+    def consultar(self, device_id, metrica, de, ate, tier=TIER_BRUTO):
+        # Retorna colunas: {"ts", "valores"} (+ "min"/"max" nos tiers agregados;
+        # "valores" é a média do balde)
+        if metrica not in METRICAS:
+            raise KeyError(metrica)
+        if tier not in TIERS:
+            raise ValueError(f"tier inválido: {tier!r} (use um de {TIERS})")
+        conn = self._conexao_leitura()
+        linha = conn.execute("SELECT id FROM dispositivos WHERE nome = ?", (device_id,)).fetchone()
+        if linha is None:
+            return {"ts": [], "valores": []} if tier == TIER_BRUTO else {"ts": [], "valores": [], "min": [], "max": []}
+        disp = linha[0]
+        if tier == TIER_BRUTO:
+            linhas = conn.execute(
+                f"SELECT ts, {metrica} FROM leituras WHERE disp = ? AND ts >= ? AND ts <= ? "
+                f"AND {metrica} IS NOT NULL ORDER BY ts", (disp, de, ate)).fetchall()
+            return {"ts": [l[0] for l in linhas], "valores": [l[1] for l in linhas]}
+        tabela, _ = TIERS_AGREGADOS[tier]
+        linhas = conn.execute(
+            f"SELECT bucket, {metrica}_min, {metrica}_soma * 1.0 / {metrica}_n, {metrica}_max FROM {tabela} "
+            f"WHERE disp = ? AND bucket >= ? AND bucket <= ? AND {metrica}_n > 0 ORDER BY bucket",
+            (disp, de, ate)).fetchall()
+        return {
+            "ts": [l[0] for l in linhas],
+            "valores": [l[2] for l in linhas],
+            "min": [l[1] for l in linhas],
+            "max": [l[3] for l in linhas],
+        }
+
+    def exportar(self, dispositivos=None, de=0.0, ate=float("inf"), tier=TIER_BRUTO, tamanho_bloco=5000):
+        # Gera blocos de até tamanho_bloco linhas (colunas_exportacao(tier)),
+        # dispositivo a dispositivo e em ordem de tempo, seguindo o índice
+        # (disp, ts). Cada bloco é uma consulta curta que continua de onde a
+        # anterior parou (ts, rowid): a memória fica limitada a um bloco e a
+        # leitura não prende um snapshot do WAL durante a exportação inteira.
+        if tier not in TIERS:
+            raise ValueError(f"tier inválido: {tier!r} (use um de {TIERS})")
+        conn = self._conexao_leitura()
+        if dispositivos is None:
+            alvos = conn.execute("SELECT id, nome FROM dispositivos ORDER BY nome").fetchall()
+        else:
+            alvos = []
+            for nome in sorted(set(dispositivos)):
+                linha = conn.execute("SELECT id FROM dispositivos WHERE nome = ?", (nome,)).fetchone()
+                if linha is not None:
+                    alvos.append((linha[0], nome))
+
+        if tier == TIER_BRUTO:
+            sql = (f"SELECT ts, rowid, {', '.join(METRICAS)} FROM leituras "
+                   f"WHERE disp = ? AND (ts, rowid) > (?, ?) AND ts <= ? ORDER BY ts, rowid LIMIT ?")
+        else:
+            tabela, _ = TIERS_AGREGADOS[tier]
+            selecao = ", ".join(f"{m}_min, {m}_soma * 1.0 / {m}_n, {m}_max" for m in METRICAS)
+            # bucket é único por dispositivo: o rowid só completa a chave de continuação
+            sql = (f"SELECT bucket, rowid, {selecao} FROM {tabela} "
+                   f"WHERE disp = ? AND (bucket, rowid) > (?, ?) AND bucket <= ? ORDER BY bucket, rowid LIMIT ?")
+        for disp, nome in alvos:
+            ultimo_ts, ultimo_rowid = de, -1
+            while True:
+                linhas = conn.execute(sql, (disp, ultimo_ts, ultimo_rowid, ate, tamanho_bloco)).fetchall()
+                if not linhas:
+                    break
+                ultimo_ts, ultimo_rowid = linhas[-1][0], linhas[-1][1]
+                yield [(nome, l[0]) + l[2:] for l in linhas]
+                if len(linhas) < tamanho_bloco:
+                    break
+
+    def metricas(self):
+        return {
+            "fila": self._fila.qsize(),
+            "gravadas": self.gravadas,
+            "descartadas": self.descartadas,
+            "lotes": self.lotes,
+        }
+
+
+def colunas_exportacao(tier):
+    # Cabeçalho das linhas do exportar(): leituras brutas ou min/média/max do balde
+    if tier == TIER_BRUTO:
+        return ("dispositivo", "ts") + METRICAS
+    return ("dispositivo", "ts") + tuple(f"{m}_{c}" for m in METRICAS for c in ("min", "media", "max"))
+
+
+def _numero(v):
+    if v is None or isinstance(v, bool):
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
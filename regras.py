@@ -0,0 +1,292 @@
+# =================================================================
+# ==== MOTOR DE REGRAS DE ALERTA ECOWORK ====
+# =================================================================
+# Alertas definidos no servidor, sem regravar o firmware. Cada regra
+# compara uma métrica da telemetria com um limite:
+#
+#   {"nome": "calor", "metrica": "temperatura", "operador": ">",
+#    "limite": 28, "histerese": 1.0, "duracao_s": 60,
+#    "mensagem": "Temperatura alta: {valor:.1f} °C"}
+#
+# - duracao_s: a condição precisa valer por esse tempo antes de disparar
+#   (um pico isolado não vira alerta)
+# - histerese: depois de disparar, só normaliza quando o valor volta
+#   além de limite -/+ histerese (um sensor oscilando em volta do limite
+#   não liga e desliga o alerta a cada leitura)
+# - intervalo_min_s: entre dois avisos da mesma regra no mesmo
+#   dispositivo; disparos dentro do intervalo ficam silenciosos
+# - sobrescritas por dispositivo: {"<device_id>": {"calor": {"limite": 30}}}
+#
+# As regras são compiladas uma vez e avaliadas sobre cada lote da
+# ingestão. A compilação agrupa por métrica e ordena pelo limite, então
+# uma leitura acha por busca binária (bisect) as regras cuja condição
+# vale, sem testar uma a uma as que não valem. Dispositivos com
+# sobrescritas usam o índice comum sem as regras sobrescritas, mais um
+# índice pequeno só com elas (campos já mesclados).
+# Só as transições geram eventos ("disparou"/"normalizou"), e um balde
+# de fichas global limita quantos avisos saem por segundo (tempestade de
+# alertas); o excedente só é contado.
+#
+# O estado de cada (dispositivo, regra) só existe enquanto a condição
+# está valendo ou o alerta está ativo: milhares de regras x milhares de
+# dispositivos não viram milhões de entradas.
+
+import json
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+OPERADORES = (">", "<")
+
+EVENTO_DISPAROU = "disparou"
+EVENTO_NORMALIZOU = "normalizou"
+
+_PENDENTE = 1
+_ATIVO = 2
+
+_NUMERICOS = (int, float)
+
+_CAMPOS_PADRAO = {
+    "histerese": 0.0,
+    "duracao_s": 0.0,
+    "intervalo_min_s": 60.0,
+    "mensagem": "{regra}: {metrica} = {valor}",
+    "severidade": "aviso",
+}
+
+
+class RegraInvalida(ValueError):
+    pass
+
+
+class _RegraCompilada:
+    __slots__ = ("indice", "nome", "metrica", "maior", "limite", "liberacao", "duracao_s",
+                 "intervalo_min_s", "mensagem", "severidade")
+
+    def __init__(self, indice, definicao):
+        faltando = {"nome", "metrica", "operador", "limite"} - definicao.keys()
+        if faltando:
+            raise RegraInvalida(f"regra sem {sorted(faltando)}: {definicao!r}")
+        d = {**_CAMPOS_PADRAO, **definicao}
+        if d["operador"] not in OPERADORES:
+            raise RegraInvalida(f"regra {d['nome']!r}: operador deve ser um de {OPERADORES}")
+        self.indice = indice
+        self.nome = d["nome"]
+        self.metrica = d["metrica"]
+        self.maior = d["operador"] == ">"
+        self.limite = float(d["limite"])
+        histerese = abs(float(d["histerese"]))
+        self.liberacao = self.limite - histerese if self.maior else self.limite + histerese
+        self.duracao_s = float(d["duracao_s"])
+        self.intervalo_min_s = float(d["intervalo_min_s"])
+        self.mensagem = d["mensagem"]
+        self.severidade = d["severidade"]
+        try:
+            self.formatar("", 0.0)
+        except (KeyError, IndexError, ValueError) as e:
+            raise RegraInvalida(f"regra {self.nome!r}: mensagem inválida ({e})") from None
+
+    def formatar(self, device_id, valor):
+        return self.mensagem.format(regra=self.nome, metrica=self.metrica, valor=valor,
+                                    limite=self.limite, dispositivo=device_id)
+
+
+class _EstadoRegra:
+    __slots__ = ("fase", "desde", "avisado")
+
+    def __init__(self, desde):
+        self.fase = _PENDENTE
+        self.desde = desde
+        self.avisado = False
+
+
+class MotorRegras:
+    def __init__(self, regras=(), sobrescritas=None, max_avisos_por_s=20.0, rajada_avisos=100):
+        # max_avisos_por_s / rajada_avisos: balde de fichas global de avisos
+        self.max_avisos_por_s = max_avisos_por_s
+        self.rajada_avisos = rajada_avisos
+        self._fichas = float(rajada_avisos)
+        self._fichas_ts = None
+        self._lock = threading.Lock()
+        self._estados = {}       # device_id -> {indice: _EstadoRegra}
+        self._ultimo_aviso = {}  # (device_id, indice) -> ts (sobrevive à normalização)
+        # Contadores: cada worker soma no próprio lote e junta aqui com o _lock
+        self.avaliacoes = 0      # comparações com limites de fato feitas
+        self.disparos = 0
+        self.normalizacoes = 0
+        self.silenciados = 0     # dentro do intervalo_min_s da regra
+        self.suprimidos = 0      # acima do limite global (tempestade)
+        self.compilar(regras, sobrescritas)
+
+    @classmethod
+    def de_arquivo(cls, caminho, **kwargs):
+        # JSON: {"regras": [...], "sobrescritas": {"<device_id>": {"<regra>": {...}}}}
+        with open(caminho, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config.get("regras", ()), config.get("sobrescritas"), **kwargs)
+
+    def compilar(self, regras, sobrescritas=None):
+        definicoes = [dict(r) for r in regras]
+        compiladas = [_RegraCompilada(i, d) for i, d in enumerate(definicoes)]
+        por_nome = {r.nome: r for r in compiladas}
+        if len(por_nome) != len(compiladas):
+            raise RegraInvalida("nomes de regra repetidos")
+
+        # device_id -> {índice: regra com os campos sobrescritos}
+        regras_dispositivo = {}
+        for device_id, ajustes in (sobrescritas or {}).items():
+            proprias = regras_dispositivo[device_id] = {}
+            for nome, campos in ajustes.items():
+                base = por_nome.get(nome)
+                if base is None:
+                    raise RegraInvalida(f"sobrescrita de {device_id} para regra inexistente: {nome!r}")
+                if "metrica" in campos:
+                    raise RegraInvalida(f"sobrescrita de {device_id} não pode trocar a métrica de {nome!r}")
+                proprias[base.indice] = _RegraCompilada(base.indice, {**definicoes[base.indice], **campos})
+
+        with self._lock:
+            self.definicoes = definicoes
+            self.sobrescritas = sobrescritas or {}
+            self._regras = compiladas
+            self._indice = self._indexar(compiladas)
+            self._regras_dispositivo = regras_dispositivo
+            # device_id -> (índices sobrescritos, índice só com as regras sobrescritas)
+            self._indice_dispositivo = {}
+            for device_id, proprias in regras_dispositivo.items():
+                self._indice_dispositivo[device_id] = (frozenset(proprias), self._indexar(proprias.values()))
+            # Estados de regras que mudaram de sentido/limite não valem mais
+            self._estados = {}
+            self._ultimo_aviso = {}
+
+    @staticmethod
+    def _indexar(regras):
+        # ((métrica, limites ">", regras ">", limites "<", regras "<"), ...),
+        # cada lado em ordem crescente de limite
+        por_metrica = {}
+        for r in regras:
+            por_metrica.setdefault(r.metrica, ([], []))[0 if r.maior else 1].append(r)
+        indice = []
+        for metrica, (maiores, menores) in por_metrica.items():
+            maiores.sort(key=lambda r: r.limite)
+            menores.sort(key=lambda r: r.limite)
+            indice.append((metrica, [r.limite for r in maiores], maiores,
+                           [r.limite for r in menores], menores))
+        return tuple(indice)
+
+    # ---- Avaliação (workers da ingestão) ----
+    def avaliar_lote(self, leituras):
+        # leituras: [(device_id, ts, dados)] na ordem de chegada.
+        # Retorna os eventos a avisar: [(device_id, ts, tipo, regra, valor, mensagem)]
+        eventos = []
+        estados = self._estados
+        indice_base, regras_base = self._indice, self._regras
+        indice_dispositivo, regras_dispositivo = self._indice_dispositivo, self._regras_dispositivo
+        # avaliacoes: comparações feitas (regras com estado + passos das buscas binárias)
+        avaliacoes = 0
+        contagem = {"disparos": 0, "normalizacoes": 0, "silenciados": 0, "suprimidos": 0}
+        for device_id, ts, dados in leituras:
+            proprio = indice_dispositivo.get(device_id)
+            camadas = (((indice_base, None),) if proprio is None
+                       else ((indice_base, proprio[0]), (proprio[1], None)))
+            proprias = regras_dispositivo.get(device_id)
+            estados_disp = estados.get(device_id)
+
+            # 1. Regras com estado (condição valendo ou alerta ativo)
+            if estados_disp:
+                for i, estado in list(estados_disp.items()):
+                    regra = regras_base[i] if proprias is None else proprias.get(i, regras_base[i])
+                    valor = dados.get(regra.metrica)
+                    if valor is None or valor.__class__ not in _NUMERICOS:
+                        continue
+                    avaliacoes += 1
+                    if estado.fase == _PENDENTE:
+                        if not (valor > regra.limite if regra.maior else valor < regra.limite):
+                            del estados_disp[i]
+                        elif ts - estado.desde >= regra.duracao_s:
+                            estado.fase = _ATIVO
+                            self._disparar(regra, estado, device_id, ts, valor, eventos, contagem)
+                    elif (valor <= regra.liberacao if regra.maior else valor >= regra.liberacao):
+                        del estados_disp[i]
+                        contagem["normalizacoes"] += 1
+                        if estado.avisado:
+                            eventos.append((device_id, ts, EVENTO_NORMALIZOU, regra.nome, valor,
+                                            f"{regra.nome}: normalizado"))
+
+            # 2. Regras cuja condição passou a valer agora (busca binária no limite)
+            for indice, trocadas in camadas:
+                for metrica, limites_maior, maiores, limites_menor, menores in indice:
+                    valor = dados.get(metrica)
+                    if valor is None or valor.__class__ not in _NUMERICOS:
+                        continue
+                    # bisect faz no máximo bit_length(n) comparações em n limites
+                    avaliacoes += len(limites_maior).bit_length() + len(limites_menor).bit_length()
+                    # "> limite" vale para os limites abaixo do valor; "< limite", acima
+                    verdadeiras = maiores[:bisect_left(limites_maior, valor)]
+                    verdadeiras += menores[bisect_right(limites_menor, valor):]
+                    for regra in verdadeiras:
+                        if trocadas is not None and regra.indice in trocadas:
+                            continue
+                        if estados_disp is None:
+                            estados_disp = estados.setdefault(device_id, {})
+                        elif regra.indice in estados_disp:
+                            continue
+                        estado = estados_disp[regra.indice] = _EstadoRegra(ts)
+                        if regra.duracao_s <= 0:
+                            estado.fase = _ATIVO
+                            self._disparar(regra, estado, device_id, ts, valor, eventos, contagem)
+        with self._lock:
+            self.avaliacoes += avaliacoes
+            self.disparos += contagem["disparos"]
+            self.normalizacoes += contagem["normalizacoes"]
+            self.silenciados += contagem["silenciados"]
+            self.suprimidos += contagem["suprimidos"]
+        return eventos
+
+    def _disparar(self, regra, estado, device_id, ts, valor, eventos, contagem):
+        contagem["disparos"] += 1
+        chave = (device_id, regra.indice)
+        ultimo = self._ultimo_aviso.get(chave)
+        if ultimo is not None and ts - ultimo < regra.intervalo_min_s:
+            contagem["silenciados"] += 1
+            return
+        if not self._pegar_ficha(ts):
+            contagem["suprimidos"] += 1
+            return
+        self._ultimo_aviso[chave] = ts
+        estado.avisado = True
+        eventos.append((device_id, ts, EVENTO_DISPAROU, regra.nome, valor, regra.formatar(device_id, valor)))
+
+    def _pegar_ficha(self, ts):
+        with self._lock:
+            if self._fichas_ts is not None:
+                # Leitura mais velha que a última (lote, atraso, fora de ordem):
+                # não repõe fichas, mas também não tira
+                self._fichas = min(self.rajada_avisos,
+                                   self._fichas + max(0.0, ts - self._fichas_ts) * self.max_avisos_por_s)
+            self._fichas_ts = ts if self._fichas_ts is None else max(ts, self._fichas_ts)
+            if self._fichas < 1:
+                return False
+            self._fichas -= 1
+            return True
+
+    # ---- Consultas ----
+    def ativos(self, agora=None):
+        agora = time.time() if agora is None else agora
+        resultado = []
+        for device_id, estados_disp in list(self._estados.items()):
+            for indice, estado in list(estados_disp.items()):
+                if estado.fase == _ATIVO:
+                    resultado.append({"dispositivo": device_id, "regra": self._regras[indice].nome,
+                                      "desde_s": round(agora - estado.desde, 1)})
+        return resultado
+
+    def metricas(self):
+        return {
+            "regras": len(self.definicoes),
+            "dispositivos_com_sobrescrita": len(self._regras_dispositivo),
+            "avaliacoes": self.avaliacoes,
+            "disparos": self.disparos,
+            "normalizacoes": self.normalizacoes,
+            "silenciados": self.silenciados,
+            "suprimidos": self.suprimidos,
+        }
@@ -0,0 +1,188 @@
+# =================================================================
+# ==== SERVIDOR ASYNCIO ECOWORK (ECOWORK_MODO=asyncio) ====
+# =================================================================
+# Modo de produção para dezenas de milhares de navegadores conectados:
+#
+# - O Socket.IO roda no python-socketio AsyncServer (ASGI) em vez de uma
+#   thread por conexão do Werkzeug: cada websocket custa só uma corrotina.
+# - As rotas HTTP do Flask (página, assets, /api/...) continuam as mesmas,
+#   montadas atrás do ASGI com WsgiToAsgi.
+# - O cliente MQTT não tem thread própria: o socket do paho é registrado no
+#   event loop (add_reader/add_writer) e o loop_misc roda a cada segundo.
+# - O broadcast em lotes (broadcast.py) roda como uma task do loop.
+#
+# O pipeline de ingestão e a persistência continuam em threads, iguais ao
+# modo threading. Toda a lógica (estado, histórico, snapshot, salas) vem do
+# dashboard.py; aqui ficam só os handlers assíncronos e o servidor.
+#
+#   pip install uvicorn asgiref
+#   ECOWORK_MODO=asyncio python dashboard.py
+
+import asyncio
+import logging
+import random
+import socket
+
+import paho.mqtt.client as mqtt
+import socketio
+import uvicorn
+from asgiref.wsgi import WsgiToAsgi
+
+import dashboard
+from barramento import GerenciadorBarramentoAsync, ESQUEMA as ESQUEMA_BARRAMENTO
+
+log = logging.getLogger("ecowork.asgi")
+
+
+def gerenciador_fila(url):
+    # ECOWORK_FILA_MENSAGENS no modo asyncio (multiprocesso.py --modo asyncio):
+    # o equivalente assíncrono de cada fila aceita no modo threading
+    if url is None:
+        return {}
+    if url.startswith(ESQUEMA_BARRAMENTO + "://"):
+        return {"client_manager": GerenciadorBarramentoAsync(url)}
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return {"client_manager": socketio.AsyncRedisManager(url)}
+    if url.startswith(("amqp://", "amqps://")):
+        return {"client_manager": socketio.AsyncAioPikaManager(url)}
+    raise ValueError(f"fila {url!r} não suportada no modo asyncio (use barramento://, redis:// ou amqp://)")
+
+
+sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*",
+                           **gerenciador_fila(dashboard.FILA_MENSAGENS))
+asgi_app = socketio.ASGIApp(sio, other_asgi_app=WsgiToAsgi(dashboard.app))
+
+
+def sala_tem_ouvintes(sala):
+    # Com a fila compartilhada, os ouvintes podem estar em outro processo
+    if dashboard.FILA_MENSAGENS is not None:
+        return True
+    return bool(sio.manager.rooms.get("/", {}).get(sala))
+
+
+# =================================================================
+# ==== Eventos Socket.IO (mesmas regras do modo threading) ====
+# =================================================================
+async def aplicar_inscricao(sid, dados):
+    salas, erro = dashboard.validar_inscricao(dados)
+    if erro:
+        return {"erro": erro}
+    for sala in sio.rooms(sid):
+        if sala != sid and sala not in salas:
+            await sio.leave_room(sid, sala)
+    for sala in salas:
+        await sio.enter_room(sid, sala)
+    if dashboard.PARTICAO_TOTAL > 1:
+        # O snapshot consulta as outras partições por HTTP: fora do loop
+        snapshot = await asyncio.to_thread(dashboard.montar_snapshot, dados)
+    else:
+        snapshot = dashboard.montar_snapshot(dados)
+    await sio.emit("snapshot", snapshot, to=sid)
+    return {"salas": sorted(salas)}
+
+
+@sio.on("connect")
+async def ao_conectar(sid, environ, auth=None):
+    await aplicar_inscricao(sid, auth if isinstance(auth, dict) else {})
+
+
+@sio.on("inscrever")
+async def ao_inscrever(sid, dados):
+    return await aplicar_inscricao(sid, dados)
+
+
+@sio.on("metrica_cliente")
+async def ao_receber_metrica_cliente(sid, dados):
+    if isinstance(dados, dict) and isinstance(dados.get("primeira_pintura_ms"), (int, float)):
+        dashboard.metricas_snapshot.registrar_primeira_pintura(dados["primeira_pintura_ms"])
+
+
+# =================================================================
+# ==== MQTT no event loop ====
+# =================================================================
+class MqttNoLoop:
+    # Liga o socket do paho ao event loop: leitura quando chegam dados,
+    # escrita só enquanto o paho tiver algo para enviar
+    def __init__(self, client, loop):
+        self.client = client
+        self.loop = loop
+        client.on_socket_open = self._ao_abrir
+        client.on_socket_close = self._ao_fechar
+        client.on_socket_register_write = self._registrar_escrita
+        client.on_socket_unregister_write = self._cancelar_escrita
+
+    def _no_loop(self, funcao, *args):
+        # O connect roda num executor (DNS/TCP bloqueiam); os callbacks
+        # disparados lá são repassados para a thread do loop
+        try:
+            rodando = asyncio.get_running_loop()
+        except RuntimeError:
+            rodando = None
+        if rodando is self.loop:
+            funcao(*args)
+        else:
+            self.loop.call_soon_threadsafe(funcao, *args)
+
+    def _ao_abrir(self, client, userdata, sock):
+        self._no_loop(self.loop.add_reader, sock, client.loop_read)
+
+    def _ao_fechar(self, client, userdata, sock):
+        self._no_loop(self.loop.remove_reader, sock)
+        self._no_loop(self.loop.remove_writer, sock)
+
+    def _registrar_escrita(self, client, userdata, sock):
+        self._no_loop(self.loop.add_writer, sock, client.loop_write)
+
+    def _cancelar_escrita(self, client, userdata, sock):
+        self._no_loop(self.loop.remove_writer, sock)
+
+    async def manter_conexao(self, host, porta, keepalive):
+        # Espera exponencial entre tentativas (com jitter, para uma frota de
+        # servidores não voltar toda no mesmo segundo); zera ao conectar
+        espera = dashboard.MQTT_RECONEXAO_MIN_S
+        while True:
+            try:
+                # DNS + TCP no executor: o loop segue servindo HTTP e Socket.IO
+                await self.loop.run_in_executor(None, self.client.connect, host, porta, keepalive)
+            except (OSError, socket.error) as e:
+                dashboard.log_mqtt.warning("Erro ao conectar em %s:%s: %s (nova tentativa em %.0f s)",
+                                           host, porta, e, espera)
+                await asyncio.sleep(espera * random.uniform(0.8, 1.2))
+                espera = min(espera * 2, dashboard.MQTT_RECONEXAO_MAX_S)
+                continue
+            espera = dashboard.MQTT_RECONEXAO_MIN_S
+            # Keepalive/ping e timeouts; retorna erro quando a conexão cai
+            while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                await asyncio.sleep(1)
+            dashboard.log_mqtt.warning("Conexão perdida, reconectando...")
+            await asyncio.sleep(espera)
+
+
+# =================================================================
+# ==== Inicialização ====
+# =================================================================
+async def servir(host, porta, conectar_mqtt=True):
+    loop = asyncio.get_running_loop()
+    dashboard.iniciar_servicos()
+    dashboard.broadcast.sala_ativa = sala_tem_ouvintes
+    dashboard.medidor_clientes.funcao = lambda: dashboard.contar_clientes(sio.manager)
+    tarefas = [asyncio.create_task(dashboard.broadcast.loop_async(
+        lambda evento, dados, sala: sio.emit(evento, dados, to=sala)))]
+    if conectar_mqtt:
+        mqtt_loop = MqttNoLoop(dashboard.client, loop)
+        tarefas.append(asyncio.create_task(mqtt_loop.manter_conexao(
+            dashboard.MQTT_BROKER, dashboard.MQTT_PORT, dashboard.MQTT_KEEPALIVE)))
+    config = uvicorn.Config(asgi_app, host=host, port=porta, loop="none",
+                            lifespan="off", log_level="warning")
+    try:
+        await uvicorn.Server(config).serve()
+    finally:
+        dashboard.broadcast.parar()
+        for tarefa in tarefas:
+            tarefa.cancel()
+        dashboard.parar_servicos()
+
+
+def rodar(host, porta, conectar_mqtt=True):
+    log.info("Iniciando servidor asyncio em http://%s:%s", host, porta)
+    asyncio.run(servir(host, porta, conectar_mqtt))